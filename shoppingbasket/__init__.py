@@ -1,5 +1,51 @@
-from shoppingbasket import promotions
-from shoppingbasket.basket import Basket
-from shoppingbasket.invoice import Invoice
-from shoppingbasket.basket_item import BasketItem, Discount
-from shoppingbasket.product_db import ProductDB
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from shoppingbasket import promotions
+    from shoppingbasket.basket import Basket
+    from shoppingbasket.invoice import Invoice
+    from shoppingbasket.basket_item import BasketItem, Discount
+    from shoppingbasket.columnar_items import ColumnarBasketItems
+    from shoppingbasket.product_db import ProductBackend, ProductDB
+    from shoppingbasket.product_snapshot import ProductSnapshot
+    from shoppingbasket.promotion_engine import PromotionEngine
+    from shoppingbasket.promotion_solver import OptimalPromotionEngine
+
+# The submodule each name is imported from. Importing the package doesn't
+# import any of them (or their dependencies) until a name is first used, so
+# short-lived processes only pay for what they use.
+_EXPORTS = {
+    'promotions': None,
+    'Basket': 'basket',
+    'Invoice': 'invoice',
+    'BasketItem': 'basket_item',
+    'Discount': 'basket_item',
+    'ColumnarBasketItems': 'columnar_items',
+    'ProductBackend': 'product_db',
+    'ProductDB': 'product_db',
+    'ProductSnapshot': 'product_snapshot',
+    'PromotionEngine': 'promotion_engine',
+    'OptimalPromotionEngine': 'promotion_solver',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute "
+                             f"{name!r}")
+    module_name = _EXPORTS[name]
+    if module_name is None:
+        # A submodule
+        value = importlib.import_module(f'{__name__}.{name}')
+    else:
+        module = importlib.import_module(f'{__name__}.{module_name}')
+        value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | _EXPORTS.keys())
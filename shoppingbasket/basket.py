@@ -1,10 +1,33 @@
+import dataclasses
+import time
 import warnings
-from typing import Optional
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional, Union
 
+from shoppingbasket import instrumentation
 from shoppingbasket.invoice import Invoice
 from shoppingbasket.basket_item import BasketItem
-from shoppingbasket.product_db import ProductDB
+from shoppingbasket.basket_log import (ADD, CLOSE, SCAN, SET_QUANTITY, VOID,
+                                       BasketEvent, BasketLog)
+from shoppingbasket.product_db import Product, ProductBackend
+from shoppingbasket.promotion_engine import PromotionEngine
 from shoppingbasket.promotions import Promotion
+from shoppingbasket.running_total import RunningTotal
+
+
+@dataclass
+class ScanResult:
+    """The result of adding many items to a basket by barcode.
+
+    Attributes:
+        num_added: The number of items added to the basket.
+        missing_barcodes: The barcodes that were not found in the product
+            database (each listed once, in the order first scanned).
+    """
+
+    num_added: int = 0
+    missing_barcodes: list[int] = field(default_factory=list)
 
 
 class Basket:
@@ -12,20 +35,79 @@ class Basket:
 
     Items can either be added to the basket manually (by creating a new item),
     or by scanning a barcode that is looked up in the product database.
+
+    In incremental mode, the basket keeps a running total (including the
+    discounts from its promotions) up to date as items are added and removed,
+    so the total can be displayed after every scan without generating a new
+    invoice.
+
+    In aggregate mode, repeated items (with the same barcode, name and price,
+    and no units) are combined into a single line with a larger quantity, so
+    the size of the basket (and the cost of applying promotions) depends on
+    the number of distinct products rather than the number of items scanned.
+
+    With a log, every change to the basket is recorded in a BasketLog, so the
+    basket can be restored if the till process dies (see BasketLog.restore).
     """
 
     def __init__(self,
-                 products: Optional[ProductDB] = None,
-                 basket_items: list[BasketItem] = None) -> None:
+                 products: Optional[ProductBackend] = None,
+                 basket_items: list[BasketItem] = None,
+                 promotions: Optional[Union[list[Promotion],
+                                            PromotionEngine]] = None,
+                 incremental: bool = False,
+                 aggregate: bool = False,
+                 log: Optional[BasketLog] = None) -> None:
         """Initialise a basket.
 
         Args:
-            products: A database of products, keyed by barcode.
+            products: A database of products, keyed by barcode (a ProductDB or
+                any other ProductBackend).
             basket_items: A list of items in the basket.
+            promotions: The promotions to apply to the basket, either as a
+                list or as a PromotionEngine. A list is indexed into an engine
+                once, here, and the engine is used for every invoice (and the
+                running total). Defaults to None.
+            incremental: Whether to keep a running total of the basket.
+                Defaults to False.
+            aggregate: Whether to combine repeated items into a single line.
+                Defaults to False.
+            log: A log to record changes to the basket in. Defaults to None.
         """
 
+        if promotions is not None and not isinstance(promotions,
+                                                     PromotionEngine):
+            promotions = PromotionEngine(promotions)
+
         self.products = products
-        self.basket_items = [] if basket_items is None else basket_items
+        self.promotions = promotions
+        self.aggregate = aggregate
+        self.log = log
+
+        self.running_total = None
+        if incremental:
+            self.running_total = RunningTotal(promotions)
+
+        # The lines are stored in the container given (e.g. a
+        # ColumnarBasketItems)
+        self._basket_items = [] if basket_items is None else basket_items
+        self._reset()
+
+    @property
+    def basket_items(self) -> list[BasketItem]:
+        """The items in the basket, in the order they were added.
+
+        The list is kept up to date by the basket, so shouldn't be modified
+        directly. A new list can be assigned instead, which resets the
+        basket's indexes and running total.
+        """
+
+        return self._basket_items
+
+    @basket_items.setter
+    def basket_items(self, basket_items: list[BasketItem]) -> None:
+        self._basket_items = basket_items
+        self._reset()
 
     def add_item(
             self,
@@ -56,7 +138,77 @@ class Basket:
                                  units=units,
                                  quantity=quantity,
                                  **kwargs)
-        self.basket_items.append(basket_item)
+        self._add_basket_item(basket_item)
+        self._log_event(BasketEvent(ADD, basket_item))
+
+    def remove_item(self, basket_item: BasketItem) -> None:
+        """Remove an item from the basket.
+
+        If more than one line of the basket is equal to the item, the most
+        recently added is removed. The line is found with an index, so this
+        takes the same time for any size of basket.
+
+        Args:
+            basket_item: The item to remove.
+
+        Raises:
+            ValueError: If the item is not in the basket.
+        """
+
+        self._remove_line(self._find_line(basket_item))
+        self._log_event(BasketEvent(VOID, basket_item))
+
+    def update_quantity(self,
+                        basket_item: BasketItem,
+                        quantity: float) -> Optional[BasketItem]:
+        """Change the quantity of an item in the basket.
+
+        As with remove_item, the most recently added line equal to the item is
+        changed.
+
+        Args:
+            basket_item: The item to change.
+            quantity: The new quantity. The item is removed if this is 0 (or
+                less).
+
+        Returns:
+            The item with its new quantity (None if it was removed).
+
+        Raises:
+            ValueError: If the item is not in the basket.
+        """
+
+        if quantity <= 0:
+            self.remove_item(basket_item)
+            return None
+        new_item = self._set_line_quantity(self._find_line(basket_item),
+                                           quantity)
+        self._log_event(BasketEvent(SET_QUANTITY, basket_item,
+                                    quantity=quantity))
+        return new_item
+
+    def void(self, barcode: int) -> None:
+        """Void one of the most recently added item with a barcode.
+
+        This is what happens when an item is scanned to take it off the bill:
+        a line of several units (e.g. an aggregated line) has its quantity
+        reduced by one, and any other line is removed.
+
+        Args:
+            barcode: The barcode of the item to void.
+
+        Raises:
+            KeyError: If there is no item with the barcode in the basket.
+        """
+
+        line = self._get_last_lines().get(barcode)
+        if line is None:
+            raise KeyError(barcode)
+        basket_item = self._basket_items[self._get_position(line)]
+        if basket_item.unit_count > 1:
+            self.update_quantity(basket_item, basket_item.quantity - 1)
+        else:
+            self.remove_item(basket_item)
 
     def add_item_from_barcode(self,
                               barcode: int,
@@ -74,17 +226,413 @@ class Basket:
         if self.products is None:
             raise ValueError("Cannot add from barcode without products.")
 
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            start = time.perf_counter()
         try:
-            product = self.products[barcode]
-            self.add_item(**product, quantity=quantity)
+            product = self.products.get_product(barcode)
         except KeyError:
+            if recorder is not None:
+                instrumentation.record_lookup(recorder, start, 1, 1)
             # Could raise an error, but this allows continuing
             warnings.warn(f"Barcode {barcode} not found in product database. "
                           "Item not added to basket.")
+            return
+        if recorder is not None:
+            instrumentation.record_lookup(recorder, start, 1, 0)
+        self._add_scanned_item(product.to_basket_item(quantity))
+
+    async def scan(self, barcode: int, quantity: float = 1.0) -> None:
+        """Add an item to the basket using barcode, awaiting the lookup.
+
+        This is the same as add_item_from_barcode, but the product is looked
+        up with the (async) aget method of the product database, so a slow
+        backend doesn't block the event loop.
+
+        Args:
+            barcode: The barcode of the item to add.
+            quantity: The amount of the item to add. Defaults to 1.0.
+
+        Raises:
+            ValueError: If product_db is None.
+        """
+
+        if self.products is None:
+            raise ValueError("Cannot add from barcode without products.")
+
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            start = time.perf_counter()
+        try:
+            product = await self.products.aget(barcode)
+        except KeyError:
+            if recorder is not None:
+                instrumentation.record_lookup(recorder, start, 1, 1)
+            warnings.warn(f"Barcode {barcode} not found in product database. "
+                          "Item not added to basket.")
+            return
+        if recorder is not None:
+            instrumentation.record_lookup(recorder, start, 1, 0)
+        self._add_scanned_item(product.to_basket_item(quantity))
+
+    async def scan_many(
+            self,
+            scans: Iterable[tuple[int, float]]
+    ) -> ScanResult:
+        """Add many items to the basket using barcodes, awaiting the lookup.
+
+        This is the same as add_items_from_barcodes, but the products are
+        looked up with the (async) aget_many method of the product database.
+
+        Args:
+            scans: Pairs of barcode and quantity for each item to add.
+
+        Returns:
+            The number of items added, and the barcodes that were not found.
+
+        Raises:
+            ValueError: If product_db is None.
+        """
+
+        if self.products is None:
+            raise ValueError("Cannot add from barcode without products.")
+
+        scans = list(scans)
+        barcodes = {barcode for barcode, _ in scans}
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            start = time.perf_counter()
+        products = await self.products.aget_many(barcodes)
+        if recorder is not None:
+            instrumentation.record_lookup(recorder, start, len(scans),
+                                          len(barcodes) - len(products))
+        return self._add_scanned_items(scans, products)
+
+    def add_items_from_barcodes(
+            self,
+            scans: Iterable[tuple[int, float]]
+    ) -> ScanResult:
+        """Add many items to the basket using barcodes.
+
+        All the barcodes are looked up in the product database together (with
+        each distinct barcode only looked up once), and scans of the same
+        barcode and quantity share a single BasketItem. Instead of a warning
+        for each barcode that isn't found, the missing barcodes are returned.
+
+        Args:
+            scans: Pairs of barcode and quantity for each item to add.
+
+        Returns:
+            The number of items added, and the barcodes that were not found.
+
+        Raises:
+            ValueError: If product_db is None.
+        """
+
+        if self.products is None:
+            raise ValueError("Cannot add from barcode without products.")
+
+        scans = list(scans)
+        barcodes = {barcode for barcode, _ in scans}
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            start = time.perf_counter()
+        products = self.products.get_many(barcodes)
+        if recorder is not None:
+            instrumentation.record_lookup(recorder, start, len(scans),
+                                          len(barcodes) - len(products))
+        return self._add_scanned_items(scans, products)
+
+    def _add_scanned_items(
+            self,
+            scans: list[tuple[int, float]],
+            products: dict[int, Product]
+    ) -> ScanResult:
+        """Add scanned items to the basket, from the products looked up."""
+        result = ScanResult()
+        basket_items = {}
+        missing_barcodes = {}  # Dict rather than set, to keep scan order
+        for barcode, quantity in scans:
+            basket_item = basket_items.get((barcode, quantity))
+            if basket_item is None:
+                product = products.get(barcode)
+                if product is None:
+                    missing_barcodes[barcode] = None
+                    continue
+                basket_item = product.to_basket_item(quantity)
+                basket_items[barcode, quantity] = basket_item
+
+            self._add_scanned_item(basket_item)
+            result.num_added += 1
+
+        result.missing_barcodes = list(missing_barcodes)
+        return result
 
     def generate_invoice(
             self,
-            promotions: Optional[list[Promotion]] = None
+            promotions: Optional[Union[list[Promotion],
+                                       PromotionEngine]] = None
     ) -> 'Invoice':
-        """Get an invoice for items in the basket."""
+        """Get an invoice for items in the basket.
+
+        Args:
+            promotions: The promotions to apply. Defaults to the promotions of
+                the basket.
+        """
+
+        if promotions is None:
+            promotions = self.promotions
         return Invoice(self.basket_items, promotions=promotions)
+
+    def replay(self, events: Iterable[BasketEvent]) -> None:
+        """Apply events (e.g. read from a BasketLog) to the basket.
+
+        The events aren't recorded in the basket's log again. A CLOSE event
+        (a checkout) empties the basket.
+
+        Args:
+            events: The events to apply, in order.
+        """
+
+        log, self.log = self.log, None
+        try:
+            for event in events:
+                if event.kind in (SCAN, ADD):
+                    self._add_basket_item(event.item)
+                elif event.kind == SET_QUANTITY:
+                    self._set_line_quantity(self._find_line(event.item),
+                                            event.quantity)
+                elif event.kind == VOID:
+                    self._remove_line(self._find_line(event.item))
+                elif event.kind == CLOSE:
+                    self._clear()
+        finally:
+            self.log = log
+
+    def _clear(self) -> None:
+        """Remove every item from the basket."""
+        del self._basket_items[:]
+        self._reset()
+
+    def _reset(self) -> None:
+        """Reset the indexes and running total for the current lines."""
+        # Index of the lines with each barcode (None for items without one),
+        # by line id: the most recent line, and for each line the previous
+        # line with the same barcode (or -1). Only built once a line is
+        # edited, so baskets that are only scanned don't pay for it. Until
+        # then, the id of each line is its position
+        self._last_lines: Optional[dict[Optional[int], int]] = None
+        self._previous_lines = array('q')
+        # Whether each line id is still in the basket, and a Fenwick tree of
+        # the same (1-based), giving the position of a line from its id.
+        # Removed lines are taken out of the container straight away, so ids
+        # (unlike positions) don't change when a line is removed
+        self._alive = bytearray()
+        self._position_tree = array('q')
+        self._num_removed = 0
+
+        # Line id for each aggregated item, by _get_line_key
+        self._line_positions = {}
+        if self.aggregate:
+            for line, basket_item in enumerate(self._basket_items):
+                key = self._get_line_key(basket_item)
+                if key is not None:
+                    self._line_positions.setdefault(key, line)
+
+        if self.running_total is not None:
+            self.running_total = RunningTotal(self.promotions)
+            for basket_item in self._basket_items:
+                self.running_total.add(basket_item)
+
+    def _log_event(self, event: BasketEvent) -> None:
+        """Record an event in the basket's log (if it has one)."""
+        if self.log is not None:
+            self.log.append(event, self)
+
+    def _add_scanned_item(self, basket_item: BasketItem) -> None:
+        """Add an item looked up by barcode to the basket."""
+        self._add_basket_item(basket_item)
+        self._log_event(BasketEvent(SCAN, basket_item))
+
+    def _add_basket_item(self, basket_item: BasketItem) -> None:
+        """Add an item to the basket, updating the running total."""
+        key = self._get_line_key(basket_item) if self.aggregate else None
+        line = self._line_positions.get(key)
+        if line is not None:
+            old_item = self._basket_items[self._get_position(line)]
+            self._set_line_quantity(line,
+                                    old_item.quantity + basket_item.quantity)
+        else:
+            self._append_line(basket_item)
+
+    def _get_last_lines(self) -> dict[Optional[int], int]:
+        """Get the most recent line with each barcode, building the index."""
+        if self._last_lines is None:
+            self._build_index()
+        return self._last_lines
+
+    def _build_index(self) -> None:
+        """Index the lines by barcode, numbering them by position."""
+        last_lines = {}
+        previous_lines = array('q', [-1]) * len(self._basket_items)
+        for line, basket_item in enumerate(self._basket_items):
+            previous_lines[line] = last_lines.get(basket_item.barcode, -1)
+            last_lines[basket_item.barcode] = line
+        self._last_lines = last_lines
+        self._previous_lines = previous_lines
+        self._alive = bytearray(b'\x01') * len(previous_lines)
+        # With every line alive, each node counts the lines it covers
+        self._position_tree = array(
+            'q', [0] + [i & -i for i in range(1, len(previous_lines) + 1)])
+        self._num_removed = 0
+
+    def _get_position(self, line: int) -> int:
+        """The position in the container of the line with an id."""
+        if self._last_lines is None:
+            return line
+        # The number of lines still in the basket up to this one
+        tree = self._position_tree
+        position = -1
+        i = line + 1
+        while i > 0:
+            position += tree[i]
+            i -= i & -i
+        return position
+
+    def _iter_barcode_lines(self, barcode: Optional[int]) -> Iterator[int]:
+        """The ids of the lines with a barcode, from the most recent."""
+        line = self._get_last_lines().get(barcode, -1)
+        while line >= 0:
+            yield line
+            line = self._previous_lines[line]
+
+    def _find_line(self, basket_item: BasketItem) -> int:
+        """The id of the most recently added line equal to an item."""
+        for line in self._iter_barcode_lines(basket_item.barcode):
+            if self._basket_items[self._get_position(line)] == basket_item:
+                return line
+        raise ValueError(f"{basket_item!r} is not in the basket.")
+
+    def _append_line(self, basket_item: BasketItem) -> None:
+        """Add a new line to the end of the basket."""
+        if self._last_lines is None:
+            line = len(self._basket_items)
+        else:
+            line = len(self._previous_lines)
+            self._previous_lines.append(
+                self._last_lines.get(basket_item.barcode, -1))
+            self._last_lines[basket_item.barcode] = line
+            self._alive.append(1)
+            # The new node covers lines (i - (i & -i), i], including itself
+            tree = self._position_tree
+            i = len(tree)
+            count = 1
+            j = i - 1
+            while j > i - (i & -i):
+                count += tree[j]
+                j -= j & -j
+            tree.append(count)
+        self._basket_items.append(basket_item)
+        if self.aggregate:
+            key = self._get_line_key(basket_item)
+            if key is not None:
+                self._line_positions.setdefault(key, line)
+        if self.running_total is not None:
+            self.running_total.add(basket_item)
+
+    def _remove_line(self, line: int) -> None:
+        """Remove a line, updating the running total."""
+        position = self._get_position(line)
+        basket_item = self._basket_items[position]
+        del self._basket_items[position]
+        self._unlink_line(line, basket_item.barcode)
+        self._alive[line] = 0
+        tree = self._position_tree
+        i = line + 1
+        while i < len(tree):
+            tree[i] -= 1
+            i += i & -i
+        if self.aggregate:
+            key = self._get_line_key(basket_item)
+            if self._line_positions.get(key) == line:
+                del self._line_positions[key]
+        if self.running_total is not None:
+            self.running_total.remove(basket_item)
+
+        # Renumber the lines once removed ids are more than half of them, so
+        # the index stays in proportion to the basket
+        self._num_removed += 1
+        if self._num_removed * 2 > len(self._alive):
+            self._renumber_lines()
+
+    def _unlink_line(self, line: int, barcode: Optional[int]) -> None:
+        """Remove a line from the index of lines with its barcode."""
+        last_lines = self._get_last_lines()
+        previous_lines = self._previous_lines
+        previous = previous_lines[line]
+        if last_lines[barcode] == line:
+            if previous >= 0:
+                last_lines[barcode] = previous
+            else:
+                del last_lines[barcode]
+            return
+        # Find the next line with the barcode, and link it past this one
+        later = last_lines[barcode]
+        while previous_lines[later] != line:
+            later = previous_lines[later]
+        previous_lines[later] = previous
+
+    def _set_line_quantity(self, line: int, quantity: float) -> BasketItem:
+        """Change the quantity of a line, updating the running total."""
+        position = self._get_position(line)
+        old_item = self._basket_items[position]
+        basket_item = dataclasses.replace(old_item, quantity=quantity)
+        # The barcode (and aggregate key) are unchanged, so the line is
+        # still indexed under them
+        self._basket_items[position] = basket_item
+        if self.running_total is not None:
+            self.running_total.remove(old_item)
+            self.running_total.add(basket_item)
+        return basket_item
+
+    def _renumber_lines(self) -> None:
+        """Give the lines still in the basket their positions as ids.
+
+        The index is remapped to the new ids, rather than rebuilt from the
+        lines. As this is only done once half the ids have been removed, its
+        cost is spread over those removals.
+        """
+
+        alive = self._alive
+        new_ids = array('q', [-1]) * len(alive)
+        num_lines = 0
+        for line, is_alive in enumerate(alive):
+            if is_alive:
+                new_ids[line] = num_lines
+                num_lines += 1
+
+        previous_lines = array('q', [-1]) * num_lines
+        for line, previous in enumerate(self._previous_lines):
+            if alive[line] and previous >= 0:
+                previous_lines[new_ids[line]] = new_ids[previous]
+        self._previous_lines = previous_lines
+        self._last_lines = {barcode: new_ids[line]
+                            for barcode, line in self._last_lines.items()}
+        self._line_positions = {key: new_ids[line] for key, line
+                                in self._line_positions.items()}
+        self._alive = bytearray(b'\x01') * num_lines
+        self._position_tree = array(
+            'q', [0] + [i & -i for i in range(1, num_lines + 1)])
+        self._num_removed = 0
+
+    @staticmethod
+    def _get_line_key(basket_item: BasketItem) -> Optional[tuple]:
+        """Get the key of the line an item is combined into (if any).
+
+        Only scanned items sold individually (without units) are combined, as
+        they are the ones counted unit by unit by promotions.
+        """
+
+        if basket_item.barcode is None or basket_item.units is not None:
+            return None
+        return basket_item.barcode, basket_item.name, basket_item.unit_price
@@ -1,14 +1,19 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import ClassVar, Optional
 
+from shoppingbasket.money import line_pence
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class BasketItem:
     """An item in a shopping basket.
 
     This class is used to represent both items and discounts. Discounts have a
     negative line price.
 
+    Items use slots rather than an instance dictionary, to keep large baskets
+    small in memory (and quick to create).
+
     Attributes:
         name: The name of the item.
         unit_price: The price of the item.
@@ -23,14 +28,22 @@ class BasketItem:
     units: Optional[str] = None
     quantity: float = 1.0
 
+    # Sign of the line price (negative for discounts)
+    _sign: ClassVar[int] = 1
+
     @property
-    def description(self):
+    def description(self) -> str:
         """A description of the item, to appear on the invoice.
 
         This is usually just the item name, but a second line is added for
-        items with units (e.g. '1.5kg @ £2.00/kg').
+        items with units (e.g. '1.5kg @ £2.00/kg'), or lines of more than one
+        item (e.g. '3 @ £0.5').
         """
 
+        return self._get_description()
+
+    def _get_description(self) -> str:
+        """Format the description of the item."""
         desc = self.name
 
         # For items with units, add a second line with the amount and rate
@@ -38,22 +51,55 @@ class BasketItem:
             amount = f"{self.quantity}{self.units}"
             rate = f"£{self.unit_price}/{self.units}"
             desc += f"\n{amount} @ {rate}"
+        # Similarly for lines of more than one of an item (without units)
+        elif self.quantity != 1:
+            desc += f"\n{self.quantity:g} @ £{self.unit_price}"
         return desc
 
+    @property
+    def unit_count(self) -> int:
+        """The number of individual units the item is made up of.
+
+        Lines of an item without units (e.g. cans of beans) can have a whole
+        number quantity, which is the number of units. Anything else (e.g. a
+        weighed item) is a single unit.
+        """
+
+        quantity = self.quantity
+        if self.units is None and quantity >= 1 and quantity == int(quantity):
+            return int(quantity)
+        return 1
+
+    @property
+    def unit_line_price_pence(self) -> int:
+        """The price in pence of each of the units the item is made up of."""
+        if self.unit_count == 1:
+            return self.line_price_pence
+        return line_pence(self.unit_price) * self._sign
+
     @property
     def line_price(self) -> float:
         """The price of the item."""
-        return round(self.unit_price * self.quantity, 2)
+        return round(self.unit_price * self.quantity, 2) * self._sign
+
+    @property
+    def line_price_pence(self) -> int:
+        """The price of the item in (integer) pence."""
+        return line_pence(self.unit_price, self.quantity) * self._sign
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Discount(BasketItem):
     """A discount on an item in a shopping basket.
 
     This is the same as a regular BasketItem, but with a negative line price.
+    A discount applied several times has the number of times as its quantity.
     """
 
-    @property
-    def line_price(self) -> float:
-        """The price of the discount."""
-        return super().line_price * -1
+    _sign: ClassVar[int] = -1
+
+    def _get_description(self) -> str:
+        """Format the description of the discount."""
+        if self.quantity == 1:
+            return self.name
+        return f"{self.name} x{self.quantity:g}"
@@ -0,0 +1,399 @@
+import os
+import struct
+import time
+import zlib
+from typing import TYPE_CHECKING, Iterator, NamedTuple, Optional
+
+from shoppingbasket.basket_item import BasketItem
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from shoppingbasket.basket import Basket
+
+# Kinds of event
+SCAN = 'scan'
+ADD = 'add'
+SET_QUANTITY = 'set_quantity'
+VOID = 'void'
+CLOSE = 'close'
+
+_CODES = {SCAN: 1, ADD: 2, SET_QUANTITY: 3, VOID: 4, CLOSE: 5}
+_KINDS = {code: kind for kind, code in _CODES.items()}
+
+# Log file header: magic and a random id (matched by its snapshots)
+_LOG_MAGIC = b'SBLOG002'
+_LOG_HEADER = struct.Struct('=8s8s')
+
+# Each record: payload length, CRC32 of the kind and payload, kind
+_RECORD = struct.Struct('=IIB')
+
+# Item payload: has barcode, barcode, unit price, quantity, name length,
+# units length (or _NO_UNITS), followed by the name and units (UTF-8)
+_ITEM = struct.Struct('=?qddHH')
+_NO_UNITS = 0xFFFF
+
+# SET_QUANTITY payload: the new quantity, followed by the item changed (VOID
+# payloads are just the item removed)
+_QUANTITY = struct.Struct('=d')
+
+# Snapshot file: magic, log id, log offset, number of items, followed by the
+# items and a CRC32 of everything before it
+_SNAPSHOT_MAGIC = b'SBSNAP01'
+_SNAPSHOT_HEADER = struct.Struct('=8s8sQI')
+_CRC = struct.Struct('=I')
+
+
+class BasketEvent(NamedTuple):
+    """A change to a basket, as recorded in a BasketLog.
+
+    Attributes:
+        kind: The kind of event (SCAN, ADD, SET_QUANTITY, VOID or CLOSE).
+        item: The item added, changed (SET_QUANTITY) or removed (VOID).
+            Lines are identified by their item, as the most recently added
+            line equal to it.
+        quantity: The new quantity, for SET_QUANTITY events.
+    """
+
+    kind: str
+    item: Optional[BasketItem] = None
+    quantity: Optional[float] = None
+
+
+class BasketLog:
+    """An append-only binary log of basket events, for crash recovery.
+
+    A basket with a log records every change (scans, manual adds, quantity
+    changes and voids) as it happens, and end_basket marks the basket as
+    checked out. If the till process dies, the open basket (the events since
+    the last checkout) can be restored into a new Basket.
+
+    Each event is written to the file as soon as it happens (so it survives
+    the process dying), but the file is only synced to disk (with fsync)
+    every sync_every events or sync_interval seconds, and at each checkout,
+    so a power cut loses at most the last batch. Records have a checksum, and
+    a torn record at the end of the log is dropped when it is opened.
+
+    Every snapshot_every events (and at each checkout), a compact snapshot of
+    the open basket is written next to the log. Restoring starts from the
+    snapshot, so it takes time proportional to the events since then, rather
+    than the length of the log.
+
+    Closed logs can also be read back for offline re-pricing (see
+    iter_baskets and read_scans).
+
+    Attributes:
+        path: The path of the log file.
+        snapshot_path: The path of the snapshot file.
+        sync_every: The number of events between syncs.
+        sync_interval: The maximum time between syncs, in seconds (checked
+            when each event is written).
+        snapshot_every: The number of events between snapshots.
+    """
+
+    def __init__(self,
+                 path: str,
+                 sync_every: int = 64,
+                 sync_interval: float = 0.05,
+                 snapshot_every: int = 1000) -> None:
+        """Open a log, creating it if it doesn't exist.
+
+        Args:
+            path: The path of the log file.
+            sync_every: The number of events between syncs. Defaults to 64.
+            sync_interval: The maximum time between syncs, in seconds.
+                Defaults to 0.05.
+            snapshot_every: The number of events between snapshots. Defaults
+                to 1000.
+
+        Raises:
+            ValueError: If the file is not a basket log.
+        """
+
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+
+        self._file = open(path, 'a+b', buffering=0)
+        self._file.seek(0)
+        header = self._file.read(_LOG_HEADER.size)
+        if not header:
+            header = _LOG_HEADER.pack(_LOG_MAGIC, os.urandom(8))
+            self._file.write(header)
+            os.fsync(self._file.fileno())
+        if len(header) < _LOG_HEADER.size \
+                or _LOG_HEADER.unpack(header)[0] != _LOG_MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a basket log.")
+        self._log_id = _LOG_HEADER.unpack(header)[1]
+
+        # Read the events since the last snapshot (if any), and drop a torn
+        # record from the end of the file
+        self._snapshot_items, start = self._read_snapshot()
+        self._file.seek(start)
+        data = self._file.read()
+        self._recent_events = []
+        offset = 0
+        for offset, event in _iter_records(data):
+            self._recent_events.append(event)
+        self._offset = start + offset
+        if self._offset < start + len(data):
+            self._file.truncate(self._offset)
+
+        self._num_unsynced = 0
+        self._last_sync = time.monotonic()
+        self._num_since_snapshot = len(self._recent_events)
+
+    def append(self, event: BasketEvent,
+               basket: Optional['Basket'] = None) -> None:
+        """Write an event to the log.
+
+        Args:
+            event: The event.
+            basket: The basket after the event, to snapshot every
+                snapshot_every events. Defaults to None (no snapshot).
+        """
+
+        record = _encode_record(event)
+        self._file.write(record)
+        self._offset += len(record)
+        self._num_unsynced += 1
+        self._num_since_snapshot += 1
+
+        if self._num_unsynced >= self.sync_every \
+                or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        if basket is not None \
+                and self._num_since_snapshot >= self.snapshot_every:
+            self.snapshot(basket)
+
+    def end_basket(self) -> None:
+        """Mark the open basket as checked out (and sync the log)."""
+        self.append(BasketEvent(CLOSE))
+        self.sync()
+        self._write_snapshot([])
+
+    def sync(self) -> None:
+        """Sync the events written so far to disk."""
+        if self._num_unsynced:
+            os.fsync(self._file.fileno())
+            self._num_unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def snapshot(self, basket: 'Basket') -> None:
+        """Write a snapshot of the open basket (as of the last event)."""
+        self.sync()
+        self._write_snapshot(basket.basket_items)
+
+    def restore(self, basket: 'Basket') -> 'Basket':
+        """Restore the open basket, and record its changes from now on.
+
+        Args:
+            basket: An empty basket (with the products and settings of the
+                basket being restored).
+
+        Returns:
+            The basket, with the items of the open basket.
+        """
+
+        events = [BasketEvent(ADD, item) for item in self._snapshot_items]
+        events += self._recent_events
+        basket.replay(events)
+        basket.log = self
+        self._snapshot_items, self._recent_events = [], []
+        return basket
+
+    def close(self) -> None:
+        """Sync and close the log."""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self) -> 'BasketLog':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def iter_events(path: str) -> Iterator[BasketEvent]:
+        """Read all the events in a log file."""
+        with open(path, 'rb') as f:
+            header = f.read(_LOG_HEADER.size)
+            if len(header) < _LOG_HEADER.size \
+                    or _LOG_HEADER.unpack(header)[0] != _LOG_MAGIC:
+                raise ValueError(f"{path} is not a basket log.")
+            data = f.read()
+        for _, event in _iter_records(data):
+            yield event
+
+    @staticmethod
+    def iter_baskets(path: str) -> Iterator[list[BasketItem]]:
+        """Read the items of each checked out basket in a log file.
+
+        Each basket is replayed (so voided items are left out, and quantity
+        changes applied). Baskets that weren't checked out are skipped.
+        """
+
+        from shoppingbasket.basket import Basket
+
+        events = []
+        for event in BasketLog.iter_events(path):
+            if event.kind == CLOSE:
+                basket = Basket()
+                basket.replay(events)
+                yield basket.basket_items
+                events = []
+            else:
+                events.append(event)
+
+    @staticmethod
+    def read_scans(
+            path: str
+    ) -> tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+        """Read the checked out baskets in a log file as columns of scans.
+
+        The items with barcodes are returned in the form taken by
+        price_baskets, so past baskets can be re-priced (e.g. with new
+        promotions) in bulk. Baskets are numbered in the order they were
+        checked out.
+
+        Returns:
+            The basket id, barcode and quantity of each item.
+        """
+
+        import numpy as np
+
+        basket_ids, barcodes, quantities = [], [], []
+        for basket_id, items in enumerate(BasketLog.iter_baskets(path)):
+            for item in items:
+                if item.barcode is not None:
+                    basket_ids.append(basket_id)
+                    barcodes.append(item.barcode)
+                    quantities.append(item.quantity)
+        return (np.array(basket_ids, dtype=np.int64),
+                np.array(barcodes, dtype=np.int64),
+                np.array(quantities, dtype=np.float64))
+
+    def _read_snapshot(self) -> tuple[list[BasketItem], int]:
+        """Read the snapshot, and the log offset it was taken at.
+
+        Snapshots of another log (or beyond the end of this one), and
+        damaged snapshots, are ignored.
+        """
+
+        no_snapshot = [], _LOG_HEADER.size
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return no_snapshot
+        if len(data) < _SNAPSHOT_HEADER.size + _CRC.size:
+            return no_snapshot
+        (crc,) = _CRC.unpack_from(data, len(data) - _CRC.size)
+        if zlib.crc32(data[:-_CRC.size]) != crc:
+            return no_snapshot
+        magic, log_id, offset, num_items = \
+            _SNAPSHOT_HEADER.unpack_from(data)
+        log_size = os.fstat(self._file.fileno()).st_size
+        if magic != _SNAPSHOT_MAGIC or log_id != self._log_id \
+                or offset > log_size:
+            return no_snapshot
+
+        items = []
+        position = _SNAPSHOT_HEADER.size
+        for _ in range(num_items):
+            item, position = _decode_item(data, position)
+            items.append(item)
+        return items, offset
+
+    def _write_snapshot(self, basket_items: list[BasketItem]) -> None:
+        """Replace the snapshot file (atomically)."""
+        items = b''.join(_encode_item(item) for item in basket_items)
+        data = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, self._log_id,
+                                     self._offset, len(basket_items)) + items
+        data += _CRC.pack(zlib.crc32(data))
+
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self._num_since_snapshot = 0
+
+
+def _encode_item(item: BasketItem) -> bytes:
+    name = item.name.encode('utf-8')
+    units = b'' if item.units is None else item.units.encode('utf-8')
+    return _ITEM.pack(item.barcode is not None,
+                      0 if item.barcode is None else item.barcode,
+                      item.unit_price,
+                      item.quantity,
+                      len(name),
+                      _NO_UNITS if item.units is None else len(units)) \
+        + name + units
+
+
+def _decode_item(data: bytes, position: int) -> tuple[BasketItem, int]:
+    """Decode an item at a position, returning it and the position after."""
+    has_barcode, barcode, unit_price, quantity, name_length, units_length = \
+        _ITEM.unpack_from(data, position)
+    position += _ITEM.size
+    name = bytes(data[position:position + name_length]).decode('utf-8')
+    position += name_length
+    units = None
+    if units_length != _NO_UNITS:
+        units = bytes(data[position:position + units_length]).decode('utf-8')
+        position += units_length
+    item = BasketItem(name, unit_price,
+                      barcode=barcode if has_barcode else None,
+                      units=units,
+                      quantity=quantity)
+    return item, position
+
+
+def _encode_record(event: BasketEvent) -> bytes:
+    code = _CODES[event.kind]
+    if event.kind in (SCAN, ADD, VOID):
+        payload = _encode_item(event.item)
+    elif event.kind == SET_QUANTITY:
+        payload = _QUANTITY.pack(event.quantity) + _encode_item(event.item)
+    else:
+        payload = b''
+    crc = zlib.crc32(payload, zlib.crc32(bytes([code])))
+    return _RECORD.pack(len(payload), crc, code) + payload
+
+
+def _iter_records(data: bytes) -> Iterator[tuple[int, BasketEvent]]:
+    """Decode records, yielding the offset after each and its event.
+
+    Stops at the first incomplete or damaged record (e.g. one that was
+    being written when the process died).
+    """
+
+    view = memoryview(data)
+    offset = 0
+    while offset + _RECORD.size <= len(data):
+        length, crc, code = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        end = start + length
+        if end > len(data) or code not in _KINDS:
+            return
+        payload = view[start:end]
+        if zlib.crc32(payload, zlib.crc32(bytes([code]))) != crc:
+            return
+
+        kind = _KINDS[code]
+        if kind in (SCAN, ADD, VOID):
+            event = BasketEvent(kind, _decode_item(payload, 0)[0])
+        elif kind == SET_QUANTITY:
+            quantity, = _QUANTITY.unpack_from(payload)
+            item = _decode_item(payload, _QUANTITY.size)[0]
+            event = BasketEvent(kind, item, quantity=quantity)
+        else:
+            event = BasketEvent(kind)
+        offset = end
+        yield offset, event
@@ -0,0 +1,288 @@
+import warnings
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from shoppingbasket.money import line_pence, to_pence
+from shoppingbasket.product_db import ProductDB
+from shoppingbasket.promotions import MForN, MForNPounds, Promotion
+
+
+@dataclass
+class BatchInvoices:
+    """The totals of a batch of baskets, priced together.
+
+    Each array has one entry per basket, in the order of basket_ids. Totals
+    are in integer pence, and match the totals of a fixed point Invoice for
+    each basket exactly.
+
+    Attributes:
+        basket_ids: The (sorted, unique) ids of the baskets.
+        subtotals_pence: The total price of items in each basket.
+        discount_totals_pence: The total price of discounts in each basket.
+    """
+
+    basket_ids: np.ndarray
+    subtotals_pence: np.ndarray
+    discount_totals_pence: np.ndarray
+
+    @property
+    def totals_pence(self) -> np.ndarray:
+        """The total price of each basket after discounts, in pence."""
+        return self.subtotals_pence + self.discount_totals_pence
+
+    @property
+    def subtotals(self) -> np.ndarray:
+        """The total price of items in each basket before discounts."""
+        return self.subtotals_pence / 100
+
+    @property
+    def discount_totals(self) -> np.ndarray:
+        """The total price of discounts in each basket."""
+        return self.discount_totals_pence / 100
+
+    @property
+    def totals(self) -> np.ndarray:
+        """The total price of each basket after discounts."""
+        return self.totals_pence / 100
+
+
+def price_baskets(
+        basket_ids: np.ndarray,
+        barcodes: np.ndarray,
+        quantities: Optional[np.ndarray],
+        products: ProductDB,
+        promotions: Optional[list[Promotion]] = None
+) -> BatchInvoices:
+    """Price many baskets at once.
+
+    The baskets are given in columnar form, with one row per basket item (as
+    would be added with Basket.add_item_from_barcode). Rather than creating a
+    Basket and Invoice for each basket, totals are calculated with grouped
+    NumPy operations. MForN and MForNPounds promotions are vectorised; other
+    promotions fall back to creating basket items for their eligible rows.
+
+    Rows with barcodes that are not in the product database are skipped, with
+    a single warning listing the missing barcodes.
+
+    Args:
+        basket_ids: The id of the basket each row belongs to.
+        barcodes: The barcode of each row.
+        quantities: The quantity of each row. Defaults to 1.0 for every row.
+        products: A database of products, keyed by barcode.
+        promotions: The promotions to apply to every basket.
+
+    Returns:
+        The totals of each basket.
+    """
+
+    basket_ids = np.asarray(basket_ids)
+    barcodes = np.asarray(barcodes, dtype=np.int64)
+    if quantities is None:
+        quantities = np.ones(len(barcodes))
+    quantities = np.asarray(quantities, dtype=np.float64)
+
+    unique_basket_ids, basket_index = np.unique(basket_ids,
+                                                return_inverse=True)
+    num_baskets = len(unique_basket_ids)
+
+    # Look up each distinct barcode once, and drop rows that aren't found
+    unique_barcodes, barcode_index = np.unique(barcodes, return_inverse=True)
+    found_products = products.get_many(unique_barcodes.tolist())
+    unit_prices = np.zeros(len(unique_barcodes))
+    has_units = np.zeros(len(unique_barcodes), dtype=bool)
+    found = np.zeros(len(unique_barcodes), dtype=bool)
+    for i, barcode in enumerate(unique_barcodes.tolist()):
+        product = found_products.get(barcode)
+        if product is not None:
+            unit_prices[i] = product.unit_price
+            has_units[i] = product.units is not None
+            found[i] = True
+    if not found.all():
+        missing = unique_barcodes[~found].tolist()
+        warnings.warn(f"Barcodes {missing} not found in product database. "
+                      "Items not priced.")
+        priced = found[barcode_index]
+        basket_index = basket_index[priced]
+        barcode_index = barcode_index[priced]
+        quantities = quantities[priced]
+
+    line_prices, unit_pence = _get_line_prices(barcode_index, quantities,
+                                               unit_prices)
+
+    # Lines without units and with a whole number quantity are made up of
+    # that many units (see BasketItem.unit_count)
+    whole_units = ~has_units[barcode_index] & (quantities >= 1) & \
+        (quantities == np.floor(quantities))
+    unit_counts = np.where(whole_units, quantities, 1).astype(np.int64)
+    unit_line_prices = np.where(unit_counts == 1, line_prices, unit_pence)
+
+    rows = _Rows(basket_index,
+                 unique_barcodes[barcode_index],
+                 quantities,
+                 unit_pence,
+                 line_prices,
+                 unit_counts,
+                 unit_line_prices)
+
+    subtotals = np.zeros(num_baskets, dtype=np.int64)
+    np.add.at(subtotals, rows.basket_index, rows.line_prices)
+
+    discount_totals = np.zeros(num_baskets, dtype=np.int64)
+    for promotion in promotions or []:
+        eligible_rows = rows.select(np.isin(rows.barcodes,
+                                            list(promotion.eligible_barcodes)))
+        if isinstance(promotion, MForN):
+            get_discounts = _get_m_for_n_discounts
+        elif isinstance(promotion, MForNPounds):
+            get_discounts = _get_m_for_n_pounds_discounts
+        else:
+            get_discounts = _get_discounts
+        discounts = np.zeros(num_baskets, dtype=np.int64)
+        if len(eligible_rows.basket_index):
+            get_discounts(promotion, eligible_rows, products, discounts)
+        discount_totals -= discounts
+
+    return BatchInvoices(unique_basket_ids, subtotals, discount_totals)
+
+
+@dataclass
+class _Rows:
+    """Basket item rows, in columnar form (with prices in pence)."""
+
+    basket_index: np.ndarray
+    barcodes: np.ndarray
+    quantities: np.ndarray
+    unit_prices: np.ndarray
+    line_prices: np.ndarray
+    unit_counts: np.ndarray
+    unit_line_prices: np.ndarray
+
+    def select(self, mask: np.ndarray) -> '_Rows':
+        """Get the rows where a mask (or index array) is set."""
+        return _Rows(self.basket_index[mask],
+                     self.barcodes[mask],
+                     self.quantities[mask],
+                     self.unit_prices[mask],
+                     self.line_prices[mask],
+                     self.unit_counts[mask],
+                     self.unit_line_prices[mask])
+
+
+def _get_line_prices(
+        barcode_index: np.ndarray,
+        quantities: np.ndarray,
+        unit_prices: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Calculate the line price and unit price in pence of each row.
+
+    To match BasketItem.line_price_pence exactly, line prices are calculated
+    with the same (exact) function, but only once per distinct unit price or
+    pair of unit price and quantity.
+    """
+
+    unit_prices = unit_prices.tolist()
+    unit_pence = np.array([to_pence(price) for price in unit_prices],
+                          dtype=np.int64)
+    unit_pence = unit_pence[barcode_index]
+    line_prices = unit_pence.copy()
+
+    # Rows with quantities other than 1 (e.g. weighed items)
+    other = np.flatnonzero(quantities != 1.0)
+    if len(other):
+        pairs = np.column_stack([barcode_index[other].astype(np.float64),
+                                 quantities[other]])
+        unique_pairs, pair_index = np.unique(pairs, axis=0,
+                                             return_inverse=True)
+        pair_prices = np.array(
+            [line_pence(unit_prices[int(i)], quantity)
+             for i, quantity in unique_pairs.tolist()],
+            dtype=np.int64)
+        line_prices[other] = pair_prices[pair_index.reshape(-1)]
+    return line_prices, unit_pence
+
+
+def _get_m_for_n_discounts(promotion: MForN,
+                           rows: _Rows,
+                           products: ProductDB,
+                           discounts: np.ndarray) -> None:
+    """Add the MForN discount for each basket to discounts (in pence).
+
+    Like MForN.get_discounts, the units of each barcode in each basket are
+    counted, and there is a discount for every m of them.
+    """
+
+    keys = np.column_stack([rows.basket_index, rows.barcodes])
+    unique_keys, first_rows, key_index = np.unique(keys, axis=0,
+                                                   return_index=True,
+                                                   return_inverse=True)
+    counts = np.zeros(len(unique_keys), dtype=np.int64)
+    np.add.at(counts, key_index.reshape(-1), rows.unit_counts)
+
+    group_discounts = (counts // promotion.m) * rows.unit_prices[first_rows] \
+        * (promotion.m - promotion.n)
+    np.add.at(discounts, unique_keys[:, 0], group_discounts)
+
+
+def _get_m_for_n_pounds_discounts(promotion: MForNPounds,
+                                  rows: _Rows,
+                                  products: ProductDB,
+                                  discounts: np.ndarray) -> None:
+    """Add the MForNPounds discount for each basket to discounts (in pence).
+
+    Like MForNPounds.get_discounts, the eligible units in each basket are
+    sorted by price (most expensive first), and split into groups of m. Any
+    incomplete group at the end is ignored, as are groups where the discount
+    would not save the customer money.
+    """
+
+    m = promotion.m
+
+    # Split rows into their individual units
+    basket_index = np.repeat(rows.basket_index, rows.unit_counts)
+    line_prices = np.repeat(rows.unit_line_prices, rows.unit_counts)
+
+    # Sort by basket, then by price (descending) within each basket
+    order = np.lexsort((-line_prices, basket_index))
+    basket_index = basket_index[order]
+    line_prices = line_prices[order]
+
+    # Position of each row within its basket, and the size of its basket
+    starts = np.searchsorted(basket_index, basket_index, side='left')
+    ends = np.searchsorted(basket_index, basket_index, side='right')
+    rank = np.arange(len(basket_index)) - starts
+    in_full_group = rank < ((ends - starts) // m) * m
+
+    # Rows in full groups are consecutive, m at a time
+    group_prices = line_prices[in_full_group].reshape(-1, m).sum(axis=1)
+    group_baskets = basket_index[in_full_group][::m]
+    group_discounts = group_prices - to_pence(promotion.n)
+
+    saves_money = group_discounts > 0
+    np.add.at(discounts, group_baskets[saves_money],
+              group_discounts[saves_money])
+
+
+def _get_discounts(promotion: Promotion,
+                   rows: _Rows,
+                   products: ProductDB,
+                   discounts: np.ndarray) -> None:
+    """Add the discount for each basket to discounts (in pence).
+
+    This works for any type of promotion: basket items are created for the
+    eligible rows of each basket, and passed to the promotion.
+    """
+
+    order = np.argsort(rows.basket_index, kind='stable')
+    basket_index = rows.basket_index[order]
+    boundaries = np.flatnonzero(np.diff(basket_index)) + 1
+    for basket_rows in np.split(order, boundaries):
+        basket_items = [
+            products.get_product(barcode).to_basket_item(quantity)
+            for barcode, quantity in zip(rows.barcodes[basket_rows].tolist(),
+                                         rows.quantities[basket_rows].tolist())
+        ]
+        discount_total = sum(discount.line_price_pence for discount
+                             in promotion.get_discounts(basket_items))
+        discounts[rows.basket_index[basket_rows[0]]] -= discount_total
@@ -0,0 +1,62 @@
+"""Compare the float and fixed point (integer pence) invoice totals.
+
+Each invoice is for freshly created basket items (as when pricing a new
+basket), so the time includes calculating every line price.
+
+Run from the repository root with:
+
+    python -m shoppingbasket.benchmarks.money
+"""
+
+import random
+import timeit
+
+from shoppingbasket import BasketItem, Invoice
+from shoppingbasket.promotions import MForN, MForNPounds
+
+
+def make_item_fields(num_items: int, seed: int = 0) -> list[dict]:
+    """Create the fields of a basket of random items from 100 products."""
+    rng = random.Random(seed)
+    prices = {barcode: rng.randint(10, 500) / 100 for barcode in range(100)}
+    item_fields = []
+    for _ in range(num_items):
+        barcode = rng.randrange(100)
+        fields = {'name': f"Product {barcode}",
+                  'unit_price': prices[barcode],
+                  'barcode': barcode}
+        if barcode % 10 == 0:
+            # Weighed item
+            fields['units'] = 'kg'
+            fields['quantity'] = rng.randint(1, 2000) / 1000
+        item_fields.append(fields)
+    return item_fields
+
+
+def main() -> None:
+    promotions = [
+        MForN("3 for 2", set(range(1, 100, 3)), m=3, n=2),
+        MForNPounds("3 for £5", set(range(2, 100, 3)), m=3, n=5.0),
+    ]
+
+    for num_items in (10, 100, 1000):
+        item_fields = make_item_fields(num_items)
+        for fixed_point in (False, True):
+            def price_basket():
+                basket_items = [BasketItem(**fields)
+                                for fields in item_fields]
+                invoice = Invoice(basket_items, promotions,
+                                  fixed_point=fixed_point)
+                return invoice.subtotal, invoice.discount_total, invoice.total
+
+            repeats = max(1, 1000 // num_items)
+            seconds = min(timeit.repeat(price_basket,
+                                        number=repeats,
+                                        repeat=50))
+            mode = 'pence' if fixed_point else 'float'
+            print(f"{num_items:>5} items, {mode}: "
+                  f"{seconds / repeats * 1e6:10.1f} us per invoice")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,543 @@
+"""Benchmark the hot paths of pricing a basket, at several scales.
+
+Each benchmark records its throughput (items per second), latency
+percentiles and peak memory (as traced by tracemalloc). Results can be saved
+as a baseline, and later runs compared against it to find regressions.
+
+Run from the repository root with:
+
+    python -m shoppingbasket.benchmarks.suite --save baseline.json
+    python -m shoppingbasket.benchmarks.suite --compare baseline.json
+
+shoppingbasket/benchmarks/baseline.json is a reference baseline: a run of
+the full suite on one machine (its Python version and machine type are
+recorded), to show the expected scale of each result. Timings depend on
+the machine, so regressions should be checked against a baseline saved on
+the same machine, e.g. in CI by running with --save on the base branch and
+then with --compare on the change.
+
+Use --max-items and --max-promotions to skip the largest scales, and
+--filter to run only some benchmarks.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, Optional
+
+from shoppingbasket import Basket, BasketItem, Invoice, ProductDB
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import MForN, MForNPounds, Promotion
+from shoppingbasket.receipt import ReceiptFormatter
+
+ITEM_SCALES = (10, 100, 1_000, 10_000, 100_000)
+PROMOTION_SCALES = (10, 100, 1_000, 10_000)
+
+# Promotion benchmarks at each number of promotions use a basket this size
+PROMOTION_BASKET_SIZE = 1_000
+
+# The number of barcodes each synthetic promotion is eligible for
+BARCODES_PER_PROMOTION = 5
+
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class BenchmarkResult:
+    """The measurements of a single benchmark.
+
+    Attributes:
+        name: The name of the benchmark, with its parameters.
+        size: The number of items processed by each call.
+        rounds: The number of times the benchmark was called.
+        throughput: The number of items processed per second.
+        latency_us: The latency percentiles of a call, in microseconds,
+            keyed by percentile (as a string, to match the saved JSON).
+        peak_memory_kb: The peak memory allocated by a call, in KiB.
+    """
+
+    name: str
+    size: int
+    rounds: int
+    throughput: float
+    latency_us: dict[str, float]
+    peak_memory_kb: float
+
+
+@dataclass
+class Comparison:
+    """A benchmark compared with its baseline.
+
+    Attributes:
+        name: The name of the benchmark.
+        latency_ratio: The median latency relative to the baseline.
+        memory_ratio: The peak memory relative to the baseline.
+        is_regression: Whether either ratio is above the threshold.
+    """
+
+    name: str
+    latency_ratio: float
+    memory_ratio: float
+    is_regression: bool
+
+
+# A benchmark case: its name, the number of items each call processes, and a
+# function that sets the benchmark up and returns the function to time. If
+# the function to time has a prepare attribute, it is called before each
+# call (outside the timer), and its result is passed to the function, so
+# each call can be given fresh inputs
+_Case = tuple[str, int, Callable[[], Callable[[], object]]]
+
+
+def make_catalogue(num_products: int, seed: int = 0) -> list[dict]:
+    """Create products with barcodes 0 to num_products - 1.
+
+    One in ten products is weighed (sold by the kg).
+    """
+
+    rng = random.Random(seed)
+    products = []
+    for barcode in range(num_products):
+        product = {'barcode': barcode,
+                   'name': f"Product {barcode}",
+                   'unit_price': rng.randint(10, 500) / 100}
+        if barcode % 10 == 0:
+            product['units'] = 'kg'
+        products.append(product)
+    return products
+
+
+def make_scans(num_items: int,
+               num_products: int,
+               seed: int = 0) -> list[tuple[int, float]]:
+    """Create random (barcode, quantity) scans of products in a catalogue."""
+    rng = random.Random(seed)
+    scans = []
+    for _ in range(num_items):
+        barcode = rng.randrange(num_products)
+        if barcode % 10 == 0:
+            scans.append((barcode, rng.randint(1, 2000) / 1000))
+        else:
+            scans.append((barcode, 1.0))
+    return scans
+
+
+def make_promotions(num_promotions: int,
+                    num_products: int,
+                    seed: int = 0) -> list[Promotion]:
+    """Create MForN and MForNPounds promotions, alternately.
+
+    Each promotion is eligible for BARCODES_PER_PROMOTION random products.
+    """
+
+    rng = random.Random(seed)
+    promotions = []
+    for i in range(num_promotions):
+        barcodes = set(rng.sample(range(num_products),
+                                  min(BARCODES_PER_PROMOTION, num_products)))
+        if i % 2 == 0:
+            promotions.append(MForN(f"3 for 2 ({i})", barcodes, m=3, n=2))
+        else:
+            promotions.append(MForNPounds(f"3 for £5 ({i})", barcodes,
+                                          m=3, n=5.0))
+    return promotions
+
+
+def _make_basket_items(products: ProductDB,
+                       scans: list[tuple[int, float]]) -> list[BasketItem]:
+    basket = Basket(products=products)
+    basket.add_items_from_barcodes(scans)
+    return basket.basket_items
+
+
+def _make_items_factory(
+        products: ProductDB,
+        scans: list[tuple[int, float]]
+) -> Callable[[], list[BasketItem]]:
+    """Get a function creating new basket items for scans, for each call.
+
+    Reusing the same items across calls would only time their first call
+    with any values cached on them, not the pricing of a new basket.
+    """
+
+    item_fields = [(item.name, item.unit_price, item.barcode, item.units,
+                    item.quantity)
+                   for item in _make_basket_items(products, scans)]
+    return lambda: [BasketItem(*fields) for fields in item_fields]
+
+
+def _scan_case(num_items: int) -> Callable[[], object]:
+    """Scan items into a basket, looking them up by barcode."""
+    products = ProductDB(make_catalogue(num_items))
+    scans = make_scans(num_items, num_items)
+
+    def scan():
+        basket = Basket(products=products)
+        for barcode, quantity in scans:
+            basket.add_item_from_barcode(barcode, quantity)
+        return basket
+
+    return scan
+
+
+def _invoice_case(num_items: int,
+                  fixed_point: bool) -> Callable[[], object]:
+    """Create an invoice (with 10 promotions) and calculate its totals.
+
+    Each invoice is for newly created basket items.
+    """
+
+    products = ProductDB(make_catalogue(num_items))
+    engine = PromotionEngine(make_promotions(10, num_items))
+
+    def price(basket_items):
+        invoice = Invoice(basket_items, engine, fixed_point=fixed_point)
+        return invoice.subtotal, invoice.discount_total, invoice.total
+
+    price.prepare = _make_items_factory(products,
+                                        make_scans(num_items, num_items))
+    return price
+
+
+def _promotion_case(promotion_type: type,
+                    num_items: int,
+                    num_promotions: int) -> Callable[[], object]:
+    """Calculate the discounts of one type of promotion."""
+    # Enough products for each promotion to have its own barcodes
+    num_products = max(num_items,
+                       num_promotions * BARCODES_PER_PROMOTION)
+    products = ProductDB(make_catalogue(num_products))
+    promotions = [promotion for promotion
+                  in make_promotions(2 * num_promotions, num_products)
+                  if type(promotion) is promotion_type]
+    engine = PromotionEngine(promotions)
+
+    # Scan products covered by the promotions, so they all apply
+    rng = random.Random(0)
+    barcodes = sorted(set().union(*(promotion.eligible_barcodes
+                                    for promotion in promotions)))
+    scans = [(barcode, 1.0) for barcode in rng.choices(barcodes,
+                                                       k=num_items)]
+    basket_items = _make_basket_items(products, scans)
+
+    def get_discounts():
+        return list(engine.get_discounts(basket_items))
+
+    return get_discounts
+
+
+def _render_case(num_items: int) -> Callable[[], object]:
+    """Format an invoice as text, as in Invoice.to_string.
+
+    Each invoice formatted is a new one, for newly created basket items.
+    """
+
+    products = ProductDB(make_catalogue(num_items))
+    make_items = _make_items_factory(products,
+                                     make_scans(num_items, num_items))
+    engine = PromotionEngine(make_promotions(10, num_items))
+    formatter = ReceiptFormatter()
+
+    def render(invoice):
+        return formatter.format(invoice)
+
+    render.prepare = lambda: Invoice(make_items(), engine)
+    return render
+
+
+# Imports the package and prices a basket, in a new interpreter
+_COLD_START = """
+from shoppingbasket import Basket
+basket = Basket()
+basket.add_item("Beans", 0.5, barcode=1)
+basket.generate_invoice().total
+"""
+
+
+def _cold_start_case() -> Callable[[], object]:
+    """Start a new interpreter, import the package and price a basket.
+
+    This includes the time to start the interpreter itself, so catches
+    heavy dependencies (e.g. numpy) being imported eagerly again.
+    """
+
+    return lambda: subprocess.run([sys.executable, '-c', _COLD_START],
+                                  check=True)
+
+
+def _from_yaml_case(num_products: int) -> Callable[[], object]:
+    """Load a catalogue from a YAML file."""
+    import yaml
+
+    fd, path = tempfile.mkstemp(suffix='.yaml')
+    with os.fdopen(fd, 'w') as f:
+        yaml.safe_dump(make_catalogue(num_products), f, sort_keys=False)
+
+    def load():
+        return ProductDB.from_yaml(path)
+
+    # Remove the file once the benchmark is done with it
+    load.cleanup = lambda: os.remove(path)
+    return load
+
+
+def get_cases(max_items: int = ITEM_SCALES[-1],
+              max_promotions: int = PROMOTION_SCALES[-1]) -> list[_Case]:
+    """Get the benchmark cases, up to the given scales.
+
+    Args:
+        max_items: The largest number of items (or products) to benchmark.
+        max_promotions: The largest number of promotions to benchmark.
+
+    Returns:
+        The (name, size, setup) of each case, where setup returns the
+        function to time.
+    """
+
+    item_scales = [n for n in ITEM_SCALES if n <= max_items]
+    promotion_scales = [n for n in PROMOTION_SCALES if n <= max_promotions]
+    promotion_items = min(PROMOTION_BASKET_SIZE, max_items)
+
+    cases = [('cold_start', 1, _cold_start_case)]
+    for n in item_scales:
+        cases.append((f"scan[items={n}]", n,
+                      lambda n=n: _scan_case(n)))
+    for n in item_scales:
+        for fixed_point in (False, True):
+            mode = 'pence' if fixed_point else 'float'
+            cases.append((f"invoice[items={n},{mode}]", n,
+                          lambda n=n, fp=fixed_point: _invoice_case(n, fp)))
+    for promotion_type in (MForN, MForNPounds):
+        # Scale the basket (with 10 promotions), then the promotions (with
+        # a basket of PROMOTION_BASKET_SIZE items)
+        params = [(n, 10) for n in item_scales]
+        params += [(promotion_items, p) for p in promotion_scales
+                   if (promotion_items, p) not in params]
+        for n, p in params:
+            name = f"{promotion_type.__name__}[items={n},promotions={p}]"
+            cases.append((name, n,
+                          lambda t=promotion_type, n=n, p=p:
+                          _promotion_case(t, n, p)))
+    for n in item_scales:
+        cases.append((f"render[items={n}]", n,
+                      lambda n=n: _render_case(n)))
+    for n in item_scales:
+        cases.append((f"from_yaml[products={n}]", n,
+                      lambda n=n: _from_yaml_case(n)))
+    return cases
+
+
+def measure(name: str,
+            size: int,
+            func: Callable[[], object],
+            min_time: float = 0.5,
+            min_rounds: int = 3,
+            max_rounds: int = 1000) -> BenchmarkResult:
+    """Time a function, and trace its peak memory.
+
+    The function is called (after one warm up call) until it has run for
+    min_time seconds, at least min_rounds and at most max_rounds times. Its
+    peak memory is measured in a separate call, as tracing memory slows it
+    down. If the function has a prepare attribute, it is called before each
+    call, and only the function itself is timed (and traced).
+
+    Args:
+        name: The name of the benchmark.
+        size: The number of items processed by each call.
+        func: The function to time.
+        min_time: The minimum total time to run for, in seconds.
+        min_rounds: The minimum number of calls.
+        max_rounds: The maximum number of calls.
+
+    Returns:
+        The measurements of the benchmark.
+    """
+
+    prepare = getattr(func, 'prepare', None)
+
+    def get_args() -> tuple:
+        return () if prepare is None else (prepare(),)
+
+    func(*get_args())
+    timings = []
+    total = 0.0
+    while len(timings) < min_rounds \
+            or (total < min_time and len(timings) < max_rounds):
+        args = get_args()
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+
+    timings.sort()
+    latency_us = {str(p): _percentile(timings, p) * 1e6
+                  for p in PERCENTILES}
+
+    args = get_args()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    if not was_tracing:
+        tracemalloc.stop()
+
+    return BenchmarkResult(name=name,
+                           size=size,
+                           rounds=len(timings),
+                           throughput=size * len(timings) / total,
+                           latency_us=latency_us,
+                           peak_memory_kb=(peak - baseline) / 1024)
+
+
+def run(cases: list[_Case],
+        name_filter: Optional[str] = None,
+        **kwargs) -> Iterator[BenchmarkResult]:
+    """Run benchmark cases, one at a time.
+
+    Args:
+        cases: The cases to run, from get_cases.
+        name_filter: Only run cases with this in their name.
+        **kwargs: Passed to measure.
+
+    Yields:
+        The measurements of each case, as it finishes.
+    """
+
+    for name, size, setup in cases:
+        if name_filter and name_filter not in name:
+            continue
+        func = setup()
+        try:
+            yield measure(name, size, func, **kwargs)
+        finally:
+            if hasattr(func, 'cleanup'):
+                func.cleanup()
+
+
+def save_results(results: list[BenchmarkResult], path: str) -> None:
+    """Save results as a baseline (a JSON file)."""
+    data = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': [asdict(result) for result in results],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write('\n')
+
+
+def load_results(path: str) -> dict[str, BenchmarkResult]:
+    """Load a baseline saved by save_results, keyed by benchmark name."""
+    with open(path) as f:
+        data = json.load(f)
+    return {result['name']: BenchmarkResult(**result)
+            for result in data['results']}
+
+
+def compare(results: list[BenchmarkResult],
+            baseline: dict[str, BenchmarkResult],
+            threshold: float = 0.25) -> list[Comparison]:
+    """Compare results against a baseline.
+
+    A benchmark has regressed if its median latency or peak memory has grown
+    by more than threshold (as a fraction of the baseline). Benchmarks that
+    aren't in the baseline are skipped.
+
+    Args:
+        results: The results of the current run.
+        baseline: The baseline results, from load_results.
+        threshold: The largest allowed increase. Defaults to 0.25 (25%).
+
+    Returns:
+        The comparison of each benchmark in the baseline.
+    """
+
+    comparisons = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        latency_ratio = result.latency_us['50'] / base.latency_us['50']
+        # Allow for small allocations varying between runs
+        memory_ratio = (max(result.peak_memory_kb, 1.0)
+                        / max(base.peak_memory_kb, 1.0))
+        is_regression = latency_ratio > 1 + threshold \
+            or memory_ratio > 1 + threshold
+        comparisons.append(Comparison(result.name, latency_ratio,
+                                      memory_ratio, is_regression))
+    return comparisons
+
+
+def _percentile(sorted_values: list[float], percentile: float) -> float:
+    """The percentile of sorted values (by linear interpolation)."""
+    position = (len(sorted_values) - 1) * percentile / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] * (1 - fraction) \
+        + sorted_values[upper] * fraction
+
+
+def _format_result(result: BenchmarkResult) -> str:
+    latency = '  '.join(f"p{p} {result.latency_us[str(p)]:>11.1f}"
+                        for p in PERCENTILES)
+    return (f"{result.name:<44} {result.throughput:>12,.0f} items/s  "
+            f"{latency} us  {result.peak_memory_kb:>10,.1f} KiB")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--max-items', type=int, default=ITEM_SCALES[-1],
+                        help="the largest number of items to benchmark")
+    parser.add_argument('--max-promotions', type=int,
+                        default=PROMOTION_SCALES[-1],
+                        help="the largest number of promotions to benchmark")
+    parser.add_argument('--filter', dest='name_filter',
+                        help="only run benchmarks with this in their name")
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="the minimum time to run each benchmark for")
+    parser.add_argument('--save', metavar='PATH',
+                        help="save the results as a baseline")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="compare the results with a saved baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="the largest allowed slowdown (as a fraction)")
+    args = parser.parse_args(argv)
+
+    results = []
+    cases = get_cases(args.max_items, args.max_promotions)
+    for result in run(cases, args.name_filter, min_time=args.min_time):
+        print(_format_result(result), flush=True)
+        results.append(result)
+
+    if args.save:
+        save_results(results, args.save)
+
+    if args.compare:
+        comparisons = compare(results, load_results(args.compare),
+                              args.threshold)
+        print()
+        for comparison in comparisons:
+            flag = 'REGRESSION' if comparison.is_regression else ''
+            print(f"{comparison.name:<44} "
+                  f"latency x{comparison.latency_ratio:.2f}  "
+                  f"memory x{comparison.memory_ratio:.2f}  {flag}")
+        if any(comparison.is_regression for comparison in comparisons):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import sys
+from array import array
+from collections.abc import MutableSequence
+from typing import Iterable, Iterator, Optional, Union
+
+from shoppingbasket.basket_item import BasketItem
+
+# Stored in place of a barcode for items without one
+_NO_BARCODE = -2 ** 63
+
+# Stored in place of a string (name or units) that is None
+_NO_STRING = 0
+
+
+class ColumnarBasketItems(MutableSequence):
+    """A compact store for a large number of basket items.
+
+    Instead of keeping a BasketItem object per item, the barcodes, unit prices
+    and quantities are stored in typed arrays, and names and units are stored
+    as indexes into a pool of interned strings. Each item then takes a fixed
+    32 bytes, however many times its name is repeated.
+
+    This behaves like a list of basket items, so it can be used in place of
+    the basket_items list of a Basket. BasketItem views are created when items
+    are accessed, so they can be passed to an Invoice or the promotions.
+    Discounts cannot be stored.
+    """
+
+    def __init__(self, basket_items: Iterable[BasketItem] = ()) -> None:
+        """Initialise the store.
+
+        Args:
+            basket_items: The initial items in the store.
+        """
+
+        self._barcodes = array('q')
+        self._unit_prices = array('d')
+        self._quantities = array('d')
+        self._names = array('I')
+        self._units = array('I')
+
+        self._strings: list[Optional[str]] = [None]
+        self._string_ids: dict[str, int] = {}
+
+        self.extend(basket_items)
+
+    def __len__(self) -> int:
+        return len(self._barcodes)
+
+    def __getitem__(
+            self,
+            index: Union[int, slice]
+    ) -> Union[BasketItem, list[BasketItem]]:
+        if isinstance(index, slice):
+            return [self._get_item(i)
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("basket item index out of range")
+        return self._get_item(index)
+
+    def __setitem__(self, index: int, basket_item: BasketItem) -> None:
+        barcode, unit_price, quantity, name, units = self._encode(basket_item)
+        self._barcodes[index] = barcode
+        self._unit_prices[index] = unit_price
+        self._quantities[index] = quantity
+        self._names[index] = name
+        self._units[index] = units
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        for column in self._columns:
+            del column[index]
+
+    def __iter__(self) -> Iterator[BasketItem]:
+        strings = self._strings
+        for barcode, unit_price, quantity, name, units in zip(*self._columns):
+            if barcode == _NO_BARCODE:
+                barcode = None
+            yield BasketItem(strings[name],
+                             unit_price,
+                             barcode=barcode,
+                             units=strings[units],
+                             quantity=quantity)
+
+    def insert(self, index: int, basket_item: BasketItem) -> None:
+        for column, value in zip(self._columns, self._encode(basket_item)):
+            column.insert(index, value)
+
+    def append(self, basket_item: BasketItem) -> None:
+        for column, value in zip(self._columns, self._encode(basket_item)):
+            column.append(value)
+
+    @property
+    def nbytes(self) -> int:
+        """The approximate memory used by the store, in bytes.
+
+        This includes the arrays and the string pool (but not the strings
+        themselves, which are shared with the rest of the program).
+        """
+
+        arrays_size = sum(column.itemsize * len(column)
+                          for column in self._columns)
+        return (arrays_size
+                + sys.getsizeof(self._strings)
+                + sys.getsizeof(self._string_ids))
+
+    @property
+    def _columns(self) -> tuple[array, ...]:
+        """The arrays storing each field, in the order used by _encode."""
+        return (self._barcodes, self._unit_prices, self._quantities,
+                self._names, self._units)
+
+    def _get_item(self, index: int) -> BasketItem:
+        """Create a basket item from the values at an index of the arrays."""
+        barcode = self._barcodes[index]
+        return BasketItem(self._strings[self._names[index]],
+                          self._unit_prices[index],
+                          barcode=None if barcode == _NO_BARCODE else barcode,
+                          units=self._strings[self._units[index]],
+                          quantity=self._quantities[index])
+
+    def _encode(
+            self,
+            basket_item: BasketItem
+    ) -> tuple[int, float, float, int, int]:
+        """Convert a basket item to the values stored in each array.
+
+        Raises:
+            TypeError: If the item is not a plain BasketItem (e.g. a Discount).
+        """
+
+        if type(basket_item) is not BasketItem:
+            item_type = type(basket_item).__name__
+            raise TypeError(f"Cannot store {item_type} in columnar store.")
+
+        barcode = basket_item.barcode
+        return (_NO_BARCODE if barcode is None else barcode,
+                basket_item.unit_price,
+                basket_item.quantity,
+                self._intern(basket_item.name),
+                self._intern(basket_item.units))
+
+    def _intern(self, string: Optional[str]) -> int:
+        """Get the index of a string in the string pool, adding if needed."""
+        if string is None:
+            return _NO_STRING
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(sys.intern(string))
+            self._string_ids[string] = string_id
+        return string_id
@@ -0,0 +1,278 @@
+import json
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    import pyarrow
+    from shoppingbasket.invoice import Invoice
+
+_ITEM_FIELDS = ('name', 'barcode', 'units', 'quantity', 'unit_price',
+                'line_price_pence')
+_DISCOUNT_FIELDS = ('name', 'quantity', 'line_price_pence')
+_TOTAL_FIELDS = ('subtotal_pence', 'discount_total_pence', 'total_pence')
+
+_FORMATS = ('parquet', 'arrow')
+
+
+def invoice_to_dict(invoice: 'Invoice') -> dict[str, Any]:
+    """Convert an invoice to a record of plain Python values.
+
+    Items and discounts are stored by column (a list per field) rather than
+    as a dict per item, and prices are in integer pence, as in a fixed point
+    invoice. Discounts are named after their promotions.
+
+    Args:
+        invoice: The invoice to convert.
+
+    Returns:
+        The items, discounts and totals of the invoice.
+    """
+
+    columns = _InvoiceColumns()
+    columns.append(invoice)
+    return {
+        'items': {name: columns.items[name] for name in _ITEM_FIELDS},
+        'discounts': {name: columns.discounts[name]
+                      for name in _DISCOUNT_FIELDS},
+        **{name: columns.totals[name][0] for name in _TOTAL_FIELDS},
+    }
+
+
+def invoice_to_json(invoice: 'Invoice') -> str:
+    """Convert an invoice to JSON (see invoice_to_dict)."""
+    return json.dumps(invoice_to_dict(invoice), ensure_ascii=False,
+                      separators=(',', ':'))
+
+
+def invoice_to_msgpack(invoice: 'Invoice') -> bytes:
+    """Convert an invoice to MessagePack (see invoice_to_dict).
+
+    Requires the msgpack package.
+    """
+
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ImportError("Exporting to MessagePack requires msgpack "
+                          "(pip install msgpack).") from e
+    return msgpack.packb(invoice_to_dict(invoice))
+
+
+def invoice_to_arrow(
+        invoice: 'Invoice',
+        invoice_id: Optional[int] = None
+) -> 'pyarrow.RecordBatch':
+    """Convert an invoice to an Arrow record batch with a single row.
+
+    See InvoiceWriter for the schema. Requires the pyarrow package.
+    """
+
+    columns = _InvoiceColumns()
+    columns.append(invoice, invoice_id)
+    return columns.to_record_batch()
+
+
+class InvoiceWriter:
+    """Writes many invoices to a single Parquet or Arrow file.
+
+    Invoices are added to columns of plain values as they are written, and
+    converted to an Arrow record batch (and written to the file) every
+    batch_size invoices. Each row of the file is an invoice, with columns:
+
+    - invoice_id: The id given when writing the invoice.
+    - items: A list of (name, barcode, units, quantity, unit_price,
+      line_price_pence) structs.
+    - discounts: A list of (name, quantity, line_price_pence) structs, named
+      after their promotions.
+    - subtotal_pence, discount_total_pence and total_pence.
+
+    Requires the pyarrow package.
+
+    Attributes:
+        path: The path of the file.
+        format: The format of the file, 'parquet' or 'arrow' (the Arrow IPC
+            file format).
+        batch_size: The number of invoices in each record batch.
+        num_written: The number of invoices written.
+    """
+
+    def __init__(self,
+                 path: str,
+                 format: str = 'parquet',
+                 batch_size: int = 1024) -> None:
+        """Open a file to write invoices to.
+
+        Args:
+            path: The path of the file.
+            format: The format of the file, 'parquet' or 'arrow'. Defaults to
+                'parquet'.
+            batch_size: The number of invoices in each record batch. Defaults
+                to 1024.
+
+        Raises:
+            ValueError: If the format is not supported.
+        """
+
+        if format not in _FORMATS:
+            raise ValueError(f"Unsupported format {format!r}, expected one "
+                             f"of {_FORMATS}.")
+
+        pa = _import_pyarrow()
+        self.path = path
+        self.format = format
+        self.batch_size = batch_size
+        self.num_written = 0
+        self._columns = _InvoiceColumns()
+
+        schema = _get_schema()
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, schema)
+        else:
+            self._writer = pa.ipc.new_file(path, schema)
+
+    def write(self, invoice: 'Invoice',
+              invoice_id: Optional[int] = None) -> None:
+        """Add an invoice to the file.
+
+        Args:
+            invoice: The invoice to write.
+            invoice_id: The id of the invoice. Defaults to the number of
+                invoices written before it.
+        """
+
+        if invoice_id is None:
+            invoice_id = self.num_written
+        self._columns.append(invoice, invoice_id)
+        self.num_written += 1
+        if len(self._columns) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the invoices added since the last record batch."""
+        if len(self._columns):
+            batch = self._columns.to_record_batch()
+            if self.format == 'parquet':
+                self._writer.write_batch(batch)
+            else:
+                self._writer.write(batch)
+            self._columns = _InvoiceColumns()
+
+    def close(self) -> None:
+        """Write any remaining invoices, and close the file."""
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self) -> 'InvoiceWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _InvoiceColumns:
+    """The items, discounts and totals of invoices, stored by column.
+
+    Items and discounts are flattened into columns for all invoices, with
+    the offset of each invoice's first item (and discount), as in Arrow list
+    arrays.
+    """
+
+    def __init__(self) -> None:
+        self.invoice_ids = []
+        self.items = {name: [] for name in _ITEM_FIELDS}
+        self.discounts = {name: [] for name in _DISCOUNT_FIELDS}
+        self.totals = {name: [] for name in _TOTAL_FIELDS}
+        self.item_offsets = [0]
+        self.discount_offsets = [0]
+
+    def __len__(self) -> int:
+        return len(self.invoice_ids)
+
+    def append(self, invoice: 'Invoice',
+               invoice_id: Optional[int] = None) -> None:
+        """Add an invoice to the columns."""
+        names, barcodes, units, quantities, unit_prices, line_prices = \
+            (self.items[name] for name in _ITEM_FIELDS)
+        start = len(line_prices)
+        for item in invoice.basket_items:
+            names.append(item.name)
+            barcodes.append(item.barcode)
+            units.append(item.units)
+            quantities.append(item.quantity)
+            unit_prices.append(item.unit_price)
+            line_prices.append(item.line_price_pence)
+        subtotal = sum(line_prices[start:])
+
+        names, quantities, line_prices = \
+            (self.discounts[name] for name in _DISCOUNT_FIELDS)
+        discount_start = len(line_prices)
+        for discount in invoice.discounts:
+            names.append(discount.name)
+            quantities.append(discount.quantity)
+            line_prices.append(discount.line_price_pence)
+        discount_total = sum(line_prices[discount_start:])
+
+        self.invoice_ids.append(invoice_id)
+        self.totals['subtotal_pence'].append(subtotal)
+        self.totals['discount_total_pence'].append(discount_total)
+        self.totals['total_pence'].append(subtotal + discount_total)
+        self.item_offsets.append(len(self.items['name']))
+        self.discount_offsets.append(len(self.discounts['name']))
+
+    def to_record_batch(self) -> 'pyarrow.RecordBatch':
+        """Convert the columns to an Arrow record batch."""
+        pa = _import_pyarrow()
+        schema = _get_schema()
+
+        def list_array(field_name: str, columns: dict[str, list],
+                       offsets: list[int]) -> 'pyarrow.ListArray':
+            struct_type = schema.field(field_name).type.value_type
+            values = pa.StructArray.from_arrays(
+                [pa.array(columns[field.name], type=field.type)
+                 for field in struct_type],
+                fields=list(struct_type))
+            return pa.ListArray.from_arrays(
+                pa.array(offsets, type=pa.int32()), values)
+
+        arrays = [
+            pa.array(self.invoice_ids, type=pa.int64()),
+            list_array('items', self.items, self.item_offsets),
+            list_array('discounts', self.discounts, self.discount_offsets),
+            *(pa.array(self.totals[name], type=pa.int64())
+              for name in _TOTAL_FIELDS),
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _get_schema() -> 'pyarrow.Schema':
+    """The Arrow schema of exported invoices."""
+    pa = _import_pyarrow()
+    item_type = pa.struct([
+        ('name', pa.string()),
+        ('barcode', pa.int64()),
+        ('units', pa.string()),
+        ('quantity', pa.float64()),
+        ('unit_price', pa.float64()),
+        ('line_price_pence', pa.int64()),
+    ])
+    discount_type = pa.struct([
+        ('name', pa.string()),
+        ('quantity', pa.float64()),
+        ('line_price_pence', pa.int64()),
+    ])
+    return pa.schema([
+        ('invoice_id', pa.int64()),
+        ('items', pa.list_(item_type)),
+        ('discounts', pa.list_(discount_type)),
+        *((name, pa.int64()) for name in _TOTAL_FIELDS),
+    ])
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is only needed for Arrow and Parquet exports."""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Exporting to Arrow or Parquet requires pyarrow "
+                          "(pip install pyarrow).") from e
+    return pyarrow
@@ -0,0 +1,266 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Labels of a metric, as (name, value) pairs
+Labels = tuple[tuple[str, str], ...]
+
+# The recorder that hot paths report to, or None if instrumentation is
+# disabled. Hot paths only check this, so it costs next to nothing when
+# disabled.
+recorder: Optional['Recorder'] = None
+
+# Metric names
+STAGE_SECONDS = 'stage_seconds'
+PROMOTION_SECONDS = 'promotion_seconds'
+SCANS = 'scans_total'
+LOOKUP_MISSES = 'lookup_misses_total'
+DISCOUNTS = 'discounts_total'
+ELIGIBLE_ITEMS_SCANNED = 'eligible_items_scanned_total'
+PROMOTION_CACHE_LOOKUPS = 'promotion_cache_lookups_total'
+
+# Stage labels
+LOOKUP = (('stage', 'lookup'),)
+DISCOUNTS_STAGE = (('stage', 'discounts'),)
+RENDER = (('stage', 'render'),)
+
+# Cache result labels
+CACHE_HIT = (('result', 'hit'),)
+CACHE_MISS = (('result', 'miss'),)
+
+_DESCRIPTIONS = {
+    STAGE_SECONDS: "Time spent in each stage of pricing a basket.",
+    PROMOTION_SECONDS: "Time spent calculating the discounts of each "
+                       "promotion.",
+    SCANS: "Items scanned by barcode.",
+    LOOKUP_MISSES: "Scanned barcodes not found in the product database.",
+    DISCOUNTS: "Discounts generated by each promotion.",
+    ELIGIBLE_ITEMS_SCANNED: "Basket items checked for eligibility by each "
+                            "promotion.",
+    PROMOTION_CACHE_LOOKUPS: "Lookups in the promotion discount cache, by "
+                             "result.",
+}
+
+# Histogram bucket upper bounds, in seconds (from 10us to 10s)
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3,
+                   5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+class Recorder(ABC):
+    """Receives counters and timings from the instrumented hot paths.
+
+    Subclass this to send metrics elsewhere (e.g. to OpenTelemetry
+    instruments, keyed by name), or use Metrics to collect them in memory.
+    """
+
+    @abstractmethod
+    def increment(self, name: str, value: float = 1,
+                  labels: Labels = ()) -> None:
+        """Add to a counter.
+
+        Args:
+            name: The name of the counter.
+            value: The amount to add. Defaults to 1.
+            labels: The labels of the counter, as (name, value) pairs.
+        """
+
+    @abstractmethod
+    def observe(self, name: str, seconds: float,
+                labels: Labels = ()) -> None:
+        """Record a timing.
+
+        Args:
+            name: The name of the timing.
+            seconds: The time taken, in seconds.
+            labels: The labels of the timing, as (name, value) pairs.
+        """
+
+
+class Metrics(Recorder):
+    """Collects counters and timing histograms in memory.
+
+    Metrics can be read directly, or exported in the Prometheus text format
+    (e.g. to serve from a /metrics endpoint).
+
+    Attributes:
+        buckets: The upper bounds of the histogram buckets, in seconds.
+        counters: The value of each counter, keyed by name and labels.
+        histograms: The count in each bucket (and above the last), the sum
+            and the count of each timing, keyed by name and labels.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Initialise empty metrics.
+
+        Args:
+            buckets: The upper bounds of the histogram buckets, in seconds.
+                Defaults to DEFAULT_BUCKETS.
+        """
+
+        self.buckets = tuple(sorted(buckets))
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], list] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1,
+                  labels: Labels = ()) -> None:
+        key = name, labels
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float,
+                labels: Labels = ()) -> None:
+        key = name, labels
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # Bucket counts, sum, count
+                histogram = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.histograms[key] = histogram
+            histogram[0][bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def get_counter(self, name: str, labels: Labels = ()) -> float:
+        """The value of a counter (0 if it hasn't been incremented)."""
+        return self.counters.get((name, labels), 0)
+
+    def get_timing(self, name: str,
+                   labels: Labels = ()) -> tuple[int, float]:
+        """The number of timings recorded, and their total in seconds."""
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            return 0, 0.0
+        return histogram[2], histogram[1]
+
+    def reset(self) -> None:
+        """Clear all metrics."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self, prefix: str = 'shoppingbasket_') -> str:
+        """Export the metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix: Added to the name of each metric. Defaults to
+                'shoppingbasket_'.
+
+        Returns:
+            The metrics, one sample per line.
+        """
+
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(buckets), total, count)
+                          for key, (buckets, total, count)
+                          in self.histograms.items()}
+
+        lines = []
+        for name, samples in _group_by_name(counters).items():
+            lines.extend(_metadata(prefix + name, name, 'counter'))
+            for labels, value in samples:
+                lines.append(f"{prefix}{name}{_format_labels(labels)} "
+                             f"{_format_value(value)}")
+
+        for name, samples in _group_by_name(histograms).items():
+            lines.extend(_metadata(prefix + name, name, 'histogram'))
+            for labels, (buckets, total, count) in samples:
+                cumulative = 0
+                bounds = [*map(_format_value, self.buckets), '+Inf']
+                for bound, bucket_count in zip(bounds, buckets):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (('le', bound),)
+                    lines.append(f"{prefix}{name}_bucket"
+                                 f"{_format_labels(bucket_labels)} "
+                                 f"{cumulative}")
+                lines.append(f"{prefix}{name}_sum{_format_labels(labels)} "
+                             f"{_format_value(total)}")
+                lines.append(f"{prefix}{name}_count{_format_labels(labels)} "
+                             f"{count}")
+        return ''.join(line + '\n' for line in lines)
+
+
+def enable(new_recorder: Optional[Recorder] = None) -> Recorder:
+    """Start reporting metrics from the hot paths.
+
+    Args:
+        new_recorder: The recorder to report to. Defaults to a new Metrics.
+
+    Returns:
+        The recorder.
+    """
+
+    global recorder
+    recorder = new_recorder if new_recorder is not None else Metrics()
+    return recorder
+
+
+def disable() -> None:
+    """Stop reporting metrics."""
+    global recorder
+    recorder = None
+
+
+@contextmanager
+def recording(
+        new_recorder: Optional[Recorder] = None
+) -> Iterator[Recorder]:
+    """Report metrics to a recorder within a block.
+
+    The previous recorder (if any) is restored afterwards.
+    """
+
+    global recorder
+    previous = recorder
+    try:
+        yield enable(new_recorder)
+    finally:
+        recorder = previous
+
+
+def record_lookup(active: Recorder, start: float, num_scans: int,
+                  num_missing: int) -> None:
+    """Record a product lookup that started at start (a perf_counter)."""
+    active.observe(STAGE_SECONDS, time.perf_counter() - start, LOOKUP)
+    active.increment(SCANS, num_scans)
+    if num_missing:
+        active.increment(LOOKUP_MISSES, num_missing)
+
+
+def _group_by_name(metrics: dict) -> dict[str, list]:
+    """Group metrics keyed by (name, labels) by name, sorted by labels."""
+    grouped = {}
+    for (name, labels), value in sorted(metrics.items()):
+        grouped.setdefault(name, []).append((labels, value))
+    return grouped
+
+
+def _metadata(full_name: str, name: str, metric_type: str) -> list[str]:
+    lines = []
+    if name in _DESCRIPTIONS:
+        lines.append(f"# HELP {full_name} {_DESCRIPTIONS[name]}")
+    lines.append(f"# TYPE {full_name} {metric_type}")
+    return lines
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"'
+                          for name, value in labels) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -1,98 +1,193 @@
-from dataclasses import dataclass
-from typing import Iterable, Optional, Iterator
-
-from texttable import Texttable
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional, Iterator, Union
 
+from shoppingbasket import export, instrumentation
 from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.money import from_pence
+from shoppingbasket.promotion_engine import PromotionEngine
 from shoppingbasket.promotions import Promotion
+from shoppingbasket.receipt import ReceiptFormatter
+
+# Line to separate sections of the invoice
+_ROW_SEPARATOR = ('-' * 20, '-' * 6)
 
 
 @dataclass
 class Invoice:
     """An invoice for a shopping basket.
 
+    By default, prices are floats in pounds. With fixed_point set, all totals
+    (and the prices on the printed invoice) are instead calculated from whole
+    numbers of pence, so they are not affected by float error. The line
+    price in pence of each item is calculated once, and kept on the invoice.
+
+    Like the discounts, the printable invoice is only generated once (the
+    first time it is needed), so the basket items shouldn't be changed after
+    the invoice is created.
+
     Attributes:
         basket_items: The items in the basket.
-        promotions: The promotions applied to the basket.
+        promotions: The promotions applied to the basket, either as a list or
+            as a PromotionEngine (to reuse its barcode index across invoices).
+        fixed_point: Whether to calculate totals in integer pence. Defaults to
+            False.
     """
 
     basket_items: Iterable[BasketItem]
-    promotions: Optional[list[Promotion]] = None
+    promotions: Optional[Union[list[Promotion], PromotionEngine]] = None
+    fixed_point: bool = False
+
+    # Cached line prices in pence of the basket items (for fixed point)
+    _items_pence: Optional[list[int]] = field(default=None, init=False,
+                                              repr=False, compare=False)
+    # Cached printable invoice
+    _string: Optional[str] = field(default=None, init=False, repr=False,
+                                   compare=False)
 
     def __post_init__(self):
+        recorder = instrumentation.recorder
+        if recorder is None:
+            self.discounts = list(self.get_discounts())
+            return
+
+        start = time.perf_counter()
         self.discounts = list(self.get_discounts())
+        recorder.observe(instrumentation.STAGE_SECONDS,
+                         time.perf_counter() - start,
+                         instrumentation.DISCOUNTS_STAGE)
 
     def get_discounts(self) -> Iterator[Discount]:
         """Calculate the discounts for the basket."""
         if self.promotions is not None:
-            for promotion in self.promotions:
-                yield from promotion.get_discounts(self.basket_items)
+            engine = self.promotions
+            if not isinstance(engine, PromotionEngine):
+                engine = PromotionEngine(engine)
+            yield from engine.get_discounts(self.basket_items)
 
     @property
     def subtotal(self) -> float:
         """The total price of items in the basket before discounts."""
+        if self.fixed_point:
+            return from_pence(self.subtotal_pence)
         return sum(item.line_price for item in self.basket_items)
 
     @property
     def discount_total(self) -> float:
         """The total price of discounts in the basket."""
+        if self.fixed_point:
+            return from_pence(self.discount_total_pence)
         total = sum(discount.line_price for discount in self.discounts)
         return round(total, 2)
 
     @property
     def total(self) -> float:
         """The total price of items in the basket after discounts."""
+        if self.fixed_point:
+            return from_pence(self.total_pence)
         return self.subtotal + self.discount_total
 
-    def to_string(self) -> str:
-        """Generate a printable invoice in table format."""
+    @property
+    def subtotal_pence(self) -> int:
+        """The total price in pence of items in the basket."""
+        return sum(self._get_items_pence())
 
-        # Line to separate sections of the invoice
-        row_separator = ['-' * 20, '-' * 6]
+    @property
+    def discount_total_pence(self) -> int:
+        """The total price in pence of discounts in the basket."""
+        return sum(discount.line_price_pence for discount in self.discounts)
 
-        # Create a table for the invoice
-        tbl = Texttable()
-        tbl.set_deco(Texttable.HEADER)
-        tbl.set_header_align(['l', 'r'])
-        tbl.set_cols_align(['l', 'r'])
-        tbl.set_cols_valign(['m', 'b'])
-        tbl.header(['Item', 'Price'])
+    @property
+    def total_pence(self) -> int:
+        """The total price in pence of items in the basket after discounts."""
+        return self.subtotal_pence + self.discount_total_pence
+
+    def to_string(self) -> str:
+        """Generate a printable invoice in table format."""
+        if self._string is None:
+            recorder = instrumentation.recorder
+            if recorder is not None:
+                start = time.perf_counter()
+            self._string = ReceiptFormatter().format(self)
+            if recorder is not None:
+                recorder.observe(instrumentation.STAGE_SECONDS,
+                                 time.perf_counter() - start,
+                                 instrumentation.RENDER)
+        return self._string
+
+    def to_dict(self) -> dict[str, Any]:
+        """The items, discounts and totals as plain values (see export)."""
+        return export.invoice_to_dict(self)
+
+    def to_json(self) -> str:
+        """The items, discounts and totals as JSON."""
+        return export.invoice_to_json(self)
+
+    def to_msgpack(self) -> bytes:
+        """The items, discounts and totals as MessagePack."""
+        return export.invoice_to_msgpack(self)
+
+    def to_arrow(self,
+                 invoice_id: Optional[int] = None) -> 'pyarrow.RecordBatch':
+        """The items, discounts and totals as an Arrow record batch."""
+        return export.invoice_to_arrow(self, invoice_id)
+
+    def get_rows(self) -> list[tuple[str, str]]:
+        """The rows of the printable invoice (without the header).
+
+        Each row is a pair of strings: the description and the price.
+        """
 
-        # Add basket items
-        tbl.add_rows(self._get_product_lines(), header=False)
-        tbl.add_row(row_separator)
-        tbl.add_row([f"Sub-total", f"£{self.subtotal:.2f}"])
+        rows = self._get_product_lines()
+        rows.append(_ROW_SEPARATOR)
+        rows.append(("Sub-total", f"£{self.subtotal:.2f}"))
 
         # Add discounts
         if self.discount_total != 0:
-            tbl.add_row(row_separator)
-            tbl.add_row(['Savings', ''])
-            tbl.add_row(row_separator)
-            tbl.add_rows(self._get_discount_lines(), header=False)
-            tbl.add_row(row_separator)
-            tbl.add_row([f"Total savings", f"£{self.discount_total:.2f}"])
-
-        tbl.add_row(row_separator)
-        tbl.add_row([f"Total to pay", f"£{self.total:.2f}"])
-
-        return tbl.draw()
-
-    def _get_product_lines(self) -> list[list[str]]:
+            rows.append(_ROW_SEPARATOR)
+            rows.append(('Savings', ''))
+            rows.append(_ROW_SEPARATOR)
+            rows.extend(self._get_discount_lines())
+            rows.append(_ROW_SEPARATOR)
+            rows.append(("Total savings", f"£{self.discount_total:.2f}"))
+
+        rows.append(_ROW_SEPARATOR)
+        rows.append(("Total to pay", f"£{self.total:.2f}"))
+        return rows
+
+    def _get_product_lines(self) -> list[tuple[str, str]]:
         """The lines for the products in the basket.
 
-        Each line is a list of two strings: the item description and the item.
+        Each line is a pair of strings: the item description and the price.
         """
 
-        product_lines = [[f"{item.description}", f"£{item.line_price:.2f}"]
-                         for item in self.basket_items]
+        if self.fixed_point:
+            prices = map(from_pence, self._get_items_pence())
+        else:
+            prices = (item.line_price for item in self.basket_items)
+        product_lines = [(item.description, f"£{price:.2f}")
+                         for item, price in zip(self.basket_items, prices)]
         return product_lines
 
-    def _get_discount_lines(self) -> list[list[str]]:
+    def _get_discount_lines(self) -> list[tuple[str, str]]:
         """The lines for the discounts in the basket.
 
-        Each line is a list of two strings: the discount description and the
+        Each line is a pair of strings: the discount description and the
         discount amount.
         """
 
-        return [[f"{discount.name}", f"£{discount.line_price:.2f}"]
+        return [(discount.description, f"£{self._line_price(discount):.2f}")
                 for discount in self.discounts]
+
+    def _line_price(self, item: BasketItem) -> float:
+        """The line price of an item, in pence if using fixed point."""
+        if self.fixed_point:
+            return from_pence(item.line_price_pence)
+        return item.line_price
+
+    def _get_items_pence(self) -> list[int]:
+        """The line prices in pence of the basket items (calculated once)."""
+        if self._items_pence is None:
+            self._items_pence = [item.line_price_pence
+                                 for item in self.basket_items]
+        return self._items_pence
@@ -0,0 +1,83 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Optional
+
+PENCE_PER_POUND = 100
+
+_PENCE_EXPONENT = Decimal(1)
+
+# Below this many pence, float error in a price (or line price) is far
+# smaller than _HALF_PENNY_TOLERANCE, so rounding the float gives the same
+# result as exact decimal arithmetic unless it is within the tolerance of
+# half a penny
+_FLOAT_PENCE_LIMIT = 1e8
+_HALF_PENNY_TOLERANCE = 1e-6
+
+
+def to_pence(amount: float) -> int:
+    """Convert an amount in pounds to a whole number of pence.
+
+    The amount is converted via its shortest decimal representation, so e.g.
+    1.15 becomes 115 pence rather than being affected by float error. Halves
+    are rounded to even, the same as Python's round(). Exact (Decimal)
+    arithmetic is only needed for amounts within float error of half a
+    penny, so other amounts are rounded directly, which is much faster.
+
+    Args:
+        amount: The amount in pounds.
+
+    Returns:
+        The amount in pence.
+    """
+
+    pence = _round_float_pence(amount * PENCE_PER_POUND)
+    if pence is not None:
+        return pence
+    return _round_pence(Decimal(repr(amount)) * PENCE_PER_POUND)
+
+
+def line_pence(unit_price: float, quantity: float = 1.0) -> int:
+    """The price in pence of a quantity of an item.
+
+    The result is the same as multiplying exactly before rounding to the
+    nearest penny.
+
+    Args:
+        unit_price: The price of a single unit in pounds.
+        quantity: The amount of the item.
+
+    Returns:
+        The line price in pence.
+    """
+
+    if quantity == 1:
+        return to_pence(unit_price)
+    pence = _round_float_pence(unit_price * quantity * PENCE_PER_POUND)
+    if pence is not None:
+        return pence
+    pence = Decimal(repr(unit_price)) * Decimal(repr(quantity))
+    return _round_pence(pence * PENCE_PER_POUND)
+
+
+def from_pence(pence: int) -> float:
+    """Convert a whole number of pence to an amount in pounds."""
+    return pence / PENCE_PER_POUND
+
+
+def _round_float_pence(pence: float) -> Optional[int]:
+    """Round a float number of pence, if float error can't change it.
+
+    Returns:
+        The rounded pence, or None if exact arithmetic is needed (for
+        amounts close to half a penny, very large amounts, or NaN).
+    """
+
+    rounded = round(pence) if abs(pence) < _FLOAT_PENCE_LIMIT else None
+    if (rounded is None
+            or abs(abs(pence - rounded) - 0.5) <= _HALF_PENNY_TOLERANCE):
+        return None
+    return rounded
+
+
+def _round_pence(pence: Decimal) -> int:
+    """Round an exact number of pence to a whole number (half to even)."""
+    return int(pence.quantize(_PENCE_EXPONENT, rounding=ROUND_HALF_EVEN))
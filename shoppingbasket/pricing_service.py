@@ -0,0 +1,218 @@
+import asyncio
+import os
+import warnings
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (AsyncIterable, AsyncIterator, Iterable, Iterator,
+                    Optional, Union)
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.invoice import Invoice
+from shoppingbasket.product_db import ProductBackend, ProductDB
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import Promotion
+
+# A basket job: the (barcode, quantity) pairs scanned into the basket
+Scans = list[tuple[int, float]]
+
+# A priced basket, as sent back from a worker: the basket items, the
+# discounts and the barcodes that weren't found
+_Result = tuple[list[BasketItem], list[Discount], list[int]]
+
+# The products and promotions of a worker process, loaded once when it starts
+_worker_products: Optional[ProductBackend] = None
+_worker_promotions: Optional[PromotionEngine] = None
+
+
+class PricingService:
+    """Prices baskets in parallel, across a pool of worker processes.
+
+    Each worker loads the products and promotions once, when it starts, and
+    then prices baskets sent to it as lists of (barcode, quantity) scans.
+    Products can be given as the path of a ProductSnapshot file, which each
+    worker memory maps (so the workers share a single copy of the catalogue
+    through the page cache), or as a ProductDB, which is copied to each
+    worker.
+
+    Baskets are sent to the workers in chunks, and the invoices are returned
+    in the same order as the baskets. To apply backpressure, at most
+    max_pending chunks are in flight at once: the next baskets aren't read
+    from the input until earlier invoices have been returned.
+
+    The invoices returned have their discounts, but not their promotions
+    (which stay in the workers).
+
+    Attributes:
+        max_workers: The number of worker processes.
+        chunk_size: The number of baskets sent to a worker at once.
+        max_pending: The maximum number of chunks being priced at once.
+    """
+
+    def __init__(self,
+                 products: Union[str, ProductDB],
+                 promotions: Optional[Union[list[Promotion],
+                                            PromotionEngine]] = None,
+                 max_workers: Optional[int] = None,
+                 chunk_size: int = 16,
+                 max_pending: Optional[int] = None,
+                 fixed_point: bool = False) -> None:
+        """Start a pricing service.
+
+        Args:
+            products: The path of a product snapshot file, or a ProductDB.
+            promotions: The promotions to apply to every basket.
+            max_workers: The number of worker processes. Defaults to the
+                number of CPUs.
+            chunk_size: The number of baskets sent to a worker at once.
+                Defaults to 16.
+            max_pending: The maximum number of chunks being priced at once.
+                Defaults to twice the number of workers.
+            fixed_point: Whether invoices are calculated in integer pence.
+                Defaults to False.
+        """
+
+        if isinstance(products, ProductDB):
+            # Send each worker a copy of the current products (without the
+            # update history)
+            products = ProductDB(products.iter_products())
+        if promotions is not None \
+                and not isinstance(promotions, PromotionEngine):
+            promotions = PromotionEngine(promotions)
+
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            self.max_workers, initializer=_init_worker,
+            initargs=(products, promotions))
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 2 * self.max_workers
+        self.fixed_point = fixed_point
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self._executor.shutdown()
+
+    def __enter__(self) -> 'PricingService':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def price(self, scans: Scans) -> Invoice:
+        """Price a single basket."""
+        future = self._executor.submit(_price_chunk, [scans])
+        return self._to_invoices(future.result())[0]
+
+    def price_many(self, baskets: Iterable[Scans]) -> Iterator[Invoice]:
+        """Price many baskets, returning the invoices in order.
+
+        The baskets are read lazily, so this can be used on a stream of
+        baskets that doesn't fit in memory.
+        """
+
+        pending: deque[Future] = deque()
+        for chunk in _chunked(baskets, self.chunk_size):
+            if len(pending) >= self.max_pending:
+                yield from self._to_invoices(pending.popleft().result())
+            pending.append(self._executor.submit(_price_chunk, chunk))
+        while pending:
+            yield from self._to_invoices(pending.popleft().result())
+
+    async def aprice(self, scans: Scans) -> Invoice:
+        """Price a single basket, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, _price_chunk,
+                                             [scans])
+        return self._to_invoices(results)[0]
+
+    async def aprice_many(
+            self,
+            baskets: Union[Iterable[Scans], AsyncIterable[Scans]]
+    ) -> AsyncIterator[Invoice]:
+        """Price many baskets, returning the invoices in order.
+
+        Like price_many, but without blocking the event loop. The baskets can
+        be an iterable or an async iterable (e.g. reading from a queue).
+        """
+
+        loop = asyncio.get_running_loop()
+        pending: deque[asyncio.Future] = deque()
+        async for chunk in _achunked(baskets, self.chunk_size):
+            if len(pending) >= self.max_pending:
+                for invoice in self._to_invoices(await pending.popleft()):
+                    yield invoice
+            pending.append(loop.run_in_executor(self._executor,
+                                                _price_chunk, chunk))
+        while pending:
+            for invoice in self._to_invoices(await pending.popleft()):
+                yield invoice
+
+    def _to_invoices(self, results: list[_Result]) -> list[Invoice]:
+        """Create invoices from the results sent back by a worker."""
+        invoices = []
+        for basket_items, discounts, missing_barcodes in results:
+            if missing_barcodes:
+                warnings.warn(f"Barcodes {missing_barcodes} not found in "
+                              "product database. Items not priced.")
+            invoice = Invoice(basket_items, fixed_point=self.fixed_point)
+            invoice.discounts = discounts
+            invoices.append(invoice)
+        return invoices
+
+
+def _init_worker(products: Union[str, ProductDB],
+                 promotions: Optional[PromotionEngine]) -> None:
+    """Load the products and promotions in a worker process."""
+    global _worker_products, _worker_promotions
+    if isinstance(products, str):
+        from shoppingbasket.product_snapshot import ProductSnapshot
+        products = ProductSnapshot.open(products)
+    _worker_products = products
+    _worker_promotions = promotions
+
+
+def _price_chunk(chunk: list[Scans]) -> list[_Result]:
+    """Price a chunk of baskets in a worker process."""
+    results = []
+    for scans in chunk:
+        basket = Basket(_worker_products, promotions=_worker_promotions)
+        scan_result = basket.add_items_from_barcodes(scans)
+        discounts = []
+        if _worker_promotions is not None:
+            discounts = list(_worker_promotions.get_discounts(
+                basket.basket_items))
+        results.append((basket.basket_items, discounts,
+                        scan_result.missing_barcodes))
+    return results
+
+
+def _chunked(baskets: Iterable[Scans], size: int) -> Iterator[list[Scans]]:
+    """Split baskets into lists of size (or fewer, at the end)."""
+    chunk = []
+    for scans in baskets:
+        chunk.append(scans)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _achunked(
+        baskets: Union[Iterable[Scans], AsyncIterable[Scans]],
+        size: int
+) -> AsyncIterator[list[Scans]]:
+    """Split baskets (from an iterable or async iterable) into lists."""
+    if not hasattr(baskets, '__aiter__'):
+        for chunk in _chunked(baskets, size):
+            yield chunk
+        return
+
+    chunk = []
+    async for scans in baskets:
+        chunk.append(scans)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,442 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from shoppingbasket.product_db import Product, ProductBackend
+
+# Maximum number of barcodes in a single SQL query (SQLite's default limit on
+# the number of parameters is 999)
+_SQL_BATCH_SIZE = 500
+
+_COLUMNS = 'barcode, name, unit_price, units'
+
+
+def _quote_identifier(name: str) -> str:
+    """Quote a name (e.g. of a table) for use in SQL.
+
+    Any double quotes in the name are escaped by doubling them, so the name
+    can never be read as anything but a single identifier.
+
+    Raises:
+        ValueError: If the name contains a NUL character, which SQLite can't
+            store in an identifier.
+    """
+
+    if '\x00' in name:
+        raise ValueError(f"Invalid SQL identifier: {name!r}")
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteBackend(ProductBackend):
+    """Products stored in a SQLite database.
+
+    The products are stored in a table with the columns barcode (the primary
+    key), name, unit_price and units. Nothing is loaded into memory up front,
+    so this is usually wrapped in a CachedBackend. The table name is quoted
+    in every query, so it can't inject SQL.
+    """
+
+    def __init__(self, db_path: str, table: str = 'products') -> None:
+        """Connect to a SQLite product database.
+
+        Args:
+            db_path: The path to the SQLite database.
+            table: The name of the products table. Defaults to 'products'.
+
+        Raises:
+            ValueError: If the table name isn't a valid SQL identifier.
+        """
+
+        self.table = table
+        self._table_sql = _quote_identifier(table)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls,
+               db_path: str,
+               products: Iterable[Product],
+               table: str = 'products') -> 'SQLiteBackend':
+        """Create (or replace) a SQLite product database.
+
+        Args:
+            db_path: The path to the SQLite database.
+            products: The products to store.
+            table: The name of the products table. Defaults to 'products'.
+
+        Returns:
+            A SQLiteBackend connected to the new database.
+
+        Raises:
+            ValueError: If the table name isn't a valid SQL identifier.
+        """
+
+        backend = cls(db_path, table)
+        table = backend._table_sql
+        with backend._lock, backend._connection as connection:
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+            connection.execute(f"CREATE TABLE {table} ("
+                               "barcode INTEGER PRIMARY KEY, "
+                               "name TEXT NOT NULL, "
+                               "unit_price REAL NOT NULL, "
+                               "units TEXT)")
+            connection.executemany(
+                f"INSERT INTO {table} VALUES (?, ?, ?, ?)", products)
+        return backend
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            query = f"SELECT COUNT(*) FROM {self._table_sql}"
+            return self._connection.execute(query).fetchone()[0]
+
+    def get_product(self, barcode: int) -> Product:
+        """Get a product by barcode.
+
+        Raises:
+            KeyError: If the barcode is not in the database.
+        """
+
+        query = f"SELECT {_COLUMNS} FROM {self._table_sql} WHERE barcode = ?"
+        with self._lock:
+            row = self._connection.execute(query, (barcode,)).fetchone()
+        if row is None:
+            raise KeyError(barcode)
+        return Product(*row)
+
+    def get_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode, with a query per 500 barcodes."""
+        barcodes = list(dict.fromkeys(barcodes))
+        products = {}
+        for i in range(0, len(barcodes), _SQL_BATCH_SIZE):
+            batch = barcodes[i:i + _SQL_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            query = (f"SELECT {_COLUMNS} FROM {self._table_sql} "
+                     f"WHERE barcode IN ({placeholders})")
+            with self._lock:
+                rows = self._connection.execute(query, batch).fetchall()
+            for row in rows:
+                products[row[0]] = Product(*row)
+        return products
+
+
+@dataclass
+class CacheStats:
+    """Counts of lookups in a CachedBackend.
+
+    Attributes:
+        hits: Lookups found in the cache.
+        misses: Lookups not in the cache (including expired products).
+        evictions: Products removed to keep the cache within its size.
+        expirations: Products removed because they were older than the TTL.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were found in the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CachedBackend(ProductBackend):
+    """A bounded cache in front of another (slower) product backend.
+
+    The most recently used products are kept in memory, up to maxsize. If a
+    TTL is given, products are looked up again once they have been cached for
+    longer than it, so price changes in the backend are picked up. Bulk
+    lookups only ask the backend for the barcodes that aren't cached, in a
+    single get_many call.
+
+    Attributes:
+        backend: The backend products are looked up in on a cache miss.
+        maxsize: The maximum number of products to cache.
+        ttl: The number of seconds to cache each product for (None for no
+            limit).
+        stats: Counts of cache hits, misses, evictions and expirations.
+    """
+
+    def __init__(self,
+                 backend: ProductBackend,
+                 maxsize: int = 10_000,
+                 ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Initialise an empty cache.
+
+        Args:
+            backend: The backend to look products up in on a cache miss.
+            maxsize: The maximum number of products to cache. Defaults to
+                10,000.
+            ttl: The number of seconds to cache each product for. Defaults to
+                None (no limit).
+            clock: The function giving the current time in seconds, for TTLs.
+                Defaults to time.monotonic.
+        """
+
+        self.backend = backend
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._clock = clock
+        # Products, and the time they expire, in order of most recent use
+        self._cache: OrderedDict[int, tuple[Product, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        # The number of products in the backend, like any other backend (not
+        # just those that happen to be cached)
+        return len(self.backend)
+
+    @property
+    def num_cached(self) -> int:
+        """The number of products currently in the cache."""
+        return len(self._cache)
+
+    def get_product(self, barcode: int) -> Product:
+        """Get a product by barcode, from the cache if possible.
+
+        Raises:
+            KeyError: If the barcode is not in the backend.
+        """
+
+        product = self._get_cached(barcode)
+        if product is None:
+            product = self.backend.get_product(barcode)
+            self._add(barcode, product)
+        return product
+
+    def get_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode, leaving out any not found.
+
+        Barcodes that are not cached are looked up in the backend together.
+        """
+
+        products = {}
+        uncached = []
+        for barcode in dict.fromkeys(barcodes):
+            product = self._get_cached(barcode)
+            if product is None:
+                uncached.append(barcode)
+            else:
+                products[barcode] = product
+
+        if uncached:
+            for barcode, product in self.backend.get_many(uncached).items():
+                self._add(barcode, product)
+                products[barcode] = product
+        return products
+
+    async def aget(self, barcode: int) -> Product:
+        """Get a product by barcode, awaiting the backend on a cache miss.
+
+        Raises:
+            KeyError: If the barcode is not in the backend.
+        """
+
+        product = self._get_cached(barcode)
+        if product is None:
+            product = await self.backend.aget(barcode)
+            self._add(barcode, product)
+        return product
+
+    async def aget_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode, leaving out any not found.
+
+        Barcodes that are not cached are looked up in the backend together.
+        """
+
+        products = {}
+        uncached = []
+        for barcode in dict.fromkeys(barcodes):
+            product = self._get_cached(barcode)
+            if product is None:
+                uncached.append(barcode)
+            else:
+                products[barcode] = product
+
+        if uncached:
+            found = await self.backend.aget_many(uncached)
+            for barcode, product in found.items():
+                self._add(barcode, product)
+                products[barcode] = product
+        return products
+
+    def invalidate(self, barcode: Optional[int] = None) -> None:
+        """Remove a product (or all products, if None) from the cache."""
+        with self._lock:
+            if barcode is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(barcode, None)
+
+    def _get_cached(self, barcode: int) -> Optional[Product]:
+        """Get a product from the cache, updating the stats."""
+        with self._lock:
+            cached = self._cache.get(barcode)
+            if cached is not None:
+                product, expires = cached
+                if expires >= self._clock():
+                    self._cache.move_to_end(barcode)
+                    self.stats.hits += 1
+                    return product
+                del self._cache[barcode]
+                self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+
+    def _add(self, barcode: int, product: Product) -> None:
+        """Add a product to the cache, evicting the least recently used."""
+        expires = float('inf')
+        if self.ttl is not None:
+            expires = self._clock() + self.ttl
+        with self._lock:
+            self._cache[barcode] = (product, expires)
+            self._cache.move_to_end(barcode)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.stats.evictions += 1
+
+
+class CoalescingBackend(ProductBackend):
+    """Batches concurrent async lookups to another (slower) backend.
+
+    When many coroutines (e.g. one per till) look up products at the same
+    time, the barcodes requested during the same turn of the event loop are
+    looked up together, with a single aget_many call to the backend for up to
+    max_batch_size barcodes. Concurrent lookups of the same barcode share a
+    single request, and up to max_pending_batches batches are sent to the
+    backend at once, so a new batch doesn't wait for a slow one to finish.
+
+    Synchronous lookups go straight to the backend. A CoalescingBackend
+    should only be used from a single event loop.
+
+    Attributes:
+        backend: The backend products are looked up in.
+        max_batch_size: The maximum number of barcodes in a batch.
+        max_pending_batches: The maximum number of batches sent to the backend
+            at once.
+        num_lookups: The number of barcodes looked up with aget or aget_many.
+        num_batches: The number of batches sent to the backend.
+    """
+
+    def __init__(self,
+                 backend: ProductBackend,
+                 max_batch_size: int = _SQL_BATCH_SIZE,
+                 max_pending_batches: int = 4) -> None:
+        """Initialise a coalescing backend.
+
+        Args:
+            backend: The backend to look products up in.
+            max_batch_size: The maximum number of barcodes in a batch.
+                Defaults to 500.
+            max_pending_batches: The maximum number of batches sent to the
+                backend at once. Defaults to 4.
+        """
+
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_pending_batches = max_pending_batches
+        self.num_lookups = 0
+        self.num_batches = 0
+
+        # Barcodes waiting to be sent, and the (shared) result of each barcode
+        # that is waiting or being looked up
+        self._queue: list[int] = []
+        self._futures: dict[int, asyncio.Future] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def get_product(self, barcode: int) -> Product:
+        """Get a product by barcode (from the backend).
+
+        Raises:
+            KeyError: If the barcode is not in the backend.
+        """
+
+        return self.backend.get_product(barcode)
+
+    def get_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode (from the backend)."""
+        return self.backend.get_many(barcodes)
+
+    async def aget(self, barcode: int) -> Product:
+        """Get a product by barcode, batched with concurrent lookups.
+
+        Raises:
+            KeyError: If the barcode is not in the backend.
+        """
+
+        product = await asyncio.shield(self._request(barcode))
+        if product is None:
+            raise KeyError(barcode)
+        return product
+
+    async def aget_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode, batched with concurrent lookups.
+
+        Barcodes that are not found are left out.
+        """
+
+        barcodes = list(dict.fromkeys(barcodes))
+        futures = [self._request(barcode) for barcode in barcodes]
+        products = await asyncio.shield(asyncio.gather(*futures))
+        return {barcode: product
+                for barcode, product in zip(barcodes, products)
+                if product is not None}
+
+    def _request(self, barcode: int) -> asyncio.Future:
+        """Get the future result of a barcode, queueing it if needed."""
+        self.num_lookups += 1
+        future = self._futures.get(barcode)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[barcode] = loop.create_future()
+            if not self._queue:
+                # Send the batch once every coroutine that is ready has had
+                # the chance to add to it
+                loop.call_soon(self._send_batches)
+            self._queue.append(barcode)
+        return future
+
+    def _send_batches(self) -> None:
+        """Send the queued barcodes to the backend, in batches."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_pending_batches)
+        queue, self._queue = self._queue, []
+        for i in range(0, len(queue), self.max_batch_size):
+            batch = queue[i:i + self.max_batch_size]
+            task = asyncio.ensure_future(self._load_batch(batch))
+            # Keep a reference to the task until it's done
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch: list[int]) -> None:
+        """Look up a batch of barcodes, and set the result of each."""
+        async with self._semaphore:
+            self.num_batches += 1
+            try:
+                products = await self.backend.aget_many(batch)
+            except Exception as e:
+                for barcode in batch:
+                    future = self._futures.pop(barcode)
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for barcode in batch:
+            future = self._futures.pop(barcode)
+            if not future.done():
+                future.set_result(products.get(barcode))
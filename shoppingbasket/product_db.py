@@ -1,21 +1,412 @@
-import yaml
+import csv
+import json
+import sys
+import warnings
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
 
+from shoppingbasket.basket_item import BasketItem
 
-class ProductDB:
-    """A database of products, indexed by barcode."""
 
-    def __init__(self, products: list[dict]) -> None:
+class Product(NamedTuple):
+    """A product in the database.
+
+    Products are stored as named tuples rather than dictionaries, which takes
+    much less memory for large catalogues. Names and units are interned, so
+    repeated strings are only stored once.
+
+    Use to_basket_item to add a product to a basket without building a
+    dictionary, or to_dict for a dictionary of BasketItem arguments.
+
+    Attributes:
+        barcode: The barcode of the product.
+        name: The name of the product.
+        unit_price: The price of the product (per unit, if it has units).
+        units: The units of the product (e.g. 'kg'). Defaults to None.
+    """
+
+    barcode: int
+    name: str
+    unit_price: float
+    units: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, product: dict) -> 'Product':
+        """Create a product from a dictionary.
+
+        The dictionary must contain the keys 'barcode', 'name', and
+        'unit_price'. The key 'units' is optional (an empty value is the same
+        as no units). Any other keys aren't stored, so a warning is given.
+        """
+
+        extra_keys = product.keys() - _PRODUCT_KEYS
+        if extra_keys:
+            warnings.warn(f"Product keys {sorted(extra_keys)} are not "
+                          "supported, and are ignored.")
+        units = product.get('units') or None
+        return cls(int(product['barcode']),
+                   sys.intern(str(product['name'])),
+                   float(product['unit_price']),
+                   None if units is None else sys.intern(str(units)))
+
+    def to_dict(self) -> dict:
+        """Convert the product to a dictionary of BasketItem arguments."""
+        product = {'barcode': self.barcode,
+                   'name': self.name,
+                   'unit_price': self.unit_price}
+        if self.units is not None:
+            product['units'] = self.units
+        return product
+
+    def to_basket_item(self, quantity: float = 1.0) -> BasketItem:
+        """Create a basket item for an amount of the product."""
+        return BasketItem(self.name,
+                          self.unit_price,
+                          barcode=self.barcode,
+                          units=self.units,
+                          quantity=quantity)
+
+
+_PRODUCT_KEYS = frozenset(Product._fields)
+
+
+class ProductBackend(ABC):
+    """A source of products, looked up by barcode.
+
+    Anything that can look up products by barcode (an in-memory ProductDB, a
+    snapshot file, a SQL database, a remote service, ...) can be used by a
+    Basket by implementing get_product. Backends where each lookup is a round
+    trip should also implement get_many, to look up many barcodes at once.
+
+    Lookups can also be awaited (with aget and aget_many), e.g. from an
+    asyncio till server. By default, these run the synchronous lookup in a
+    thread, so a slow backend doesn't block the event loop. Backends that are
+    in memory should override them to look up products directly, and
+    backends with an asyncio client can override them to use it.
+    """
+
+    @abstractmethod
+    def get_product(self, barcode: int) -> Product:
+        """Get a product by barcode.
+
+        Raises:
+            KeyError: If the barcode is not found.
+        """
+
+    def get_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode.
+
+        Args:
+            barcodes: The barcodes to look up.
+
+        Returns:
+            The products that were found, keyed by barcode. Barcodes that are
+            not found are left out.
+        """
+
+        products = {}
+        for barcode in barcodes:
+            try:
+                products[barcode] = self.get_product(barcode)
+            except KeyError:
+                pass
+        return products
+
+    async def aget(self, barcode: int) -> Product:
+        """Get a product by barcode, without blocking the event loop.
+
+        Raises:
+            KeyError: If the barcode is not found.
+        """
+
+        import asyncio
+        return await asyncio.to_thread(self.get_product, barcode)
+
+    async def aget_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode, without blocking the event loop.
+
+        Barcodes that are not found are left out.
+        """
+
+        import asyncio
+        return await asyncio.to_thread(self.get_many, list(barcodes))
+
+    def __getitem__(self, barcode: int) -> dict:
+        """Get a product by barcode, as a dictionary of BasketItem arguments.
+
+        This builds a new dictionary for each lookup, so use get_product
+        where a Product will do (e.g. to add it to a basket).
+        """
+
+        return self.get_product(barcode).to_dict()
+
+    def __contains__(self, barcode: int) -> bool:
+        try:
+            self.get_product(barcode)
+        except KeyError:
+            return False
+        return True
+
+
+# Marks a product deleted by an update (in an update layer)
+_DELETED = object()
+
+# Number of products in update layers, as a fraction of the number of products
+# in the base layer, at which the update layers are merged into the base
+_MERGE_FRACTION = 0.25
+
+
+class ProductDB(ProductBackend):
+    """A database of products, indexed by barcode.
+
+    The database can be updated in place (e.g. with price changes), and each
+    update creates a new version. Updates are copy-on-write: views of earlier
+    versions are unaffected, so e.g. a basket that is open can keep using the
+    prices from when it was opened while new lookups see the new prices.
+
+    To keep the cost of an update proportional to the number of products
+    changed, rather than the size of the catalogue, each update is stored as a
+    layer on top of the base catalogue. Layers are merged together as they
+    build up, and into a new copy of the base catalogue once they make up a
+    large enough fraction of it.
+
+    Attributes:
+        version: The version of the database, incremented by each update.
+    """
+
+    def __init__(self, products: Iterable[Union[dict, Product]]) -> None:
         """Initialise a product database.
 
         Args:
-            products: A list of products, each represented as a dictionary.
+            products: The products, each represented as a dictionary or a
+                Product. This can be any iterable (e.g. a generator reading
+                from a file), and is only iterated over once.
+        """
+
+        self._products: dict[int, Product] = {}
+        for product in products:
+            if not isinstance(product, Product):
+                product = Product.from_dict(product)
+            self._products[product.barcode] = product
+
+        # Update layers, most recent first
+        self._layers: tuple[dict, ...] = ()
+        self._size = len(self._products)
+        self._read_only = False
+        self.version = 0
+
+    def __contains__(self, barcode: int) -> bool:
+        return self._lookup(barcode) is not None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get_product(self, barcode: int) -> Product:
+        """Get a product by barcode.
+
+        Raises:
+            KeyError: If the barcode is not in the database.
         """
 
-        self._products = {product['barcode']: product for product in products}
+        if not self._layers:
+            return self._products[barcode]
+
+        product = self._lookup(barcode)
+        if product is None:
+            raise KeyError(barcode)
+        return product
+
+    def get_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode, leaving out any not found."""
+        products = {}
+        for barcode in barcodes:
+            product = self._lookup(barcode)
+            if product is not None:
+                products[barcode] = product
+        return products
+
+    async def aget(self, barcode: int) -> Product:
+        """Get a product by barcode (in memory, so without a thread)."""
+        return self.get_product(barcode)
+
+    async def aget_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode (in memory, so without a thread)."""
+        return self.get_many(barcodes)
+
+    def view(self) -> 'ProductDB':
+        """Get a read-only view of the current version of the database.
 
-    def __getitem__(self, barcode: int) -> 'Product':
-        """Get a product by barcode."""
-        return self._products[barcode]
+        The view is not affected by later updates to the database. Creating a
+        view doesn't copy the products, so is cheap.
+        """
+
+        view = object.__new__(ProductDB)
+        view._products = self._products
+        view._layers = self._layers
+        view._size = self._size
+        view._read_only = True
+        view.version = self.version
+        return view
+
+    def upsert(self, product: Union[dict, Product]) -> int:
+        """Add a product, or replace the product with the same barcode.
+
+        Args:
+            product: The product, as a dictionary or a Product.
+
+        Returns:
+            The new version of the database.
+        """
+
+        return self.apply_updates(upserts=[product])
+
+    def delete(self, barcode: int) -> int:
+        """Delete a product.
+
+        Args:
+            barcode: The barcode of the product to delete.
+
+        Returns:
+            The new version of the database.
+
+        Raises:
+            KeyError: If the barcode is not in the database.
+        """
+
+        if barcode not in self:
+            raise KeyError(barcode)
+        return self.apply_updates(deletes=[barcode])
+
+    def apply_updates(self,
+                      upserts: Iterable[Union[dict, Product]] = (),
+                      deletes: Iterable[int] = ()) -> int:
+        """Apply a set of updates to the database, as a single new version.
+
+        Deleting a barcode that isn't in the database has no effect.
+
+        Args:
+            upserts: Products to add or replace.
+            deletes: Barcodes of products to delete.
+
+        Returns:
+            The new version of the database.
+
+        Raises:
+            ValueError: If the database is a read-only view.
+        """
+
+        if self._read_only:
+            raise ValueError("Cannot update a read-only view of a ProductDB.")
+
+        delta = {}
+        for barcode in deletes:
+            delta[barcode] = _DELETED
+        for product in upserts:
+            if not isinstance(product, Product):
+                product = Product.from_dict(product)
+            delta[product.barcode] = product
+
+        for barcode, product in delta.items():
+            existed = self._lookup(barcode) is not None
+            self._size += (product is not _DELETED) - existed
+
+        self._add_layer(delta)
+        self.version += 1
+        return self.version
+
+    def apply_delta_file(self, delta_path: str) -> int:
+        """Apply a file of updates to the database, as a single new version.
+
+        The file must be in JSON lines format, with each line either a product
+        to add or replace (as for from_jsonl), or an object with the keys
+        'barcode' and 'deleted' (set to true) for a product to delete.
+
+        Args:
+            delta_path: The path to the JSON lines file.
+
+        Returns:
+            The new version of the database.
+        """
+
+        upserts, deletes = [], []
+        with open(delta_path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('deleted'):
+                    deletes.append(int(record['barcode']))
+                else:
+                    upserts.append(record)
+        return self.apply_updates(upserts, deletes)
+
+    def _lookup(self, barcode: int) -> Optional[Product]:
+        """Get a product by barcode, or None if it isn't in the database."""
+        for layer in self._layers:
+            product = layer.get(barcode)
+            if product is not None:
+                return None if product is _DELETED else product
+        return self._products.get(barcode)
+
+    def _add_layer(self, delta: dict) -> None:
+        """Add a layer of updates, merging layers if needed.
+
+        Existing layers (and the base) are never modified, as they may be
+        shared with views of earlier versions.
+        """
+
+        layers = [delta, *self._layers]
+
+        # Merge layers while the most recent is at least as large as the next,
+        # so there are only ever a logarithmic number of layers
+        while len(layers) > 1 and len(layers[0]) >= len(layers[1]):
+            merged = {**layers[1], **layers[0]}
+            layers[:2] = [merged]
+
+        # Merge into a new base, once the layers are large enough
+        num_updates = sum(len(layer) for layer in layers)
+        if num_updates > len(self._products) * _MERGE_FRACTION:
+            products = dict(self._products)
+            for layer in reversed(layers):
+                for barcode, product in layer.items():
+                    if product is _DELETED:
+                        products.pop(barcode, None)
+                    else:
+                        products[barcode] = product
+            self._products = products
+            layers = []
+
+        self._layers = tuple(layers)
+
+    def iter_products(self) -> Iterator[Product]:
+        """Iterate over the products in the database."""
+        if not self._layers:
+            yield from self._products.values()
+            return
+
+        seen = set()
+        for layer in self._layers:
+            for barcode, product in layer.items():
+                if barcode not in seen:
+                    seen.add(barcode)
+                    if product is not _DELETED:
+                        yield product
+        for barcode, product in self._products.items():
+            if barcode not in seen:
+                yield product
+
+    def to_snapshot(self, snapshot_path: str) -> None:
+        """Compile the database into a binary snapshot file.
+
+        The snapshot can be opened (almost instantly, for any size of
+        catalogue) with ProductSnapshot.open.
+
+        Args:
+            snapshot_path: The path to write the snapshot file to.
+        """
+
+        from shoppingbasket.product_snapshot import ProductSnapshot
+        ProductSnapshot.write(self.iter_products(), snapshot_path)
 
     @staticmethod
     def from_yaml(db_path: str) -> 'ProductDB':
@@ -26,6 +417,10 @@ class ProductDB:
         'barcode', 'name', and 'unit_price'. The key 'units' is optional, and
         defaults to 'per_item'.
 
+        The file is read one product at a time, rather than loading the whole
+        list into memory first. It may also contain multiple YAML documents
+        (separated by '---'), each either a list of products or one product.
+
         Args:
             db_path: The path to the YAML file.
 
@@ -33,5 +428,40 @@ class ProductDB:
             A ProductDB object.
         """
 
+        from shoppingbasket.yaml_products import iter_yaml_products
+        with open(db_path, 'r') as f:
+            return ProductDB(iter_yaml_products(f))
+
+    @staticmethod
+    def from_csv(db_path: str) -> 'ProductDB':
+        """Load a product database from a CSV file.
+
+        The CSV file must have a header row, with the columns 'barcode',
+        'name', and 'unit_price', and optionally 'units'.
+
+        Args:
+            db_path: The path to the CSV file.
+
+        Returns:
+            A ProductDB object.
+        """
+
+        with open(db_path, 'r', newline='') as f:
+            return ProductDB(csv.DictReader(f))
+
+    @staticmethod
+    def from_jsonl(db_path: str) -> 'ProductDB':
+        """Load a product database from a JSON lines file.
+
+        Each (non-empty) line of the file must be a JSON object representing a
+        product, with the same keys as for from_yaml.
+
+        Args:
+            db_path: The path to the JSON lines file.
+
+        Returns:
+            A ProductDB object.
+        """
+
         with open(db_path, 'r') as f:
-            return ProductDB(yaml.safe_load(f))
+            return ProductDB(json.loads(line) for line in f if line.strip())
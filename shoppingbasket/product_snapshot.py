@@ -0,0 +1,241 @@
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional, Union
+
+from shoppingbasket.product_db import Product, ProductBackend
+
+# File header: magic, byte order, number of products, offsets of the record
+# table and the string pool
+_MAGIC = b'SBPDB001'
+_HEADER = struct.Struct('=8s8sQQQ')
+
+# Record for each product (in the same order as the sorted barcode table):
+# unit price, name offset and length, units offset and length
+_RECORD = struct.Struct('=dIIII')
+_NO_UNITS = 0xFFFFFFFF
+
+_BARCODE_SIZE = struct.calcsize('q')
+
+
+class ProductSnapshot(ProductBackend):
+    """A read-only product database stored in a binary snapshot file.
+
+    The snapshot contains a table of barcodes (sorted, so they can be binary
+    searched), a table of fixed size records and a pool of UTF-8 strings.
+    When the file is opened it is memory mapped, rather than read, so opening
+    takes the same time for any size of catalogue, lookups only read the pages
+    they need, and processes on the same host share a single copy of the
+    catalogue through the page cache.
+
+    Snapshots are written with ProductDB.to_snapshot (or
+    ProductSnapshot.write).
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap, memoryview]) -> None:
+        """Initialise a product database from a snapshot in memory.
+
+        Args:
+            buffer: The contents of a snapshot file.
+
+        Raises:
+            ValueError: If the buffer is not a valid snapshot.
+        """
+
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Product snapshot is too short.")
+
+        magic, byteorder, count, records_offset, strings_offset = \
+            _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("Not a product snapshot.")
+        if byteorder.rstrip(b'\0') != sys.byteorder.encode():
+            raise ValueError("Product snapshot has a different byte order.")
+
+        # The tables follow the header in order, and must fit in the buffer
+        # (which would otherwise be read out of bounds by lookups)
+        barcodes_end = _HEADER.size + count * _BARCODE_SIZE
+        if records_offset != barcodes_end \
+                or strings_offset != records_offset + count * _RECORD.size:
+            raise ValueError("Product snapshot has an invalid header.")
+        if strings_offset > len(buffer):
+            raise ValueError(f"Product snapshot is truncated (expected at "
+                             f"least {strings_offset} bytes for {count} "
+                             f"products, got {len(buffer)}).")
+
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._barcodes = self._view[_HEADER.size:barcodes_end].cast('q')
+        self._records_offset = records_offset
+        self._strings = self._view[strings_offset:]
+
+    @classmethod
+    def open(cls, snapshot_path: str) -> 'ProductSnapshot':
+        """Open a snapshot file, by memory mapping it.
+
+        Args:
+            snapshot_path: The path to the snapshot file.
+
+        Returns:
+            A ProductSnapshot object.
+        """
+
+        with open(snapshot_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buffer)
+        except ValueError:
+            buffer.close()
+            raise
+
+    def close(self) -> None:
+        """Release the snapshot (and unmap the file, if it was opened)."""
+        self._barcodes.release()
+        self._strings.release()
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __enter__(self) -> 'ProductSnapshot':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __contains__(self, barcode: int) -> bool:
+        return self._find(barcode) is not None
+
+    def __len__(self) -> int:
+        return len(self._barcodes)
+
+    def get_product(self, barcode: int) -> Product:
+        """Get a product by barcode.
+
+        Raises:
+            KeyError: If the barcode is not in the snapshot.
+            ValueError: If the product's record is corrupt.
+        """
+
+        i = self._find(barcode)
+        if i is None:
+            raise KeyError(barcode)
+        return self._read_product(i)
+
+    async def aget(self, barcode: int) -> Product:
+        """Get a product by barcode (memory mapped, so without a thread)."""
+        return self.get_product(barcode)
+
+    async def aget_many(self, barcodes: Iterable[int]) -> dict[int, Product]:
+        """Get many products by barcode (memory mapped, without a thread)."""
+        return self.get_many(barcodes)
+
+    def iter_products(self) -> Iterator[Product]:
+        """Iterate over the products in the snapshot, in barcode order."""
+        for i in range(len(self)):
+            yield self._read_product(i)
+
+    @staticmethod
+    def write(products: Iterable[Product], snapshot_path: str) -> None:
+        """Write products to a snapshot file.
+
+        The file is replaced atomically (by writing a temporary file and
+        renaming it), so processes that have the old snapshot open keep
+        reading it unchanged, and only see the new one once they reopen it.
+
+        Args:
+            products: The products to write.
+            snapshot_path: The path to the snapshot file.
+        """
+
+        data = ProductSnapshot.encode(products)
+        temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, snapshot_path)
+        except BaseException:
+            # Don't leave a partly written snapshot behind
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def encode(products: Iterable[Product]) -> bytes:
+        """Encode products as the contents of a snapshot.
+
+        Args:
+            products: The products to encode.
+
+        Returns:
+            The snapshot, which can be written to a file or shared memory.
+        """
+
+        products = sorted(products, key=lambda product: product.barcode)
+
+        strings = bytearray()
+        string_offsets = {}
+
+        def add_string(string: str) -> tuple[int, int]:
+            if string not in string_offsets:
+                encoded = string.encode('utf-8')
+                string_offsets[string] = (len(strings), len(encoded))
+                strings.extend(encoded)
+            return string_offsets[string]
+
+        records = bytearray()
+        for product in products:
+            name_offset, name_length = add_string(product.name)
+            if product.units is None:
+                units_offset, units_length = _NO_UNITS, 0
+            else:
+                units_offset, units_length = add_string(product.units)
+            records += _RECORD.pack(product.unit_price,
+                                    name_offset, name_length,
+                                    units_offset, units_length)
+
+        barcodes = struct.pack(f'={len(products)}q',
+                               *(product.barcode for product in products))
+        records_offset = _HEADER.size + len(barcodes)
+        strings_offset = records_offset + len(records)
+        header = _HEADER.pack(_MAGIC, sys.byteorder.encode(), len(products),
+                              records_offset, strings_offset)
+
+        return b''.join((header, barcodes, records, strings))
+
+    def _find(self, barcode: int) -> Optional[int]:
+        """Find the index of a barcode in the barcode table."""
+        if not isinstance(barcode, int):
+            return None
+        barcodes = self._barcodes
+        i = bisect_left(barcodes, barcode)
+        if i < len(barcodes) and barcodes[i] == barcode:
+            return i
+        return None
+
+    def _read_product(self, i: int) -> Product:
+        """Read the product at an index of the record table."""
+        offset = self._records_offset + i * _RECORD.size
+        unit_price, name_offset, name_length, units_offset, units_length = \
+            _RECORD.unpack_from(self._view, offset)
+        units = None
+        if units_offset != _NO_UNITS:
+            units = self._read_string(units_offset, units_length)
+        return Product(self._barcodes[i],
+                       self._read_string(name_offset, name_length),
+                       unit_price,
+                       units)
+
+    def _read_string(self, offset: int, length: int) -> str:
+        """Read a string from the string pool."""
+        # Checked here rather than when the snapshot is opened, so opening
+        # doesn't read every record
+        if offset + length > len(self._strings):
+            raise ValueError(f"Product snapshot string at {offset} is out of "
+                             "bounds.")
+        return str(self._strings[offset:offset + length], 'utf-8')
@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from shoppingbasket import instrumentation
+from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.promotions import Promotion
+
+
+@dataclass
+class DiscountCacheStats:
+    """Counts of lookups in the discount cache of a PromotionEngine.
+
+    Attributes:
+        hits: Promotions whose discounts were found in the cache.
+        misses: Promotions whose discounts had to be calculated.
+        evictions: Results removed to keep the cache within its size.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were found in the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class PromotionEngine:
+    """Applies a collection of promotions to basket items.
+
+    Calling every promotion on the full basket scales with the number of items
+    times the number of promotions, even though each item is usually only
+    eligible for a handful of promotions. The engine builds an index of the
+    promotions each barcode is eligible for once, and then routes each basket
+    item only to those promotions. Promotions with no eligible items are
+    skipped entirely.
+
+    With a cache_size, the discounts of each promotion are also cached, keyed
+    by the promotion and a signature of its eligible items: the counts of
+    each (barcode, unit price, units, quantity), in any order. Similar
+    baskets (e.g. the same weekly shop, scanned in a different order) and
+    running totals that recalculate a promotion reuse the discounts
+    calculated before, as long as the promotion's items are unchanged. The
+    signature includes prices, so a price change can never return stale
+    discounts. The least recently used results are evicted once the cache
+    is full.
+
+    Attributes:
+        promotions: The promotions to apply.
+        cache_size: The maximum number of promotion results to cache (0 for
+            no cache).
+        cache_stats: Counts of cache hits, misses and evictions.
+        solves_jointly: Whether promotions that share products have to be
+            applied together (e.g. so each unit is only used once), rather
+            than one at a time with get_promotion_discounts.
+    """
+
+    solves_jointly = False
+
+    def __init__(self,
+                 promotions: Iterable[Promotion],
+                 cache_size: int = 0) -> None:
+        """Initialise a promotion engine, indexing promotions by barcode.
+
+        Args:
+            promotions: The promotions to apply.
+            cache_size: The maximum number of promotion results to cache.
+                Defaults to 0 (no cache).
+        """
+
+        self.promotions = list(promotions)
+        self.cache_size = cache_size
+        self.cache_stats = DiscountCacheStats()
+        # Discounts, keyed by promotion index and eligible item signature, in
+        # order of most recent use
+        self._cache: OrderedDict[tuple, tuple[Discount, ...]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        index = defaultdict(list)
+        for i, promotion in enumerate(self.promotions):
+            for barcode in promotion.eligible_barcodes:
+                index[barcode].append(i)
+        self._index = {barcode: tuple(indices)
+                       for barcode, indices in index.items()}
+
+    def __getstate__(self) -> dict:
+        # Pickled without the cached results (e.g. when sent to a worker)
+        state = self.__dict__.copy()
+        del state['_cache'], state['_cache_lock']
+        state['cache_stats'] = DiscountCacheStats()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Promotion]:
+        return iter(self.promotions)
+
+    def __len__(self) -> int:
+        return len(self.promotions)
+
+    def get_promotion_indices(self, barcode: int) -> tuple[int, ...]:
+        """Get the indices of the promotions a barcode is eligible for."""
+        return self._index.get(barcode, ())
+
+    def get_eligible_items(
+            self,
+            basket_items: Iterable[BasketItem]
+    ) -> dict[int, list[BasketItem]]:
+        """Group basket items by the promotions they are eligible for.
+
+        Args:
+            basket_items: The items in the basket.
+
+        Returns:
+            The eligible items, keyed by the index of the promotion. Promotions
+            with no eligible items are not included.
+        """
+
+        eligible_items = defaultdict(list)
+        for item in basket_items:
+            for i in self._index.get(item.barcode, ()):
+                eligible_items[i].append(item)
+        return eligible_items
+
+    def get_discounts(
+            self,
+            basket_items: Iterable[BasketItem]
+    ) -> Iterator[Discount]:
+        """Calculate the discounts for the basket.
+
+        Discounts are returned in the same order as the promotions.
+        """
+
+        eligible_items = self.get_eligible_items(basket_items)
+        for i in sorted(eligible_items):
+            yield from self.get_promotion_discounts(i, eligible_items[i])
+
+    def get_promotion_discounts(
+            self,
+            i: int,
+            basket_items: list[BasketItem]
+    ) -> Iterable[Discount]:
+        """Get the discounts of a promotion, from the cache if possible.
+
+        Args:
+            i: The index of the promotion.
+            basket_items: The items eligible for the promotion.
+
+        Returns:
+            The discounts.
+        """
+
+        promotion = self.promotions[i]
+        if not self.cache_size:
+            return self.apply_promotion(promotion, basket_items)
+
+        key = i, self.get_signature(basket_items)
+        recorder = instrumentation.recorder
+        with self._cache_lock:
+            discounts = self._cache.get(key)
+            if discounts is not None:
+                self._cache.move_to_end(key)
+                self.cache_stats.hits += 1
+            else:
+                self.cache_stats.misses += 1
+        if recorder is not None:
+            recorder.increment(instrumentation.PROMOTION_CACHE_LOOKUPS,
+                               labels=(instrumentation.CACHE_MISS
+                                       if discounts is None
+                                       else instrumentation.CACHE_HIT))
+        if discounts is not None:
+            return discounts
+
+        discounts = tuple(self.apply_promotion(promotion, basket_items))
+        with self._cache_lock:
+            self._cache[key] = discounts
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.cache_stats.evictions += 1
+        return discounts
+
+    @staticmethod
+    def get_signature(basket_items: Iterable[BasketItem]) -> frozenset:
+        """Get the part of the basket items that can affect discounts.
+
+        Only the fields promotions use are included (not e.g. the item name),
+        and the items are counted regardless of their order, so any basket
+        with the same eligible items gives the same signature.
+
+        Args:
+            basket_items: The items eligible for a promotion.
+
+        Returns:
+            The counts of each (barcode, unit price, units, quantity).
+        """
+
+        return frozenset(Counter(
+            (item.barcode, item.unit_price, item.units, item.quantity)
+            for item in basket_items
+        ).items())
+
+    def clear_cache(self) -> None:
+        """Remove every result from the discount cache.
+
+        Results are keyed by item prices, so this isn't needed for
+        correctness after a price change, but frees the memory used by
+        results for the old prices (e.g. after a bulk update). It is needed
+        if a promotion itself is changed.
+        """
+
+        with self._cache_lock:
+            self._cache.clear()
+
+    @staticmethod
+    def apply_promotion(
+            promotion: Promotion,
+            basket_items: list[BasketItem]
+    ) -> Iterable[Discount]:
+        """Get the discounts of a promotion for its eligible items.
+
+        When instrumentation is enabled, the time taken and the number of
+        discounts are recorded for the promotion.
+        """
+
+        recorder = instrumentation.recorder
+        if recorder is None:
+            return promotion.get_discounts(basket_items)
+
+        labels = (('promotion', promotion.name),)
+        start = time.perf_counter()
+        discounts = list(promotion.get_discounts(basket_items))
+        recorder.observe(instrumentation.PROMOTION_SECONDS,
+                         time.perf_counter() - start, labels)
+        recorder.increment(instrumentation.DISCOUNTS, len(discounts), labels)
+        return discounts
@@ -0,0 +1,275 @@
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+import warnings
+from typing import Any, Iterable, Optional
+
+import yaml
+
+from shoppingbasket.money import to_pence
+from shoppingbasket.product_db import Product, ProductBackend
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import (CheapestFree, MForN, MForNPounds,
+                                       Promotion, SpendXGetYOff,
+                                       TieredQuantity)
+
+# The promotion classes that can be declared in a rules file, by the name
+# used in its 'type' field
+PROMOTION_TYPES: dict[str, type[Promotion]] = {
+    'MForN': MForN,
+    'MForNPounds': MForNPounds,
+    'CheapestFree': CheapestFree,
+    'TieredQuantity': TieredQuantity,
+    'SpendXGetYOff': SpendXGetYOff,
+}
+
+# Changed whenever the format of cache files (or the promotion classes)
+# changes, so old caches are recompiled
+_CACHE_VERSION = 2
+
+
+def load_promotions(rules_path: str,
+                    products: ProductBackend,
+                    cache_path: Optional[str] = None,
+                    strict: bool = True) -> PromotionEngine:
+    """Load promotions declared in a YAML or JSON rules file.
+
+    The file (JSON if its name ends in '.json', YAML otherwise) must be a list
+    of promotions, each with a 'type' (e.g. 'MForN') and the fields of that
+    promotion class, e.g.:
+
+        - type: MForN
+          name: Beans 3 for 2
+          eligible_barcodes: [1]
+          m: 3
+          n: 2
+
+    The promotions are compiled (see compile_promotions) into a
+    PromotionEngine. With a cache_path, the compiled engine is saved to disk,
+    and loaded from there next time instead, as long as neither the rules
+    file nor the prices of its eligible products have changed. The cache is
+    a pickle, so should only be written by the store itself.
+
+    Args:
+        rules_path: The path of the rules file.
+        products: The product catalogue to validate the promotions against.
+        cache_path: The path of the compiled cache file. Defaults to None (no
+            cache).
+        strict: Whether eligible barcodes missing from the catalogue are an
+            error, or only a warning. Defaults to True.
+
+    Returns:
+        The compiled promotions.
+
+    Raises:
+        ValueError: If a promotion is invalid.
+    """
+
+    with open(rules_path, 'rb') as f:
+        source = f.read()
+    source_hash = hashlib.sha256(source).hexdigest()
+
+    if cache_path is not None:
+        engine = _read_cache(cache_path, source_hash, strict, products)
+        if engine is not None:
+            return engine
+
+    if rules_path.endswith('.json'):
+        rules = json.loads(source)
+    else:
+        rules = yaml.safe_load(source)
+    engine = compile_promotions(rules or [], products, strict=strict)
+
+    if cache_path is not None:
+        _write_cache(cache_path, source_hash, strict, engine, products)
+    return engine
+
+
+def compile_promotions(rules: Iterable[dict[str, Any]],
+                       products: ProductBackend,
+                       strict: bool = True) -> PromotionEngine:
+    """Create and validate promotions from their declarations.
+
+    Each promotion's eligible barcodes are looked up in the catalogue (all
+    together), and stored as a frozenset. The promotions are checked for
+    invalid parameters, barcodes that aren't in the catalogue, and (using the
+    unit prices of their products) whether they can ever save the customer
+    money.
+
+    Args:
+        rules: The declaration of each promotion, as read from a rules file.
+        products: The product catalogue to validate the promotions against.
+        strict: Whether eligible barcodes missing from the catalogue are an
+            error, or only a warning. Defaults to True.
+
+    Returns:
+        The promotions, in a PromotionEngine.
+
+    Raises:
+        ValueError: If a promotion is invalid.
+    """
+
+    promotions = [_create_promotion(i, rule) for i, rule in enumerate(rules)]
+
+    barcodes = set().union(*(promotion.eligible_barcodes
+                             for promotion in promotions))
+    found = products.get_many(barcodes)
+
+    for promotion in promotions:
+        missing = promotion.eligible_barcodes - found.keys()
+        if missing:
+            message = (f"Promotion {promotion.name!r} has barcodes "
+                       f"{sorted(missing)} not found in product database.")
+            if strict:
+                raise ValueError(message)
+            warnings.warn(message)
+        _check_saves_money(promotion, found)
+
+    return PromotionEngine(promotions)
+
+
+def _create_promotion(index: int, rule: dict[str, Any]) -> Promotion:
+    """Create a promotion from its declaration (the index-th in the file)."""
+    if not isinstance(rule, dict):
+        raise ValueError(f"Promotion {index} is not a mapping.")
+    rule = dict(rule)
+    type_name = rule.pop('type', None)
+    name = rule.get('name', index)
+    promotion_class = PROMOTION_TYPES.get(type_name)
+    if promotion_class is None:
+        raise ValueError(f"Promotion {name!r} has unknown type "
+                         f"{type_name!r}, expected one of "
+                         f"{sorted(PROMOTION_TYPES)}.")
+
+    field_names = {field.name for field in dataclasses.fields(promotion_class)
+                   if field.init}
+    unknown = rule.keys() - field_names
+    if unknown:
+        raise ValueError(f"Promotion {name!r} has unknown fields "
+                         f"{sorted(unknown)}.")
+    if 'eligible_barcodes' not in rule:
+        raise ValueError(f"Promotion {name!r} has no eligible_barcodes.")
+    try:
+        rule['eligible_barcodes'] = frozenset(
+            int(barcode) for barcode in rule['eligible_barcodes'])
+        if 'tiers' in rule:
+            # JSON keys are always strings
+            rule['tiers'] = {int(min_units): float(percent)
+                             for min_units, percent in rule['tiers'].items()}
+        promotion = promotion_class(**rule)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"Promotion {name!r} is invalid: {e}") from e
+
+    _check_parameters(promotion)
+    return promotion
+
+
+def _check_parameters(promotion: Promotion) -> None:
+    """Check the parameters of a promotion are valid."""
+    name = promotion.name
+    if isinstance(promotion, (MForN, MForNPounds, CheapestFree)):
+        if not isinstance(promotion.m, int) or promotion.m < 1:
+            raise ValueError(f"Promotion {name!r} must have m of at least "
+                             "1.")
+    if isinstance(promotion, (MForN, MForNPounds)) and promotion.n < 0:
+        raise ValueError(f"Promotion {name!r} must have n of at least 0.")
+    if isinstance(promotion, MForN) and promotion.n >= promotion.m:
+        raise ValueError(f"Promotion {name!r} must have n less than m.")
+    if isinstance(promotion, CheapestFree) \
+            and not 1 <= promotion.free < promotion.m:
+        raise ValueError(f"Promotion {name!r} must have free between 1 and "
+                         "m - 1.")
+    if isinstance(promotion, TieredQuantity):
+        if not promotion.tiers:
+            raise ValueError(f"Promotion {name!r} has no tiers.")
+        for min_units, percent in promotion.tiers.items():
+            if min_units < 1 or not 0 < percent <= 100:
+                raise ValueError(f"Promotion {name!r} tiers must have a "
+                                 "minimum of at least 1 item and between 0 "
+                                 "and 100 percent off.")
+
+
+def _check_saves_money(promotion: Promotion,
+                       products: dict[int, Product]) -> None:
+    """Warn about a promotion that can never give a discount."""
+    if isinstance(promotion, MForNPounds):
+        eligible_products = [products[barcode]
+                             for barcode in promotion.eligible_barcodes
+                             if barcode in products]
+        if not eligible_products or any(product.units is not None
+                                        for product in eligible_products):
+            # Weighed items can cost any amount
+            return
+        # The most a group of m units can cost
+        max_price = max(to_pence(product.unit_price)
+                        for product in eligible_products)
+        if max_price * promotion.m <= to_pence(promotion.n):
+            warnings.warn(f"Promotion {promotion.name!r} costs more than "
+                          "buying its items separately, so never gives a "
+                          "discount.")
+
+
+def _get_fingerprint(engine: PromotionEngine,
+                     products: ProductBackend) -> str:
+    """A hash of the prices of the products the promotions are for."""
+    barcodes = sorted(set().union(*(promotion.eligible_barcodes
+                                    for promotion in engine)))
+    found = products.get_many(barcodes)
+    prices = [(barcode, product.unit_price, product.units)
+              if (product := found.get(barcode)) is not None else barcode
+              for barcode in barcodes]
+    return hashlib.sha256(repr(prices).encode()).hexdigest()
+
+
+def _read_cache(cache_path: str,
+                source_hash: str,
+                strict: bool,
+                products: ProductBackend) -> Optional[PromotionEngine]:
+    """Load compiled promotions, if the cache is still valid."""
+    try:
+        with open(cache_path, 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError):
+        return None
+
+    if not isinstance(cache, dict) \
+            or cache.get('version') != _CACHE_VERSION \
+            or cache.get('source_hash') != source_hash \
+            or cache.get('strict') != strict:
+        return None
+    engine = cache['engine']
+    if _get_fingerprint(engine, products) != cache['fingerprint']:
+        return None
+    return engine
+
+
+def _write_cache(cache_path: str,
+                 source_hash: str,
+                 strict: bool,
+                 engine: PromotionEngine,
+                 products: ProductBackend) -> None:
+    """Save compiled promotions, replacing the cache file atomically."""
+    cache = {
+        'version': _CACHE_VERSION,
+        'source_hash': source_hash,
+        'strict': strict,
+        'fingerprint': _get_fingerprint(engine, products),
+        'engine': engine,
+    }
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        # Don't leave a partly written cache behind
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,603 @@
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional
+
+from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.money import to_pence
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import MForN, MForNPounds, Promotion
+
+# Number of search steps between checks of the time budget
+_CHECK_INTERVAL = 256
+
+
+class _BudgetExceeded(Exception):
+    """Raised when the search runs out of time."""
+
+
+@dataclass
+class SolverStats:
+    """Counts of how groups of linked products were solved.
+
+    Attributes:
+        optimal: Groups solved optimally.
+        fallbacks: Groups solved greedily, as the time budget ran out.
+    """
+
+    optimal: int = 0
+    fallbacks: int = 0
+
+
+@dataclass(eq=False)
+class _UnitType:
+    """Identical units in the basket (of the same product and price).
+
+    Attributes:
+        item: The first basket item with these units.
+        price: The price in pence of each unit.
+        count: The number of units.
+        promotions: The indices of the promotions the units are eligible for.
+    """
+
+    item: BasketItem
+    price: int
+    count: int = 0
+    promotions: tuple[int, ...] = ()
+
+    @property
+    def product_key(self) -> tuple:
+        """The key MForN counts units by."""
+        return self.item.barcode, self.item.unit_price
+
+
+@dataclass
+class _Component:
+    """Unit types linked by promotions, which are solved together.
+
+    Attributes:
+        types: The unit types, most expensive first.
+        promotions: The indices of the promotions of the unit types.
+    """
+
+    types: list[_UnitType]
+    promotions: list[int] = field(default_factory=list)
+
+
+class OptimalPromotionEngine(PromotionEngine):
+    """Applies promotions so each unit is used at most once, saving the most.
+
+    A PromotionEngine applies each promotion to the whole basket on its own,
+    so an item can be discounted by more than one promotion. Here, each unit
+    is assigned to at most one MForN or MForNPounds promotion, choosing the
+    assignment that gives the customer the largest saving.
+
+    Units are counted by product and price (rather than by basket item), and
+    products that share promotions are solved together by dynamic programming
+    over the products from most to least expensive. The state is what each
+    promotion has been given so far (e.g. the size and price of an incomplete
+    group), so the work depends on the number of distinct products rather
+    than the number of units. If solving takes longer than the time budget,
+    the remaining products are assigned greedily (applying the promotions in
+    turn to the units not yet used), so checkout latency stays bounded.
+
+    Other types of promotion are applied to their eligible items as in
+    PromotionEngine.
+
+    Attributes:
+        promotions: The promotions to apply.
+        time_budget: The number of seconds to spend on each basket before
+            falling back to greedy assignment.
+        stats: Counts of how groups of linked products were solved.
+    """
+
+    solves_jointly = True
+
+    def __init__(self,
+                 promotions: Iterable[Promotion],
+                 time_budget: float = 0.05,
+                 clock: Callable[[], float] = time.perf_counter) -> None:
+        """Initialise a promotion engine.
+
+        Args:
+            promotions: The promotions to apply.
+            time_budget: The number of seconds to spend on each basket before
+                falling back to greedy assignment. Defaults to 0.05.
+            clock: The function giving the current time in seconds. Defaults
+                to time.perf_counter.
+        """
+
+        super().__init__(promotions)
+        self.time_budget = time_budget
+        self.stats = SolverStats()
+        self._clock = clock
+
+    def get_discounts(
+            self,
+            basket_items: Iterable[BasketItem]
+    ) -> Iterator[Discount]:
+        """Calculate the discounts for the basket.
+
+        Discounts are returned in the same order as the promotions.
+        """
+
+        basket_items = list(basket_items)
+        types = self._get_unit_types(basket_items)
+
+        # Number of units of each type assigned to each promotion
+        allocations = defaultdict(dict)
+        deadline = self._clock() + self.time_budget
+        for component in self._get_components(types):
+            solver = _Solver(self, component, deadline)
+            try:
+                component_allocations = solver.solve()
+                self.stats.optimal += 1
+            except _BudgetExceeded:
+                component_allocations = solver.solve_greedy()
+                self.stats.fallbacks += 1
+            for (i, unit_type), count in component_allocations.items():
+                if count:
+                    allocations[i][id(unit_type)] = unit_type, count
+
+        other_items = self.get_eligible_items(basket_items)
+        for i, promotion in enumerate(self.promotions):
+            if _is_solved(promotion):
+                yield from self._get_solved_discounts(
+                    promotion, allocations[i].values())
+            elif i in other_items:
+                yield from self.apply_promotion(promotion, other_items[i])
+
+    def _get_unit_types(
+            self,
+            basket_items: list[BasketItem]
+    ) -> list[_UnitType]:
+        """Count the units eligible for MForN and MForNPounds promotions."""
+        types = {}
+        for item in basket_items:
+            promotions = tuple(
+                i for i in self.get_promotion_indices(item.barcode)
+                if _is_solved(self.promotions[i])
+            )
+            if not promotions:
+                continue
+            price = item.unit_line_price_pence
+            key = item.barcode, item.unit_price, price
+            unit_type = types.get(key)
+            if unit_type is None:
+                unit_type = types[key] = _UnitType(item, price,
+                                                   promotions=promotions)
+            unit_type.count += item.unit_count
+        return list(types.values())
+
+    def _get_components(self, types: list[_UnitType]) -> list[_Component]:
+        """Split unit types into groups linked by shared promotions."""
+        types_by_promotion = defaultdict(list)
+        for unit_type in types:
+            for i in unit_type.promotions:
+                types_by_promotion[i].append(unit_type)
+
+        components = []
+        seen = set()
+        for unit_type in types:
+            if id(unit_type) in seen:
+                continue
+            seen.add(id(unit_type))
+            component_types, promotions = [], set()
+            to_visit = [unit_type]
+            while to_visit:
+                current = to_visit.pop()
+                component_types.append(current)
+                for i in current.promotions:
+                    if i in promotions:
+                        continue
+                    promotions.add(i)
+                    for linked in types_by_promotion[i]:
+                        if id(linked) not in seen:
+                            seen.add(id(linked))
+                            to_visit.append(linked)
+            component_types.sort(key=lambda t: (-t.price, t.item.barcode))
+            components.append(_Component(component_types, sorted(promotions)))
+        return components
+
+    @staticmethod
+    def _get_solved_discounts(
+            promotion: Promotion,
+            allocations: Iterable[tuple[_UnitType, int]]
+    ) -> Iterator[Discount]:
+        """Get the discounts of a promotion from the units assigned to it."""
+        if isinstance(promotion, MForN):
+            counts = Counter()
+            first_items = {}
+            for unit_type, count in allocations:
+                counts[unit_type.product_key] += count
+                first_items.setdefault(unit_type.product_key, unit_type.item)
+            for key, count in counts.items():
+                yield from promotion._get_discounts_single_barcode(
+                    first_items[key], count)
+        else:
+            price_counts = Counter()
+            for unit_type, count in allocations:
+                price_counts[unit_type.price] += count
+            price_counts = sorted(price_counts.items(), reverse=True)
+            for group_price, num_groups in promotion._get_groups(price_counts):
+                discount = promotion._get_discount(group_price, num_groups)
+                if discount.line_price < 0:
+                    yield discount
+
+
+def _is_solved(promotion: Promotion) -> bool:
+    """Whether units are assigned to a promotion by the solver."""
+    return isinstance(promotion, (MForN, MForNPounds))
+
+
+class _Solver:
+    """Assigns the units of a component to promotions.
+
+    Types are considered from most to least expensive, so the units given to
+    an MForNPounds promotion arrive in the order MForNPounds groups them (and
+    for a given set of units, grouping the most expensive together gives the
+    largest saving). The state after each type holds the size and price of
+    the incomplete group of each MForNPounds promotion, and the number of
+    units towards the next group of each MForN promotion for products with
+    more than one price (e.g. weighed items), which are the only things that
+    affect the saving from later types.
+
+    The units of a type are used to complete incomplete groups, to make whole
+    groups of the type alone, and to start new incomplete groups. Whole groups
+    don't depend on the state, so the best mix of them is found once per type
+    (as an unbounded knapsack), leaving only a handful of choices per state.
+    """
+
+    def __init__(self,
+                 engine: OptimalPromotionEngine,
+                 component: _Component,
+                 deadline: float) -> None:
+        self.types = component.types
+        self.promotions = [engine.promotions[i]
+                           for i in component.promotions]
+        self.indices = component.promotions
+        self._clock = engine._clock
+        self._deadline = deadline
+        self._steps = 0
+        self._memo = {}
+
+        # State slots: one per MForNPounds promotion, and one per MForN
+        # promotion and product with more than one type
+        positions = {i: j for j, i in enumerate(component.promotions)}
+        type_counts = Counter(t.product_key for t in self.types)
+        last_types = {}
+        for k, unit_type in enumerate(self.types):
+            last_types[unit_type.product_key] = k
+            for i in unit_type.promotions:
+                last_types[i] = k
+        self._slots = {}
+        for k, unit_type in enumerate(self.types):
+            for i in unit_type.promotions:
+                j = positions[i]
+                promotion = self.promotions[j]
+                if isinstance(promotion, MForNPounds):
+                    self._slots.setdefault((j, None), len(self._slots))
+                elif type_counts[unit_type.product_key] > 1:
+                    self._slots.setdefault((j, unit_type.product_key),
+                                           len(self._slots))
+
+        # Options for each type: (promotion position, slot, whether the slot
+        # is reset after this type)
+        self._options = []
+        for k, unit_type in enumerate(self.types):
+            options = []
+            for i in unit_type.promotions:
+                j = positions[i]
+                if isinstance(self.promotions[j], MForNPounds):
+                    options.append(
+                        (j, self._slots[j, None], last_types[i] == k))
+                elif (j, unit_type.product_key) in self._slots:
+                    is_last = last_types[unit_type.product_key] == k
+                    options.append(
+                        (j, self._slots[j, unit_type.product_key], is_last))
+            self._options.append(options)
+
+        # The knapsack of whole groups for each type, built by solve (as
+        # it takes time proportional to the number of units)
+        self._positions = [[positions[i] for i in unit_type.promotions]
+                           for unit_type in self.types]
+        self._knapsacks = []
+
+    def solve(self) -> dict[tuple[int, _UnitType], int]:
+        """Find the assignment of units with the largest saving.
+
+        Raises:
+            _BudgetExceeded: If the deadline passes while solving.
+        """
+
+        self._check_deadline()
+        self._knapsacks = [self._get_knapsack(unit_type, positions)
+                           for unit_type, positions
+                           in zip(self.types, self._positions)]
+
+        initial = self._initial_state()
+        self._search(initial)
+
+        allocations = Counter()
+        state = initial
+        for k, unit_type in enumerate(self.types):
+            _, choice, state, rest = self._memo[k, state]
+            counts = self._get_knapsack_counts(k, rest)
+            counts.update(dict(choice))
+            for j, count in counts.items():
+                allocations[self.indices[j], unit_type] += count
+        return allocations
+
+    def solve_greedy(self) -> dict[tuple[int, _UnitType], int]:
+        """Assign units by applying each promotion in turn."""
+        remaining = {id(t): t.count for t in self.types}
+        allocations = Counter()
+        for j, promotion in enumerate(self.promotions):
+            i = self.indices[j]
+            types = [t for t in self.types if i in t.promotions]
+            if isinstance(promotion, MForN):
+                by_product = defaultdict(list)
+                for unit_type in types:
+                    by_product[unit_type.product_key].append(unit_type)
+                for product_types in by_product.values():
+                    total = sum(remaining[id(t)] for t in product_types)
+                    to_take = total - total % promotion.m
+                    for unit_type in product_types:
+                        count = min(to_take, remaining[id(unit_type)])
+                        allocations[i, unit_type] += count
+                        remaining[id(unit_type)] -= count
+                        to_take -= count
+            else:
+                self._allocate_groups_greedily(promotion, i, types,
+                                               remaining, allocations)
+        return allocations
+
+    def _allocate_groups_greedily(self,
+                                  promotion: MForNPounds,
+                                  i: int,
+                                  types: list[_UnitType],
+                                  remaining: dict[int, int],
+                                  allocations: Counter) -> None:
+        """Assign groups of the most expensive units, while they save money."""
+        m, group_cost = promotion.m, to_pence(promotion.n)
+        partial_size, partial_price, partial = 0, 0, []
+        for unit_type in types:
+            count = remaining[id(unit_type)]
+            price = unit_type.price
+
+            # Complete the group started by more expensive units
+            if partial_size and count:
+                num_taken = min(count, m - partial_size)
+                partial_size += num_taken
+                partial_price += price * num_taken
+                partial.append((unit_type, num_taken))
+                count -= num_taken
+                if partial_size < m:
+                    continue
+                if partial_price <= group_cost:
+                    return
+                for partial_type, num in partial:
+                    allocations[i, partial_type] += num
+                    remaining[id(partial_type)] -= num
+                partial_size, partial_price, partial = 0, 0, []
+
+            # Groups made up entirely of units of this type
+            if count >= m:
+                if price * m <= group_cost:
+                    return
+                num_taken = count - count % m
+                allocations[i, unit_type] += num_taken
+                remaining[id(unit_type)] -= num_taken
+                count -= num_taken
+
+            if count:
+                partial_size, partial_price = count, price * count
+                partial = [(unit_type, count)]
+
+    def _initial_state(self) -> tuple:
+        state = []
+        for j, key in self._slots:
+            if isinstance(self.promotions[j], MForNPounds):
+                state.append((0, 0))
+            else:
+                state.append(0)
+        return tuple(state)
+
+    def _check_deadline(self) -> None:
+        """Raise _BudgetExceeded if the deadline has passed."""
+        if self._clock() > self._deadline:
+            raise _BudgetExceeded()
+
+    def _search(self, initial: tuple) -> None:
+        """Find the best choice for each state reachable from the initial one.
+
+        The memo holds, for each (type, state), the largest saving in pence
+        from the types from there onwards, the choice, the next state and
+        the units left for whole groups. States are searched depth first,
+        with an explicit stack (as a component can have thousands of types).
+        """
+
+        num_types = len(self.types)
+
+        def get_saving(k: int, state: tuple) -> int:
+            return 0 if k == num_types else self._memo[k, state][0]
+
+        # Each frame: type, state, choices, index of the next choice, best
+        stack = [[0, initial, None, 0, None]]
+        while stack:
+            frame = stack[-1]
+            k, state, choices, c, best = frame
+            if choices is None:
+                if k == num_types or (k, state) in self._memo:
+                    stack.pop()
+                    continue
+                self._steps += 1
+                if self._steps % _CHECK_INTERVAL == 0:
+                    self._check_deadline()
+                choices = frame[2] = list(self._get_choices(k, state))
+
+            unit_type = self.types[k]
+            knapsack = self._knapsacks[k]
+            while c < len(choices):
+                choice, saving, new_state, used = choices[c]
+                if k + 1 < num_types and (k + 1, new_state) not in self._memo:
+                    break
+                rest = unit_type.count - used
+                saving += knapsack[rest][0] + get_saving(k + 1, new_state)
+                if best is None or saving > best[0]:
+                    best = saving, choice, new_state, rest
+                c += 1
+            frame[3], frame[4] = c, best
+
+            if c < len(choices):
+                # Solve the next state first
+                stack.append([k + 1, choices[c][2], None, 0, None])
+            else:
+                self._memo[k, state] = best
+                stack.pop()
+
+    def _get_choices(
+            self,
+            k: int,
+            state: tuple
+    ) -> Iterator[tuple[tuple, int, tuple, int]]:
+        """Ways of using the units of a type for incomplete groups.
+
+        Yields:
+            The number of units given to each promotion, the saving in pence,
+            the new state, and the total number of units used.
+        """
+
+        unit_type = self.types[k]
+        options = self._options[k]
+
+        def choose(o: int, available: int, choice: tuple, saving: int,
+                   state: list) -> Iterator[tuple[tuple, int, tuple, int]]:
+            if o == len(options):
+                yield (choice, saving, tuple(state),
+                       unit_type.count - available)
+                return
+            j, slot, reset = options[o]
+            for count, extra, slot_state in self._get_partial_choices(
+                    self.promotions[j], unit_type, state[slot], available,
+                    reset):
+                new_state = list(state)
+                new_state[slot] = slot_state
+                new_choice = choice + ((j, count),) if count else choice
+                yield from choose(o + 1, available - count, new_choice,
+                                  saving + extra, new_state)
+
+        yield from choose(0, unit_type.count, (), 0, list(state))
+
+    @staticmethod
+    def _get_partial_choices(
+            promotion: Promotion,
+            unit_type: _UnitType,
+            slot_state,
+            available: int,
+            reset: bool
+    ) -> Iterator[tuple[int, int, object]]:
+        """Ways of giving units of a type to a promotion with state.
+
+        The units either add to (or complete) the incomplete group, and can
+        then start a new one. Whole groups are left to the knapsack.
+
+        Yields:
+            The number of units, the saving in pence and the new slot state.
+        """
+
+        price, m = unit_type.price, promotion.m
+        if isinstance(promotion, MForNPounds):
+            size, group_price = slot_state
+            group_cost = to_pence(promotion.n)
+            empty = 0, 0
+            # Units only start groups that can save money (as they are the
+            # most expensive in the group)
+            worth_starting = not reset and price * m > group_cost
+
+            def partial(size: int, group_price: int) -> tuple[int, int]:
+                return size, group_price
+        else:
+            size, group_price = slot_state, 0
+            empty = 0
+            worth_starting = not reset
+
+            def partial(size: int, group_price: int) -> int:
+                return size
+
+        yield 0, 0, empty if reset else slot_state
+
+        completed, saving = 0, 0
+        if size:
+            needed = m - size
+            if not reset:
+                for count in range(1, min(available, needed - 1) + 1):
+                    yield count, 0, partial(size + count,
+                                            group_price + price * count)
+            if available < needed:
+                return
+            completed = needed
+            if isinstance(promotion, MForNPounds):
+                saving = max(group_price + price * needed - group_cost, 0)
+            else:
+                saving = _m_for_n_saving(promotion, unit_type)
+            yield completed, saving, empty
+
+        if worth_starting:
+            for count in range(1, min(available - completed, m - 1) + 1):
+                yield (completed + count, saving,
+                       partial(count, price * count))
+
+    def _get_knapsack(self,
+                      unit_type: _UnitType,
+                      positions: list[int]) -> list[tuple[int, Optional[int]]]:
+        """The best use of each number of units in whole groups.
+
+        Entry r is the largest saving in pence from r units, and the promotion
+        of the last group used (see _get_knapsack_counts).
+        """
+
+        savings = {}
+        for j in positions:
+            promotion = self.promotions[j]
+            if isinstance(promotion, MForNPounds):
+                saving = unit_type.price * promotion.m \
+                    - to_pence(promotion.n)
+            else:
+                saving = _m_for_n_saving(promotion, unit_type)
+            if saving > 0:
+                savings[j] = saving
+
+        table = [(0, None)]
+        if not savings:
+            return table * (unit_type.count + 1)
+
+        positions = list(savings)
+        for r in range(1, unit_type.count + 1):
+            if r % _CHECK_INTERVAL == 0:
+                self._check_deadline()
+            best = table[r - 1][0], None
+            for j in positions:
+                m = self.promotions[j].m
+                if m <= r and table[r - m][0] + savings[j] > best[0]:
+                    best = table[r - m][0] + savings[j], j
+            table.append(best)
+        return table
+
+    def _get_knapsack_counts(self, k: int, r: int) -> Counter:
+        """The units given to each MForN promotion in a knapsack entry."""
+        knapsack = self._knapsacks[k]
+        counts = Counter()
+        while r:
+            j = knapsack[r][1]
+            if j is None:
+                r -= 1
+            else:
+                counts[j] += self.promotions[j].m
+                r -= self.promotions[j].m
+        return counts
+
+
+def _m_for_n_saving(promotion: MForN, unit_type: _UnitType) -> int:
+    """The saving in pence from a group of an MForN promotion."""
+    return to_pence(unit_type.item.unit_price) * (promotion.m - promotion.n)
@@ -1,11 +1,12 @@
+import math
 from abc import ABC, abstractmethod
 from collections import Counter
 from dataclasses import dataclass
-from typing import Iterator, Iterable
-
-import more_itertools
+from typing import ClassVar, Iterator, Iterable
 
+from shoppingbasket import instrumentation
 from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.money import from_pence, to_pence
 
 
 @dataclass  # Is dataclass the right choice here?
@@ -15,13 +16,21 @@ class Promotion(ABC):
     Attributes:
         name: The name of the promotion.
         eligible_barcodes: The barcodes of items that are eligible for the
+        per_barcode: Whether the discounts for each barcode only depend on the
+            items with that barcode (used to update running totals).
     """
 
     name: str
     eligible_barcodes: set[int]
+    per_barcode: ClassVar[bool] = False
 
     def list_eligible_items(self, basket_items: list[BasketItem]) -> list[BasketItem]:
         """Get the basket_items that are eligible for the promotion."""
+        recorder = instrumentation.recorder
+        if recorder is not None:
+            recorder.increment(instrumentation.ELIGIBLE_ITEMS_SCANNED,
+                               len(basket_items),
+                               (('promotion', self.name),))
         return [item for item in basket_items
                 if item.barcode in self.eligible_barcodes]
 
@@ -42,8 +51,8 @@ class MForN(Promotion):
     """Promo where you get m items for the price of n.
 
     For example, 3 for the price of 2. This can only be applied to are group of
-    items that are the same product, e.g. 3 cans of beans (this doesn't work
-    for, e.g. "buy 3 get the cheapest free" for different products).
+    items that are the same product, e.g. 3 cans of beans (for "buy 3 get the
+    cheapest free" across different products, see CheapestFree).
 
     If multiple barcodes are supplied, the promotion will be applied to each
     barcode separately.
@@ -60,16 +69,29 @@ class MForN(Promotion):
     eligible_barcodes: set[int]
     m: int = 3  # Number of items required for discount
     n: int = 2  # Number of items that are paid for
+    per_barcode: ClassVar[bool] = True
 
     def get_discounts(
             self,
             basket_items: list[BasketItem]
     ) -> Iterator[Discount]:
-        """Calculate the discounts for a list of items."""
+        """Calculate the discounts for a list of items.
+
+        Items are counted by barcode (and price), using the number of units
+        in each line, so there is one discount per barcode however many times
+        it is applied.
+        """
+
         eligible_items = self.list_eligible_items(basket_items)
-        item_counts = Counter(eligible_items)
-        for item, item_count in item_counts.items():
-            yield from self._get_discounts_single_barcode(item, item_count)
+        item_counts = Counter()
+        first_items = {}
+        for item in eligible_items:
+            key = item.barcode, item.unit_price
+            item_counts[key] += item.unit_count
+            first_items.setdefault(key, item)
+        for key, item_count in item_counts.items():
+            yield from self._get_discounts_single_barcode(first_items[key],
+                                                          item_count)
 
     def _get_discounts_single_barcode(
             self,
@@ -80,8 +102,8 @@ class MForN(Promotion):
 
         The discount amount for each individual discount will simply be the
         unit price of the item multiplied by the number of free items in the
-        discount (m - n). We then apply the discount repeatedly for how many
-        groups size m there are.
+        discount (m - n). We then apply the discount (as a single Discount,
+        with a quantity) for how many groups size m there are.
 
         Args:
             basket_item: A basket item.
@@ -91,11 +113,11 @@ class MForN(Promotion):
             The discounts.
         """
 
-        discount_amount = basket_item.unit_price * (self.m - self.n)
-        discount = Discount(self.name, discount_amount)
         num_discounts = item_count // self.m
-        for _ in range(num_discounts):
-            yield discount
+        if num_discounts > 0:
+            unit_price = to_pence(basket_item.unit_price)
+            discount_amount = from_pence(unit_price * (self.m - self.n))
+            yield Discount(self.name, discount_amount, quantity=num_discounts)
 
 
 @dataclass
@@ -125,33 +147,254 @@ class MForNPounds(Promotion):
             self,
             basket_items: list[BasketItem]
     ) -> Iterator[Discount]:
-        """Calculate the discounts for a list of items."""
+        """Calculate the discounts for a list of items.
 
-        eligible_items = self.list_eligible_items(basket_items)
+        Rather than sorting and splitting every individual unit, the units are
+        counted at each price, and groups of identical units are discounted
+        together (as a single Discount, with a quantity).
+        """
 
-        # Sort so we discount most expensive items first
-        eligible_items.sort(reverse=True, key=lambda item: item.line_price)
+        eligible_items = self.list_eligible_items(basket_items)
 
-        # Split into groups of m items
-        item_groups = more_itertools.chunked(eligible_items, self.m)
+        # Count units at each price, so we discount most expensive items first
+        price_counts = Counter()
+        for item in eligible_items:
+            price_counts[item.unit_line_price_pence] += item.unit_count
+        price_counts = sorted(price_counts.items(), reverse=True)
 
-        for items in item_groups:
-            if len(items) < self.m:
-                break
-            discount = self._get_discount(items)
+        for group_price, num_groups in self._get_groups(price_counts):
+            discount = self._get_discount(group_price, num_groups)
             if discount.line_price < 0:
                 yield discount
 
-    def _get_discount(self, items: list[BasketItem]) -> Discount:
-        """Calculate the discount for a set of items.
+    def _get_groups(
+            self,
+            price_counts: list[tuple[int, int]]
+    ) -> Iterator[tuple[int, int]]:
+        """Split units into groups of m (most expensive first).
+
+        Any incomplete group at the end is left out.
 
         Args:
-            items: A list of items.
+            price_counts: The number of units at each price (in pence), in
+                descending order of price.
+
+        Returns:
+            The total price of each group, and the number of consecutive
+            groups with that total price.
+        """
+
+        m = self.m
+        groups = []
+        partial_price, partial_size = 0, 0
+
+        def add_groups(group_price: int, num_groups: int) -> None:
+            if groups and groups[-1][0] == group_price:
+                groups[-1][1] += num_groups
+            else:
+                groups.append([group_price, num_groups])
+
+        for price, count in price_counts:
+            # Complete the group started by more expensive units
+            if partial_size:
+                num_taken = min(count, m - partial_size)
+                partial_price += price * num_taken
+                partial_size += num_taken
+                count -= num_taken
+                if partial_size == m:
+                    add_groups(partial_price, 1)
+                    partial_price, partial_size = 0, 0
+
+            # Groups made up entirely of units at this price
+            if count >= m:
+                add_groups(price * m, count // m)
+                count %= m
+
+            # Start a new group with the remaining units
+            if count:
+                partial_price, partial_size = price * count, count
+
+        for group_price, num_groups in groups:
+            yield group_price, num_groups
+
+    def _get_discount(self, group_price: int, num_groups: int) -> Discount:
+        """Calculate the discount for a number of identical groups of items.
+
+        Args:
+            group_price: The total price of each group of items, in pence.
+            num_groups: The number of groups.
 
         Returns:
             The discount.
         """
 
-        items_subtotal = sum(item.line_price for item in items)
-        discount_amount = items_subtotal - self.n
-        return Discount(self.name, discount_amount)
+        discount_amount = group_price - to_pence(self.n)
+        return Discount(self.name, from_pence(discount_amount),
+                        quantity=num_groups)
+
+
+@dataclass
+class CheapestFree(Promotion):
+    """Promo where you buy m items from a set and get the cheapest free.
+
+    For example, "buy 3 get the cheapest free" across a range of products.
+    Units are sorted by price (most expensive first) and split into groups of
+    m, and the cheapest `free` units of each full group are free, so the
+    customer can't make an expensive item free by adding cheap ones.
+
+    Attributes:
+        name: The name of the promotion.
+        eligible_barcodes: The barcodes of items that are eligible for the
+            promotion.
+        m: The number of items required for the discount.
+        free: The number of items in each group that are free.
+    """
+
+    name: str
+    eligible_barcodes: set[int]
+    m: int = 3  # Number of items required for discount
+    free: int = 1  # Number of (cheapest) items in each group that are free
+
+    def get_discounts(
+            self,
+            basket_items: list[BasketItem]
+    ) -> Iterator[Discount]:
+        """Calculate the discounts for a list of items.
+
+        Units are counted at each price, and the number of free units at each
+        price is calculated from their positions in the sorted order (without
+        splitting them into groups), with one Discount per price.
+        """
+
+        eligible_items = self.list_eligible_items(basket_items)
+        price_counts = Counter()
+        for item in eligible_items:
+            price_counts[item.unit_line_price_pence] += item.unit_count
+
+        num_units = sum(price_counts.values())
+        full_units = num_units - num_units % self.m
+
+        position = 0
+        for price, count in sorted(price_counts.items(), reverse=True):
+            num_free = (self._count_free(position + count, full_units)
+                        - self._count_free(position, full_units))
+            position += count
+            if num_free and price:
+                yield Discount(self.name, from_pence(price),
+                               quantity=num_free)
+
+    def _count_free(self, position: int, full_units: int) -> int:
+        """The number of free units before a position in the sorted order.
+
+        Args:
+            position: The position, counting from the most expensive unit.
+            full_units: The number of units in full groups.
+
+        Returns:
+            The number of free units.
+        """
+
+        position = min(position, full_units)
+        num_groups, rank = divmod(position, self.m)
+        return num_groups * self.free + max(0, rank - (self.m - self.free))
+
+
+@dataclass
+class TieredQuantity(Promotion):
+    """Promo where buying more items from a set gives a bigger discount.
+
+    For example, 10% off when buying 2 or more items from a range, and 20%
+    off when buying 5 or more. The discount is taken off the total price of
+    the eligible items, at the highest tier reached, rounded down to a whole
+    number of pence.
+
+    Attributes:
+        name: The name of the promotion.
+        eligible_barcodes: The barcodes of items that are eligible for the
+            promotion.
+        tiers: The percentage off, keyed by the minimum number of items.
+    """
+
+    name: str
+    eligible_barcodes: set[int]
+    tiers: dict[int, float]  # Percentage off, by minimum number of items
+
+    def get_discounts(
+            self,
+            basket_items: list[BasketItem]
+    ) -> Iterator[Discount]:
+        """Calculate the discounts for a list of items.
+
+        The eligible units are counted (using the number of units in each
+        line) and their prices summed, giving a single Discount.
+        """
+
+        eligible_items = self.list_eligible_items(basket_items)
+        num_units = 0
+        total = 0
+        for item in eligible_items:
+            num_units += item.unit_count
+            total += item.line_price_pence
+
+        percent = self._get_percent(num_units)
+        if percent:
+            discount_amount = math.floor(round(total * percent / 100, 6))
+            if discount_amount:
+                yield Discount(self.name, from_pence(discount_amount))
+
+    def _get_percent(self, num_units: int) -> float:
+        """The percentage off for a number of units (0 below every tier)."""
+        percent = 0
+        best = 0
+        for min_units, tier_percent in self.tiers.items():
+            if best < min_units <= num_units:
+                best = min_units
+                percent = tier_percent
+        return percent
+
+
+@dataclass
+class SpendXGetYOff(Promotion):
+    """Promo where spending at least x on a set of items takes y off.
+
+    For example, spend £20 on wine and get £5 off. With repeat set, the
+    discount is given for every x spent (e.g. £10 off for spending £40).
+
+    Attributes:
+        name: The name of the promotion.
+        eligible_barcodes: The barcodes of items that are eligible for the
+            promotion.
+        x: The amount to spend on eligible items.
+        y: The amount taken off.
+        repeat: Whether the discount is given for every x spent.
+    """
+
+    name: str
+    eligible_barcodes: set[int]
+    x: float = 20.0  # Amount to spend
+    y: float = 5.0  # Amount taken off
+    repeat: bool = False
+
+    def __post_init__(self) -> None:
+        # Compared in pence, as the discount is rounded to a penny
+        if not 0 < to_pence(self.y) <= to_pence(self.x):
+            raise ValueError(f"SpendXGetYOff must have y between 0 and x, "
+                             f"got y={self.y} and x={self.x}.")
+
+    def get_discounts(
+            self,
+            basket_items: list[BasketItem]
+    ) -> Iterator[Discount]:
+        """Calculate the discounts for a list of items.
+
+        The prices of the eligible items are summed, giving a single Discount
+        (with the number of times it is given as its quantity).
+        """
+
+        eligible_items = self.list_eligible_items(basket_items)
+        total = sum(item.line_price_pence for item in eligible_items)
+        spend = to_pence(self.x)
+        num_discounts = total // spend if self.repeat else int(total >= spend)
+        if num_discounts > 0:
+            yield Discount(self.name, from_pence(to_pence(self.y)),
+                           quantity=num_discounts)
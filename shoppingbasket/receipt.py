@@ -0,0 +1,224 @@
+import textwrap
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, TextIO
+
+if TYPE_CHECKING:
+    from shoppingbasket.invoice import Invoice
+
+# Characters the formatter measures itself (one column each). Anything else
+# is left to Texttable, which knows the width of every character.
+_NARROW_CHARS = frozenset('£')
+
+# Space between the columns, as drawn by Texttable without vertical lines
+_COLUMN_GAP = ' ' * 3
+
+# ESC/POS commands
+_ESC_POS_INIT = b'\x1b@'
+_ESC_POS_CODE_PAGE = b'\x1bt\x13'  # PC858 (Latin-1 with £ and €)
+_ESC_POS_FEED = b'\x1bd'
+_ESC_POS_CUT = b'\x1dV\x00'
+_ESC_POS_ENCODING = 'cp858'
+
+_Row = tuple[str, str]
+
+
+class ReceiptFormatter:
+    """Formats invoices as fixed width plain text.
+
+    The layout is the same as Invoice.to_string (a two column table drawn by
+    Texttable, with the item descriptions on the left and prices on the
+    right), but lines are generated directly from the rows of the invoice,
+    and can be written to a file (or a socket's file object) one at a time.
+
+    Column widths are those Texttable would choose: the widest cell in each
+    column, shrunk to fit max_width if needed (with long descriptions
+    wrapped). Invoices with text the formatter can't measure exactly (e.g.
+    wide characters or tabs) are drawn by Texttable instead.
+
+    Attributes:
+        max_width: The maximum width of a line.
+    """
+
+    header: _Row = ('Item', 'Price')
+
+    def __init__(self, max_width: int = 80) -> None:
+        """Initialise a formatter.
+
+        Args:
+            max_width: The maximum width of a line. Defaults to 80.
+        """
+
+        self.max_width = max_width
+
+    def format(self, invoice: 'Invoice') -> str:
+        """Format an invoice as a string."""
+        return '\n'.join(self.iter_lines(invoice))
+
+    def write(self, invoice: 'Invoice', stream: TextIO) -> None:
+        """Write an invoice to a text stream, a line at a time."""
+        for line in self.iter_lines(invoice):
+            stream.write(line + '\n')
+
+    def iter_lines(self, invoice: 'Invoice') -> Iterator[str]:
+        """Generate the lines of an invoice (without line endings)."""
+        rows = invoice.get_rows()
+        if not all(_is_plain(cell) for row in rows for cell in row):
+            yield from _draw_table(self.header, rows,
+                                   self.max_width).split('\n')
+            return
+
+        widths = self._get_widths(rows)
+        yield from self._format_row(self.header, widths, is_header=True)
+        yield '==='.join('=' * width for width in widths)
+        for row in rows:
+            yield from self._format_row(row, widths)
+
+    def _get_widths(self, rows: list[_Row]) -> list[int]:
+        """The width of each column, as chosen by Texttable."""
+        widths = [len(cell) for cell in self.header]
+        for row in rows:
+            for i, cell in enumerate(row):
+                for line in cell.split('\n'):
+                    if len(line) > widths[i]:
+                        widths[i] = len(line)
+
+        available = self.max_width - len(_COLUMN_GAP)
+        if sum(widths) > available:
+            if available < len(widths):
+                raise ValueError("max_width too low to render data")
+            # Share out the space a column at a time
+            new_widths = [0] * len(widths)
+            i = 0
+            while available > 0:
+                if new_widths[i] < widths[i]:
+                    new_widths[i] += 1
+                    available -= 1
+                i = (i + 1) % len(widths)
+            widths = new_widths
+        return widths
+
+    @staticmethod
+    def _format_line(cells: _Row, widths: list[int]) -> str:
+        """Format a line of a row (left and right aligned)."""
+        description, price = cells
+        return (description.ljust(widths[0]) + _COLUMN_GAP
+                + price.rjust(widths[1]))
+
+    def _format_row(self,
+                    row: _Row,
+                    widths: list[int],
+                    is_header: bool = False) -> Iterator[str]:
+        """Format a row, which may take more than one line."""
+        description_lines = _wrap(row[0], widths[0])
+        price_lines = _wrap(row[1], widths[1])
+        if len(description_lines) == 1 and len(price_lines) == 1:
+            yield self._format_line((description_lines[0], price_lines[0]),
+                                    widths)
+            return
+
+        # Descriptions are aligned to the middle and prices to the bottom
+        # (or both to the top, in the header)
+        num_lines = max(len(description_lines), len(price_lines))
+        missing = num_lines - len(description_lines)
+        top = 0 if is_header else missing // 2
+        description_lines = [''] * top + description_lines \
+            + [''] * (missing - top)
+        missing = num_lines - len(price_lines)
+        top = 0 if is_header else missing
+        price_lines = [''] * top + price_lines + [''] * (missing - top)
+
+        for line in zip(description_lines, price_lines):
+            yield self._format_line(line, widths)
+
+
+class EscPosFormatter(ReceiptFormatter):
+    """Formats invoices for ESC/POS thermal receipt printers.
+
+    The receipt has the same layout as ReceiptFormatter, encoded in code page
+    PC858 (which has £), after the command to initialise the printer.
+    Receipt printers are usually 42 or 48 characters wide, so max_width
+    should be set to match.
+
+    Attributes:
+        max_width: The maximum width of a line.
+        feed_lines: The number of blank lines to feed after the receipt.
+        cut: Whether to cut the paper after the receipt.
+    """
+
+    def __init__(self,
+                 max_width: int = 48,
+                 feed_lines: int = 3,
+                 cut: bool = True) -> None:
+        """Initialise a formatter.
+
+        Args:
+            max_width: The maximum width of a line. Defaults to 48.
+            feed_lines: The number of blank lines to feed after the receipt.
+                Defaults to 3.
+            cut: Whether to cut the paper after the receipt. Defaults to True.
+        """
+
+        super().__init__(max_width)
+        self.feed_lines = feed_lines
+        self.cut = cut
+
+    def to_bytes(self, invoice: 'Invoice') -> bytes:
+        """Format an invoice as ESC/POS commands."""
+        return b''.join(self.iter_chunks(invoice))
+
+    def write(self, invoice: 'Invoice', stream: BinaryIO) -> None:
+        """Write an invoice to a binary stream (e.g. a printer or socket)."""
+        for chunk in self.iter_chunks(invoice):
+            stream.write(chunk)
+
+    def iter_chunks(self, invoice: 'Invoice') -> Iterator[bytes]:
+        """Generate the ESC/POS commands for an invoice."""
+        yield _ESC_POS_INIT + _ESC_POS_CODE_PAGE
+        for line in self.iter_lines(invoice):
+            yield (line + '\n').encode(_ESC_POS_ENCODING, errors='replace')
+        if self.feed_lines:
+            yield _ESC_POS_FEED + bytes([self.feed_lines])
+        if self.cut:
+            yield _ESC_POS_CUT
+
+
+def _is_plain(text: str) -> bool:
+    """Whether text can be measured and drawn without Texttable."""
+    if not (text.isascii() or all(c.isascii() or c in _NARROW_CHARS
+                                  for c in text)):
+        return False
+    if '\t' in text:
+        return False
+    # Texttable formats text that looks like a number (e.g. '1.5' as '1.500')
+    try:
+        float(text)
+    except ValueError:
+        return True
+    return False
+
+
+def _wrap(text: str, width: int) -> list[str]:
+    """Split a cell into lines of at most width, as Texttable does."""
+    lines = []
+    for line in text.split('\n'):
+        if line.strip() == '':
+            lines.append('')
+        elif len(line) <= width and not line[-1].isspace() \
+                and line.isprintable():
+            lines.append(line)
+        else:
+            lines.extend(textwrap.wrap(line, width))
+    return lines
+
+
+def _draw_table(header: _Row, rows: Iterable[_Row], max_width: int) -> str:
+    """Draw the rows of an invoice with Texttable."""
+    from texttable import Texttable
+
+    tbl = Texttable(max_width=max_width)
+    tbl.set_deco(Texttable.HEADER)
+    tbl.set_header_align(['l', 'r'])
+    tbl.set_cols_align(['l', 'r'])
+    tbl.set_cols_valign(['m', 'b'])
+    tbl.header(list(header))
+    tbl.add_rows(rows, header=False)
+    return tbl.draw()
@@ -0,0 +1,187 @@
+from collections import Counter, defaultdict
+from typing import Iterator, Optional, Union
+
+from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.money import from_pence
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import Promotion
+
+
+class RunningTotal:
+    """Keeps the totals of a basket up to date as items are added and removed.
+
+    An Invoice reruns every promotion over the whole basket when it is created,
+    which is wasteful when the total is displayed after every scan. Instead,
+    the running total only updates the promotions that the added or removed
+    item is eligible for, and only over the items eligible for them. For
+    promotions that are applied to each barcode separately (e.g. MForN), only
+    the items with the same barcode are considered.
+
+    So each scan (or removal) costs time in proportion to the number of
+    lines it affects, not the size of the basket: the lines with the same
+    barcode for per barcode promotions, but every line eligible for the
+    promotion for promotions over a set of products (e.g. MForNPounds,
+    CheapestFree and SpendXGetYOff), which are recalculated in full. With a
+    cache_size, the engine reuses the discounts calculated for sets of
+    eligible items seen before.
+
+    With an engine that solves promotions jointly (an OptimalPromotionEngine,
+    where each unit is used by at most one promotion), promotions that share
+    products can't be updated one at a time. Instead, promotions are grouped
+    into sets linked by shared barcodes, and the whole set an item is
+    eligible for is recalculated with the engine, over the items eligible for
+    any of its promotions.
+
+    Totals are accumulated in integer pence, so they don't drift as items are
+    added and removed.
+
+    Attributes:
+        engine: The promotion engine used to find the promotions an item is
+            eligible for.
+        barcode_counts: The number of units in the basket for each barcode
+            (see BasketItem.unit_count), however they are split into lines.
+        subtotal_pence: The total price in pence of items in the basket.
+        discount_total_pence: The total price in pence of discounts.
+    """
+
+    def __init__(
+            self,
+            promotions: Optional[Union[list[Promotion],
+                                       PromotionEngine]] = None
+    ) -> None:
+        """Initialise an empty running total.
+
+        Args:
+            promotions: The promotions to apply to the basket.
+        """
+
+        if promotions is None:
+            promotions = []
+        if not isinstance(promotions, PromotionEngine):
+            promotions = PromotionEngine(promotions)
+        self.engine = promotions
+        self.barcode_counts = Counter()
+        self.subtotal_pence = 0
+        self.discount_total_pence = 0
+
+        # Eligible items and current discounts, for each promotion (or each
+        # promotion and barcode, for promotions applied per barcode)
+        self._eligible_items = defaultdict(list)
+        self._discounts = {}
+
+        # For engines that solve promotions jointly, the first promotion of
+        # the set of linked promotions each promotion belongs to
+        self._linked = (self._link_promotions()
+                        if self.engine.solves_jointly else None)
+
+    def add(self, basket_item: BasketItem) -> None:
+        """Update the totals for an item added to the basket."""
+        self.subtotal_pence += basket_item.line_price_pence
+        if basket_item.barcode is None:
+            return
+
+        self.barcode_counts[basket_item.barcode] += basket_item.unit_count
+        for key in self._get_keys(basket_item.barcode):
+            self._eligible_items[key].append(basket_item)
+            self._update_discounts(key)
+
+    def remove(self, basket_item: BasketItem) -> None:
+        """Update the totals for an item removed from the basket."""
+        self.subtotal_pence -= basket_item.line_price_pence
+        if basket_item.barcode is None:
+            return
+
+        self.barcode_counts[basket_item.barcode] -= basket_item.unit_count
+        if self.barcode_counts[basket_item.barcode] == 0:
+            del self.barcode_counts[basket_item.barcode]
+        for key in self._get_keys(basket_item.barcode):
+            self._eligible_items[key].remove(basket_item)
+            self._update_discounts(key)
+
+    @property
+    def discounts(self) -> Iterator[Discount]:
+        """The discounts currently applied to the basket."""
+        for discounts in self._discounts.values():
+            yield from discounts
+
+    @property
+    def total_pence(self) -> int:
+        """The total price in pence of items in the basket after discounts."""
+        return self.subtotal_pence + self.discount_total_pence
+
+    @property
+    def subtotal(self) -> float:
+        """The total price of items in the basket before discounts."""
+        return from_pence(self.subtotal_pence)
+
+    @property
+    def discount_total(self) -> float:
+        """The total price of discounts in the basket."""
+        return from_pence(self.discount_total_pence)
+
+    @property
+    def total(self) -> float:
+        """The total price of items in the basket after discounts."""
+        return from_pence(self.total_pence)
+
+    def _get_keys(self, barcode: int) -> Iterator[tuple[int, Optional[int]]]:
+        """The promotion state keys affected by an item with this barcode.
+
+        Each key is the index of the promotion, and the barcode if the
+        promotion is applied to each barcode separately (None otherwise).
+        """
+
+        if self._linked is not None:
+            # Every promotion of the barcode is in the same linked set
+            indices = self.engine.get_promotion_indices(barcode)
+            if indices:
+                yield self._linked[indices[0]], None
+            return
+
+        for i in self.engine.get_promotion_indices(barcode):
+            yield i, barcode if self.engine.promotions[i].per_barcode else None
+
+    def _link_promotions(self) -> list[int]:
+        """Group promotions into sets linked by shared barcodes.
+
+        Returns:
+            The first promotion in the linked set of each promotion.
+        """
+
+        linked = list(range(len(self.engine.promotions)))
+
+        def find(i: int) -> int:
+            while linked[i] != i:
+                linked[i] = linked[linked[i]]
+                i = linked[i]
+            return i
+
+        for promotion in self.engine.promotions:
+            for barcode in promotion.eligible_barcodes:
+                indices = self.engine.get_promotion_indices(barcode)
+                first = find(indices[0])
+                for i in indices[1:]:
+                    root = find(i)
+                    if root != first:
+                        linked[max(root, first)] = min(root, first)
+                        first = min(root, first)
+        return [find(i) for i in range(len(linked))]
+
+    def _update_discounts(self, key: tuple[int, Optional[int]]) -> None:
+        """Recalculate the discounts for a single promotion state key."""
+        old_discounts = self._discounts.pop(key, [])
+        self.discount_total_pence -= sum(d.line_price_pence
+                                         for d in old_discounts)
+
+        eligible_items = self._eligible_items[key]
+        if self._linked is not None:
+            new_discounts = list(self.engine.get_discounts(eligible_items))
+        else:
+            new_discounts = list(self.engine.get_promotion_discounts(
+                key[0], eligible_items))
+        self.discount_total_pence += sum(d.line_price_pence
+                                         for d in new_discounts)
+        if new_discounts:
+            self._discounts[key] = new_discounts
+        if not eligible_items:
+            del self._eligible_items[key]
@@ -0,0 +1,404 @@
+import copy
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Set
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterable, Iterator, Optional, Union
+
+from shoppingbasket.product_db import Product
+from shoppingbasket.product_snapshot import ProductSnapshot
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import Promotion
+
+# Control block: magic and the number of the current generation (0 until
+# the first is published)
+_CONTROL_MAGIC = b'SBSHMCTL'
+_CONTROL = struct.Struct('=8sQ')
+_GENERATION = struct.Struct('=Q')
+_GENERATION_OFFSET = 8
+
+# Generation block header: magic, generation number, then the offset and
+# size of each section (products, index barcodes, index starts, index
+# promotions, eligible barcodes, promotions)
+_MAGIC = b'SBSHM001'
+_HEADER = struct.Struct('=8sQ12Q')
+
+# Names of the blocks created by publishers in this process
+_published: set[str] = set()
+
+
+class CataloguePublisher:
+    """Publishes products and promotions to shared memory.
+
+    When a store server runs one worker process per till, each worker loading
+    its own ProductDB and promotions keeps a copy of the catalogue per
+    worker. Instead, a coordinator process can publish the catalogue once,
+    and each worker attaches to it (read-only) with a SharedCatalogue.
+
+    Each publish creates a new generation: a shared memory block holding
+    the products (as a product snapshot), the promotions and a compiled
+    index of the promotions each barcode is eligible for. Only once the
+    block is complete is the generation number in the control block
+    updated, so workers see either the old generation or the new one, never
+    a mix. The old block is unlinked straight away, but stays mapped until
+    the workers using it switch to the new generation.
+
+    Attributes:
+        name: The name of the control block, which workers attach to.
+        generation: The number of the current generation (0 if nothing has
+            been published).
+    """
+
+    def __init__(self, name: str) -> None:
+        """Create the control block for a shared catalogue.
+
+        Args:
+            name: The name of the shared memory block to create.
+
+        Raises:
+            FileExistsError: If a block with the name already exists.
+        """
+
+        self.name = name
+        self.generation = 0
+        self._control = shared_memory.SharedMemory(name, create=True,
+                                                   size=_CONTROL.size)
+        _published.add(self._control.name)
+        _CONTROL.pack_into(self._control.buf, 0, _CONTROL_MAGIC, 0)
+        self._block: Optional[shared_memory.SharedMemory] = None
+
+    def publish(self,
+                products: Iterable[Product],
+                promotions: Optional[Union[list[Promotion],
+                                           PromotionEngine]] = None) -> int:
+        """Publish a new generation of the catalogue.
+
+        Args:
+            products: The products, e.g. from ProductDB.iter_products.
+            promotions: The promotions. Defaults to None.
+
+        Returns:
+            The number of the new generation.
+        """
+
+        generation = self.generation + 1
+        data = _encode_generation(generation, products, promotions)
+        block = shared_memory.SharedMemory(_get_block_name(self.name,
+                                                           generation),
+                                           create=True, size=len(data))
+        _published.add(block.name)
+        block.buf[:len(data)] = data
+
+        # Swap generations
+        _GENERATION.pack_into(self._control.buf, _GENERATION_OFFSET,
+                              generation)
+        old_block, self._block = self._block, block
+        self.generation = generation
+        if old_block is not None:
+            _unlink(old_block)
+        return generation
+
+    def close(self) -> None:
+        """Unlink the shared memory (workers keep any generation attached)."""
+        if self._block is not None:
+            _unlink(self._block)
+            self._block = None
+        _unlink(self._control)
+
+    def __enter__(self) -> 'CataloguePublisher':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SharedCatalogue:
+    """The products and promotions published by a CataloguePublisher.
+
+    Workers attach to the catalogue by name, and use its products and
+    promotions like any others (e.g. in a Basket). They are read from the
+    shared memory, so every worker on the host shares a single copy of them.
+
+    A worker stays on the generation it attached to until it calls refresh
+    (e.g. between baskets), so prices don't change part way through a shop.
+    Refreshing releases the previous generation, so anything still using its
+    products or promotions must be finished first.
+
+    Attributes:
+        name: The name of the control block.
+        generation: The number of the generation attached to.
+        products: The products of the generation.
+        promotions: The promotions of the generation (None if it has none).
+        cache_size: The size of the discount cache of the promotions (see
+            PromotionEngine).
+    """
+
+    def __init__(self, name: str, cache_size: int = 0) -> None:
+        """Attach to the latest generation of a shared catalogue.
+
+        Args:
+            name: The name of the control block.
+            cache_size: The size of the discount cache of the promotions
+                (private to this process). Defaults to 0 (no cache).
+
+        Raises:
+            FileNotFoundError: If there is no shared catalogue with the name.
+            ValueError: If the block isn't a shared catalogue, or nothing has
+                been published to it.
+        """
+
+        self.name = name
+        self.cache_size = cache_size
+        self.generation = 0
+        self.products: Optional[ProductSnapshot] = None
+        self.promotions: Optional[PromotionEngine] = None
+        self._block: Optional[shared_memory.SharedMemory] = None
+        self._views: list[memoryview] = []
+
+        self._control = _attach(name)
+        magic, _ = _CONTROL.unpack_from(self._control.buf)
+        if magic != _CONTROL_MAGIC:
+            self._control.close()
+            raise ValueError(f"{name!r} is not a shared catalogue.")
+        if not self.refresh():
+            self._control.close()
+            raise ValueError(f"Nothing has been published to {name!r}.")
+
+    def get_latest_generation(self) -> int:
+        """The number of the latest generation published."""
+        return _GENERATION.unpack_from(self._control.buf,
+                                       _GENERATION_OFFSET)[0]
+
+    def refresh(self) -> bool:
+        """Switch to the latest generation, if it is a new one.
+
+        Returns:
+            Whether a new generation was attached to.
+        """
+
+        while True:
+            generation = self.get_latest_generation()
+            if generation in (0, self.generation):
+                return False
+            try:
+                block = _attach(_get_block_name(self.name, generation))
+            except FileNotFoundError:
+                if self.get_latest_generation() == generation:
+                    # The publisher has closed
+                    raise
+                # Replaced since the generation was read, so try the next
+                continue
+            break
+
+        self._release()
+        self._block = block
+        self.generation = generation
+        self._read_generation()
+        return True
+
+    def close(self) -> None:
+        """Detach from the shared catalogue."""
+        self._release()
+        self._control.close()
+
+    def __enter__(self) -> 'SharedCatalogue':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _read_generation(self) -> None:
+        """Read the products and promotions of the attached block."""
+        buffer = self._block.buf
+        magic, _, *sections = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError(f"{self.name!r} generation {self.generation} is "
+                             "not a shared catalogue.")
+
+        products, index_barcodes, index_starts, index_promotions, \
+            eligible_barcodes, promotions = (
+                self._view(buffer, offset, size)
+                for offset, size in zip(sections[::2], sections[1::2]))
+        self.products = ProductSnapshot(products)
+
+        records = pickle.loads(promotions)
+        if records is None:
+            return
+        eligible_barcodes = self._cast(eligible_barcodes, 'q')
+        promotions = []
+        for promotion, start, count in records:
+            promotion.eligible_barcodes = SharedBarcodes(
+                self._view(eligible_barcodes, start, count))
+            promotions.append(promotion)
+        index = _SharedIndex(self._cast(index_barcodes, 'q'),
+                             self._cast(index_starts, 'q'),
+                             self._cast(index_promotions, 'I'))
+        self.promotions = SharedPromotionEngine(promotions, index,
+                                                cache_size=self.cache_size)
+
+    def _view(self, buffer: memoryview, start: int, size: int) -> memoryview:
+        """A view of part of a buffer (released with the generation)."""
+        view = buffer[start:start + size]
+        self._views.append(view)
+        return view
+
+    def _cast(self, buffer: memoryview, format: str) -> memoryview:
+        """A view of a buffer as an array (released with the generation)."""
+        view = buffer.cast(format)
+        self._views.append(view)
+        return view
+
+    def _release(self) -> None:
+        """Release the attached generation."""
+        if self.products is not None:
+            self.products.close()
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self.products = None
+        self.promotions = None
+        if self._block is not None:
+            self._block.close()
+            self._block = None
+
+
+class SharedBarcodes(Set):
+    """The eligible barcodes of a promotion, read from shared memory.
+
+    The barcodes are sorted, so membership is checked by binary search.
+    """
+
+    def __init__(self, barcodes: memoryview) -> None:
+        self._barcodes = barcodes
+
+    @classmethod
+    def _from_iterable(cls, iterable: Iterable[int]) -> frozenset[int]:
+        # Set operations (e.g. difference) return an ordinary frozenset
+        return frozenset(iterable)
+
+    def __contains__(self, barcode: object) -> bool:
+        if not isinstance(barcode, int):
+            return False
+        barcodes = self._barcodes
+        i = bisect_left(barcodes, barcode)
+        return i < len(barcodes) and barcodes[i] == barcode
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._barcodes)
+
+    def __len__(self) -> int:
+        return len(self._barcodes)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+class SharedPromotionEngine(PromotionEngine):
+    """A PromotionEngine whose barcode index is read from shared memory."""
+
+    def __init__(self,
+                 promotions: list[Promotion],
+                 index: '_SharedIndex',
+                 cache_size: int = 0) -> None:
+        # The index is already compiled, so isn't built again
+        super().__init__((), cache_size=cache_size)
+        self.promotions = promotions
+        self._index = index
+
+
+class _SharedIndex:
+    """The promotions each barcode is eligible for, in sorted arrays.
+
+    The promotion indices of the i-th barcode are promotions[starts[i]:
+    starts[i + 1]].
+    """
+
+    def __init__(self, barcodes: memoryview, starts: memoryview,
+                 promotions: memoryview) -> None:
+        self._barcodes = barcodes
+        self._starts = starts
+        self._promotions = promotions
+
+    def get(self, barcode: Optional[int],
+            default: tuple[int, ...] = ()) -> tuple[int, ...]:
+        if not isinstance(barcode, int):
+            return default
+        barcodes = self._barcodes
+        i = bisect_left(barcodes, barcode)
+        if i == len(barcodes) or barcodes[i] != barcode:
+            return default
+        return tuple(self._promotions[self._starts[i]:self._starts[i + 1]])
+
+
+def _encode_generation(
+        generation: int,
+        products: Iterable[Product],
+        promotions: Optional[Union[list[Promotion], PromotionEngine]]
+) -> bytes:
+    """Encode the contents of a generation block."""
+    index = defaultdict(list)
+    eligible_barcodes = array('q')
+    records = None
+    if promotions is not None:
+        records = []
+        for i, promotion in enumerate(promotions):
+            barcodes = sorted(promotion.eligible_barcodes)
+            for barcode in barcodes:
+                index[barcode].append(i)
+            # The barcodes are stored in the table instead
+            record = copy.copy(promotion)
+            record.eligible_barcodes = frozenset()
+            records.append((record, len(eligible_barcodes), len(barcodes)))
+            eligible_barcodes.extend(barcodes)
+
+    index_barcodes = array('q', sorted(index))
+    index_starts = array('q', [0])
+    index_promotions = array('I')
+    for barcode in index_barcodes:
+        index_promotions.extend(index[barcode])
+        index_starts.append(len(index_promotions))
+
+    sections = [ProductSnapshot.encode(products),
+                index_barcodes.tobytes(),
+                index_starts.tobytes(),
+                index_promotions.tobytes(),
+                eligible_barcodes.tobytes(),
+                pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)]
+
+    data = bytearray(_HEADER.size)
+    offsets = []
+    for section in sections:
+        # Align each section to 8 bytes
+        data.extend(bytes(-len(data) % 8))
+        offsets.extend((len(data), len(section)))
+        data.extend(section)
+    _HEADER.pack_into(data, 0, _MAGIC, generation, *offsets)
+    return bytes(data)
+
+
+def _get_block_name(name: str, generation: int) -> str:
+    """The name of the shared memory block of a generation."""
+    return f"{name}_{generation}"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing shared memory block, without owning it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    block = shared_memory.SharedMemory(name)
+    if block.name not in _published:
+        # Before Python 3.13, attaching registers the block with the
+        # resource tracker, which would unlink it when this process exits
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+def _unlink(block: shared_memory.SharedMemory) -> None:
+    """Close and unlink a block created by a publisher in this process."""
+    block.close()
+    block.unlink()
+    _published.discard(block.name)
@@ -1,6 +1,12 @@
+import asyncio
+import dataclasses
+
 import pytest
 
 from shoppingbasket.basket import Basket
+from shoppingbasket.basket_log import CLOSE, BasketEvent
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import MForN
 
 
 class TestBasket:
@@ -26,3 +32,208 @@ class TestBasket:
         basket = Basket(products=products)
         with pytest.warns(UserWarning):
             basket.add_item_from_barcode(999)
+
+    def test_add_items_from_barcodes(self, products):
+        basket = Basket(products=products)
+        result = basket.add_items_from_barcodes(
+            [(1, 1.0), (999, 1.0), (2, 0.5), (1, 1.0), (998, 1.0), (999, 1.0)])
+
+        assert result.num_added == 3
+        assert result.missing_barcodes == [999, 998]
+        assert [item.name for item in basket.basket_items] == \
+            ['Beans', 'Onions', 'Beans']
+        assert basket.basket_items[1].units == 'kg'
+        assert basket.basket_items[1].quantity == 0.5
+
+    def test_add_items_from_barcodes_matches_single(self, products):
+        scans = [(1, 1.0), (5, 0.2), (4, 1.0), (4, 1.0), (1, 2.0)]
+        bulk_basket = Basket(products=products)
+        bulk_basket.add_items_from_barcodes(scans)
+        basket = Basket(products=products)
+        for barcode, quantity in scans:
+            basket.add_item_from_barcode(barcode, quantity)
+        assert bulk_basket.basket_items == basket.basket_items
+
+    def test_add_items_from_barcodes_no_product_db(self):
+        basket = Basket()
+        with pytest.raises(ValueError):
+            basket.add_items_from_barcodes([(1, 1.0)])
+
+    def test_aggregate(self, products):
+        basket = Basket(products=products, aggregate=True)
+        basket.add_items_from_barcodes(
+            [(1, 1.0), (2, 0.5), (1, 1.0), (2, 0.25), (1, 1.0), (4, 1.0)])
+
+        assert [(item.name, item.quantity) for item in basket.basket_items] \
+            == [('Beans', 3.0), ('Onions', 0.5), ('Onions', 0.25),
+                ('Coke', 1.0)]
+
+    def test_aggregate_matches_unaggregated(self, products):
+        promotions = [MForN("Beans 3 for 2", {1}, 3, 2)]
+        scans = [(1, 1.0), (4, 1.0)] * 7 + [(2, 0.5)]
+        basket = Basket(products=products, promotions=promotions)
+        basket.add_items_from_barcodes(scans)
+        aggregated = Basket(products=products, promotions=promotions,
+                            incremental=True, aggregate=True)
+        aggregated.add_items_from_barcodes(scans)
+
+        invoice = basket.generate_invoice()
+        aggregated_invoice = aggregated.generate_invoice()
+        assert len(aggregated.basket_items) == 3
+        assert aggregated_invoice.total == pytest.approx(invoice.total)
+        assert aggregated.running_total.total == \
+            pytest.approx(invoice.total)
+
+    def test_aggregate_remove_item(self, products):
+        basket = Basket(products=products, incremental=True, aggregate=True)
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0), (1, 1.0)])
+        basket.remove_item(basket.basket_items[0])
+        basket.add_item_from_barcode(1)
+        basket.add_item_from_barcode(4)
+
+        assert [(item.name, item.quantity) for item in basket.basket_items] \
+            == [('Coke', 2.0), ('Beans', 1.0)]
+        assert basket.running_total.total == pytest.approx(
+            basket.generate_invoice().total)
+
+    def test_remove_item_most_recent(self, products):
+        basket = Basket(products=products)
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0), (1, 1.0)])
+        basket.add_item("Carrier bag", 0.10)
+        basket.remove_item(basket.basket_items[0])
+
+        assert [item.name for item in basket.basket_items] == \
+            ['Beans', 'Coke', 'Carrier bag']
+        with pytest.raises(ValueError):
+            basket.remove_item(dataclasses.replace(basket.basket_items[1],
+                                               quantity=2.0))
+
+    def test_update_quantity(self, products):
+        promotions = [MForN("Beans 3 for 2", {1}, 3, 2)]
+        basket = Basket(products=products, promotions=promotions,
+                        incremental=True)
+        basket.add_items_from_barcodes([(1, 1.0), (2, 0.5)])
+        beans = basket.update_quantity(basket.basket_items[0], 3.0)
+
+        assert beans.quantity == 3.0
+        assert basket.basket_items[0] is beans
+        assert basket.running_total.total == pytest.approx(
+            basket.generate_invoice().total)
+        assert basket.update_quantity(beans, 0) is None
+        assert [item.name for item in basket.basket_items] == ['Onions']
+
+    def test_void(self, products):
+        basket = Basket(products=products, incremental=True, aggregate=True)
+        basket.add_items_from_barcodes([(1, 1.0), (2, 0.5), (1, 1.0)])
+        basket.void(1)
+        assert [(item.name, item.quantity) for item in basket.basket_items] \
+            == [('Beans', 1.0), ('Onions', 0.5)]
+        basket.void(2)
+        basket.void(1)
+        assert basket.basket_items == []
+        assert basket.running_total.total == 0
+        with pytest.raises(KeyError):
+            basket.void(1)
+
+    def test_many_edits(self, products):
+        promotions = [MForN("Beans 3 for 2", {1}, 3, 2)]
+        basket = Basket(products=products, promotions=promotions,
+                        incremental=True)
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0)] * 50)
+        for _ in range(40):
+            basket.void(4)
+            basket.remove_item(basket.basket_items[-1])
+        # Changes the most recently added beans
+        basket.update_quantity(basket.basket_items[0], 2.0)
+        basket.add_item_from_barcode(4)
+
+        expected = Basket(products=products)
+        expected.add_items_from_barcodes([(1, 1.0), (4, 1.0)] * 9
+                                         + [(1, 2.0), (4, 1.0), (4, 1.0)])
+        assert basket.basket_items == expected.basket_items
+        assert basket.running_total.total == pytest.approx(
+            basket.generate_invoice().total)
+
+    def test_edit_then_read(self, products, monkeypatch):
+        """Test that reading the items after an edit keeps the index."""
+        basket = Basket(products=products, incremental=True)
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0), (6, 1.0)] * 100)
+        builds = []
+        build_index = basket._build_index
+        monkeypatch.setattr(basket, '_build_index',
+                            lambda: builds.append(1) or build_index())
+
+        expected = list(basket.basket_items)
+        for barcode in [4, 6, 1] * 80:
+            basket.void(barcode)
+            expected.reverse()
+            product = basket.products.get_product(barcode)
+            expected.remove(product.to_basket_item())
+            expected.reverse()
+            assert basket.basket_items == expected
+            basket.add_item_from_barcode(4)
+            expected.append(basket.products.get_product(4).to_basket_item())
+        assert builds == [1]
+        assert basket.running_total.total == pytest.approx(
+            basket.generate_invoice().total)
+
+    def test_set_basket_items(self, products):
+        basket = Basket(products=products, incremental=True)
+        basket.add_items_from_barcodes([(1, 1.0)] * 3)
+        basket.void(1)
+        coke = products.get_product(4)
+        basket_items = [coke.to_basket_item()] * 2
+        basket.basket_items = basket_items
+        assert basket.basket_items is basket_items
+        assert basket.running_total.total == 2 * coke.unit_price
+        basket.void(4)
+        assert basket.basket_items == [coke.to_basket_item()]
+
+    def test_existing_items_not_cleared(self, products):
+        basket_items = [products.get_product(1).to_basket_item()] * 2
+        Basket(products=products, basket_items=basket_items)
+        assert len(basket_items) == 2
+
+    def test_promotion_engine(self, products):
+        """Test that a list of promotions is indexed once per basket."""
+        promotions = [MForN("Beans 3 for 2", {1}, 3, 2)]
+        basket = Basket(products=products, promotions=promotions,
+                        incremental=True)
+        assert isinstance(basket.promotions, PromotionEngine)
+        assert basket.promotions.promotions == promotions
+        basket.add_items_from_barcodes([(1, 1.0)] * 3)
+        assert basket.running_total.engine is basket.promotions
+        assert basket.generate_invoice().promotions is basket.promotions
+        basket.replay([BasketEvent(CLOSE)])
+        assert basket.running_total.engine is basket.promotions
+
+    def test_scan(self, products):
+        basket = Basket(products=products)
+        scans = [(1, 1.0), (2, 0.5), (999, 1.0)]
+
+        async def scan():
+            for barcode, quantity in scans:
+                await basket.scan(barcode, quantity)
+
+        with pytest.warns(UserWarning):
+            asyncio.run(scan())
+
+        sync_basket = Basket(products=products)
+        with pytest.warns(UserWarning):
+            for barcode, quantity in scans:
+                sync_basket.add_item_from_barcode(barcode, quantity)
+        assert basket.basket_items == sync_basket.basket_items
+
+    def test_scan_many(self, products):
+        basket = Basket(products=products)
+        scans = [(1, 1.0), (999, 1.0), (1, 1.0), (4, 1.0)]
+        result = asyncio.run(basket.scan_many(scans))
+
+        sync_basket = Basket(products=products)
+        assert result == sync_basket.add_items_from_barcodes(scans)
+        assert basket.basket_items == sync_basket.basket_items
+
+    def test_scan_no_product_db(self):
+        basket = Basket()
+        with pytest.raises(ValueError):
+            asyncio.run(basket.scan(1))
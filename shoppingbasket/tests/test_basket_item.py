@@ -16,6 +16,21 @@ class TestBasketItem:
     def test_line_price(self, item_name, expected_line_price):
         assert self.basket_items[item_name].line_price == expected_line_price
 
+    @pytest.mark.parametrize(
+        'item_name, expected_line_price_pence',
+        [('Beans', 50), ('Onions', 511)]
+    )
+    def test_line_price_pence(self, item_name, expected_line_price_pence):
+        basket_item = self.basket_items[item_name]
+        assert basket_item.line_price_pence == expected_line_price_pence
+
+    def test_line_price_not_in_identity(self):
+        """Test that line prices don't affect equality or hashing."""
+        basket_item = BasketItem('Beans', 0.5)
+        assert basket_item.line_price == 0.5
+        assert basket_item == self.basket_items['Beans']
+        assert hash(basket_item) == hash(BasketItem('Beans', 0.5))
+
     @pytest.mark.parametrize(
         'item_name, num_desc_lines',
         [('Beans', 1), ('Onions', 2)]
@@ -32,3 +47,6 @@ class TestDiscount:
     def test_line_price(self):
         """Test that the line price of a discount is negative."""
         assert self.discount.line_price == -0.5
+
+    def test_line_price_pence(self):
+        assert self.discount.line_price_pence == -50
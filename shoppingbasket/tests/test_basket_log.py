@@ -0,0 +1,169 @@
+import os
+
+import pytest
+
+from shoppingbasket import Basket
+from shoppingbasket.basket_log import (ADD, SCAN, SET_QUANTITY, VOID,
+                                       BasketEvent, BasketLog)
+from shoppingbasket.batch import price_baskets
+from shoppingbasket.promotions import MForN
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'till.log')
+
+
+def fill_basket(basket):
+    basket.add_item_from_barcode(1)
+    basket.add_item_from_barcode(2, quantity=0.5)
+    basket.add_item("Carrier bag", 0.10)
+    basket.add_item_from_barcode(1)
+    basket.remove_item(basket.basket_items[1])
+    basket.add_items_from_barcodes([(4, 1.0), (6, 1.0)])
+
+
+class TestBasketLog:
+    def test_restore(self, products, log_path):
+        with BasketLog(log_path) as log:
+            basket = Basket(products=products, log=log)
+            fill_basket(basket)
+            expected = list(basket.basket_items)
+
+        with BasketLog(log_path) as log:
+            restored = log.restore(Basket(products=products))
+            assert restored.basket_items == expected
+            # Changes after restoring are logged too
+            restored.add_item_from_barcode(7)
+            restored.update_quantity(restored.basket_items[0], 2.0)
+            restored.void(7)
+            expected = list(restored.basket_items)
+
+        with BasketLog(log_path) as log:
+            assert log.restore(Basket()).basket_items == expected
+
+    def test_events(self, products, log_path):
+        with BasketLog(log_path) as log:
+            fill_basket(Basket(products=products, log=log))
+
+        events = list(BasketLog.iter_events(log_path))
+        assert [event.kind for event in events] == \
+            [SCAN, SCAN, ADD, SCAN, VOID, SCAN, SCAN]
+        assert events[1].item.quantity == 0.5
+        assert events[2].item.barcode is None
+        assert events[4].item.barcode == 2
+
+    def test_restore_after_checkout(self, products, log_path):
+        with BasketLog(log_path) as log:
+            basket = Basket(products=products, log=log)
+            fill_basket(basket)
+            log.end_basket()
+            basket = Basket(products=products, log=log)
+            basket.add_item_from_barcode(9)
+
+        with BasketLog(log_path) as log:
+            restored = log.restore(Basket(products=products))
+        assert [item.barcode for item in restored.basket_items] == [9]
+
+    def test_snapshot(self, products, log_path):
+        with BasketLog(log_path, snapshot_every=3) as log:
+            basket = Basket(products=products, log=log)
+            fill_basket(basket)
+            expected = list(basket.basket_items)
+        assert os.path.exists(log_path + '.snapshot')
+
+        with BasketLog(log_path) as log:
+            # Only the events since the last snapshot are replayed
+            assert len(log._recent_events) < 3
+            restored = log.restore(Basket(products=products))
+        assert restored.basket_items == expected
+
+    def test_damaged_snapshot(self, products, log_path):
+        with BasketLog(log_path, snapshot_every=2) as log:
+            basket = Basket(products=products, log=log)
+            fill_basket(basket)
+            expected = list(basket.basket_items)
+        with open(log_path + '.snapshot', 'r+b') as f:
+            f.seek(30)
+            f.write(b'\xff')
+
+        # The whole log is replayed instead
+        with BasketLog(log_path) as log:
+            assert log.restore(Basket()).basket_items == expected
+
+    def test_torn_record(self, products, log_path):
+        with BasketLog(log_path) as log:
+            basket = Basket(products=products, log=log)
+            fill_basket(basket)
+            expected = list(basket.basket_items)
+            basket.add_item_from_barcode(7)
+
+        # The process died while writing the last record
+        with open(log_path, 'r+b') as f:
+            f.truncate(os.path.getsize(log_path) - 3)
+
+        with BasketLog(log_path) as log:
+            restored = log.restore(Basket(products=products))
+            assert restored.basket_items == expected
+            restored.add_item_from_barcode(8)
+        assert list(BasketLog.iter_events(log_path))[-1].item.barcode == 8
+
+    def test_incremental_and_aggregate(self, products, log_path):
+        promotions = [MForN("Beans 3 for 2", {1}, m=3, n=2)]
+        with BasketLog(log_path) as log:
+            basket = Basket(products=products, promotions=promotions,
+                            incremental=True, aggregate=True, log=log)
+            for _ in range(4):
+                basket.add_item_from_barcode(1)
+            basket.add_item_from_barcode(4)
+            basket.remove_item(basket.basket_items[1])
+            basket.add_item_from_barcode(4)
+            expected = list(basket.basket_items)
+
+        with BasketLog(log_path) as log:
+            restored = log.restore(Basket(products=products,
+                                          promotions=promotions,
+                                          incremental=True, aggregate=True))
+        assert restored.basket_items == expected
+        assert restored.basket_items[0].quantity == 4
+        assert restored.running_total.total_pence == \
+            restored.generate_invoice().total_pence
+
+    def test_replay_set_quantity(self, products):
+        basket = Basket(products=products, incremental=True)
+        basket.add_item_from_barcode(1)
+        basket.add_item_from_barcode(1)
+        basket.replay([BasketEvent(SET_QUANTITY, basket.basket_items[0],
+                                   quantity=3.0)])
+        # The most recently added equal line is changed
+        assert [item.quantity for item in basket.basket_items] == [1.0, 3.0]
+        assert basket.running_total.subtotal_pence == \
+            basket.generate_invoice().subtotal_pence
+
+    def test_not_a_log(self, tmp_path):
+        path = str(tmp_path / 'other.log')
+        with open(path, 'wb') as f:
+            f.write(b'something else entirely')
+        with pytest.raises(ValueError):
+            BasketLog(path)
+
+    def test_read_scans(self, products, log_path):
+        with BasketLog(log_path) as log:
+            for barcodes in ([1, 1, 1, 4], [6, 7, 8], [9]):
+                basket = Basket(products=products, log=log)
+                basket.add_items_from_barcodes(
+                    (barcode, 1.0) for barcode in barcodes)
+                basket.add_item("Carrier bag", 0.10)
+                if barcodes != [9]:
+                    log.end_basket()
+
+        baskets = list(BasketLog.iter_baskets(log_path))
+        assert len(baskets) == 2  # The last basket wasn't checked out
+        assert baskets[0][-1].name == "Carrier bag"
+
+        basket_ids, barcodes, quantities = BasketLog.read_scans(log_path)
+        assert basket_ids.tolist() == [0, 0, 0, 0, 1, 1, 1]
+        assert barcodes.tolist() == [1, 1, 1, 4, 6, 7, 8]
+        batch = price_baskets(basket_ids, barcodes, quantities, products,
+                              [MForN("Beans 3 for 2", {1}, m=3, n=2)])
+        assert batch.discount_totals_pence.tolist() == [-50, 0]
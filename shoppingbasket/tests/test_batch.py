@@ -0,0 +1,107 @@
+import random
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+import pytest
+
+from shoppingbasket import Basket, Invoice
+from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.batch import price_baskets
+from shoppingbasket.promotions import (CheapestFree, MForN, MForNPounds,
+                                       Promotion, SpendXGetYOff,
+                                       TieredQuantity)
+
+
+@dataclass
+class HalfPriceBananas(Promotion):
+    """A promotion that isn't vectorised, to test the fallback."""
+
+    def get_discounts(self, basket_items: list[BasketItem]
+                      ) -> Iterator[Discount]:
+        for item in self.list_eligible_items(basket_items):
+            yield Discount(self.name, item.line_price / 2)
+
+
+class TestPriceBaskets:
+    promotions = [
+        MForN("Beans 3 for 2", {1}, m=3, n=2),
+        MForNPounds("Coke 2 for £1", {4}, m=2, n=1.0),
+        MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+        MForN("Onions 2 for 1", {2}, m=2, n=1),
+        HalfPriceBananas("Half price bananas", {3}),
+    ]
+
+    @staticmethod
+    def make_rows(seed: int = 0) -> tuple[list, list, list]:
+        """Random baskets, including weighed items with repeated weights."""
+        rng = random.Random(seed)
+        basket_ids, barcodes, quantities = [], [], []
+        for basket_id in rng.sample(range(1000), 50):
+            for _ in range(rng.randint(1, 20)):
+                barcode = rng.randint(1, 9)
+                quantity = 1.0
+                if barcode in (2, 3, 5):
+                    quantity = rng.choice([0.25, 0.5, 1.5])
+                basket_ids.append(basket_id)
+                barcodes.append(barcode)
+                quantities.append(quantity)
+        return basket_ids, barcodes, quantities
+
+    def test_matches_invoices(self, products):
+        basket_ids, barcodes, quantities = self.make_rows()
+        batch = price_baskets(basket_ids, barcodes, quantities,
+                              products, self.promotions)
+
+        baskets = {}
+        for basket_id, barcode, quantity in zip(basket_ids, barcodes,
+                                                quantities):
+            basket = baskets.setdefault(basket_id, Basket(products=products))
+            basket.add_item_from_barcode(barcode, quantity)
+
+        assert batch.basket_ids.tolist() == sorted(baskets)
+        for i, basket_id in enumerate(batch.basket_ids.tolist()):
+            invoice = Invoice(baskets[basket_id].basket_items,
+                              self.promotions,
+                              fixed_point=True)
+            assert batch.subtotals_pence[i] == invoice.subtotal_pence
+            assert batch.discount_totals_pence[i] == \
+                invoice.discount_total_pence
+            assert batch.totals[i] == invoice.total
+
+    def test_other_promotion_types(self, products):
+        promotions = [
+            CheapestFree("Beans and coke, cheapest free", {1, 4}, m=3),
+            TieredQuantity("Fruit and veg", {2, 3, 5}, tiers={2: 10, 4: 15}),
+            SpendXGetYOff("£1 off every £5 of ale", {6, 7, 8, 9}, x=5.0,
+                          y=1.0, repeat=True),
+        ]
+        basket_ids, barcodes, quantities = self.make_rows(seed=1)
+        batch = price_baskets(basket_ids, barcodes, quantities,
+                              products, promotions)
+
+        baskets = {}
+        for basket_id, barcode, quantity in zip(basket_ids, barcodes,
+                                                quantities):
+            basket = baskets.setdefault(basket_id, Basket(products=products))
+            basket.add_item_from_barcode(barcode, quantity)
+        for i, basket_id in enumerate(batch.basket_ids.tolist()):
+            invoice = Invoice(baskets[basket_id].basket_items, promotions,
+                              fixed_point=True)
+            assert batch.discount_totals_pence[i] == \
+                invoice.discount_total_pence
+
+    def test_default_quantities(self, products):
+        batch = price_baskets([1, 1, 1, 2], [1, 1, 1, 4], None, products,
+                              self.promotions)
+        assert batch.subtotals.tolist() == [1.50, 0.70]
+        assert batch.discount_totals.tolist() == [-0.50, 0.0]
+
+    def test_missing_barcode(self, products):
+        with pytest.warns(UserWarning):
+            batch = price_baskets(np.array([1, 1, 2]),
+                                  np.array([1, 999, 999]),
+                                  None,
+                                  products)
+        assert batch.basket_ids.tolist() == [1, 2]
+        assert batch.totals.tolist() == [0.50, 0.0]
@@ -0,0 +1,91 @@
+import pytest
+
+from shoppingbasket.benchmarks import suite
+
+
+def make_result(name, latency_us=100.0, peak_memory_kb=10.0):
+    return suite.BenchmarkResult(name=name,
+                                 size=10,
+                                 rounds=5,
+                                 throughput=1e5,
+                                 latency_us={'50': latency_us,
+                                             '90': latency_us,
+                                             '99': latency_us},
+                                 peak_memory_kb=peak_memory_kb)
+
+
+class TestBenchmarkSuite:
+    def test_run(self):
+        cases = suite.get_cases(max_items=10, max_promotions=10)
+        results = list(suite.run(cases, min_time=0, min_rounds=2))
+
+        names = [result.name for result in results]
+        assert len(names) == len(set(names))
+        for prefix in ('cold_start', 'scan', 'invoice', 'MForN[',
+                       'MForNPounds', 'render', 'from_yaml'):
+            assert any(name.startswith(prefix) for name in names)
+        for result in results:
+            assert result.rounds >= 2
+            assert result.throughput > 0
+            p50, p90, p99 = (result.latency_us[str(p)]
+                             for p in suite.PERCENTILES)
+            assert 0 < p50 <= p90 <= p99
+            assert result.peak_memory_kb > 0
+
+    def test_filter(self):
+        cases = suite.get_cases(max_items=100, max_promotions=10)
+        results = list(suite.run(cases, name_filter='scan', min_time=0))
+        assert [result.name for result in results] == \
+            ['scan[items=10]', 'scan[items=100]']
+
+    def test_prepare(self):
+        """Test that each call is given new inputs by prepare."""
+        inputs = []
+
+        def func(value):
+            assert value not in inputs
+            inputs.append(value)
+
+        func.prepare = object
+        result = suite.measure('prepared', 1, func, min_time=0, min_rounds=3)
+        # Including the warm up and memory calls
+        assert len(inputs) == result.rounds + 2
+
+    def test_percentile(self):
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        assert suite._percentile(values, 50) == 3.0
+        assert suite._percentile(values, 0) == 1.0
+        assert suite._percentile(values, 100) == 5.0
+        assert suite._percentile(values, 90) == pytest.approx(4.6)
+
+    def test_save_and_load(self, tmp_path):
+        path = str(tmp_path / 'baseline.json')
+        results = [make_result('a'), make_result('b')]
+        suite.save_results(results, path)
+        assert suite.load_results(path) == {'a': results[0],
+                                            'b': results[1]}
+
+    def test_compare(self):
+        baseline = {'same': make_result('same'),
+                    'slower': make_result('slower'),
+                    'bigger': make_result('bigger')}
+        results = [make_result('same', latency_us=110.0),
+                   make_result('slower', latency_us=200.0),
+                   make_result('bigger', peak_memory_kb=100.0),
+                   make_result('new')]
+
+        comparisons = suite.compare(results, baseline, threshold=0.25)
+        assert [(comparison.name, comparison.is_regression)
+                for comparison in comparisons] == \
+            [('same', False), ('slower', True), ('bigger', True)]
+        assert comparisons[1].latency_ratio == pytest.approx(2.0)
+
+    def test_main(self, tmp_path, capsys):
+        path = str(tmp_path / 'baseline.json')
+        args = ['--max-items', '10', '--max-promotions', '10',
+                '--filter', 'scan', '--min-time', '0']
+        assert suite.main(args + ['--save', path]) == 0
+        # A generous threshold, so timing noise doesn't fail the test
+        assert suite.main(args + ['--compare', path,
+                                  '--threshold', '100']) == 0
+        assert 'scan[items=10]' in capsys.readouterr().out
@@ -0,0 +1,91 @@
+import tracemalloc
+
+import pytest
+
+from shoppingbasket import Basket, BasketItem, Discount, Invoice
+from shoppingbasket.columnar_items import ColumnarBasketItems
+from shoppingbasket.promotions import MForN, MForNPounds
+
+
+class TestColumnarBasketItems:
+    basket_items = [
+        BasketItem("Beans", 0.65, barcode=1),
+        BasketItem("Coke", 0.70, barcode=5),
+        BasketItem("Beans", 0.65, barcode=1),
+        BasketItem("Beans", 0.65, barcode=1),
+        BasketItem("Carrots", 1.00, barcode=2, units="kg", quantity=0.5),
+        BasketItem("Coke", 0.70, barcode=5),
+        BasketItem("Bag", 0.10),
+    ]
+
+    def test_round_trip(self):
+        columnar_items = ColumnarBasketItems(self.basket_items)
+        assert len(columnar_items) == len(self.basket_items)
+        assert list(columnar_items) == self.basket_items
+        assert columnar_items[4] == self.basket_items[4]
+        assert columnar_items[-1] == self.basket_items[-1]
+        assert columnar_items[1:3] == self.basket_items[1:3]
+
+    def test_strings_interned(self):
+        columnar_items = ColumnarBasketItems(self.basket_items)
+        # None, plus 4 names and 1 unit
+        assert len(columnar_items._strings) == 6
+
+    def test_remove(self):
+        columnar_items = ColumnarBasketItems(self.basket_items)
+        columnar_items.remove(BasketItem("Coke", 0.70, barcode=5))
+        del columnar_items[0]
+        assert list(columnar_items) == self.basket_items[2:5] + \
+            self.basket_items[5:]
+
+    def test_discount_not_allowed(self):
+        columnar_items = ColumnarBasketItems()
+        with pytest.raises(TypeError):
+            columnar_items.append(Discount("Beans 3 for 2", 0.65))
+
+    def test_invoice(self):
+        promotions = [
+            MForN("Beans 3 for 2", {1}, m=3, n=2),
+            MForNPounds("Coke 2 for £1", {5}, m=2, n=1.0),
+        ]
+        columnar_invoice = Invoice(ColumnarBasketItems(self.basket_items),
+                                   promotions)
+        invoice = Invoice(self.basket_items, promotions)
+        assert columnar_invoice.discounts == invoice.discounts
+        assert columnar_invoice.to_string() == invoice.to_string()
+
+    def test_basket(self, products):
+        basket = Basket(products=products, basket_items=ColumnarBasketItems())
+        basket.add_item_from_barcode(1)
+        basket.add_item_from_barcode(2, quantity=0.5)
+        assert isinstance(basket.basket_items, ColumnarBasketItems)
+        assert [item.name for item in basket.basket_items] == \
+            ['Beans', 'Onions']
+
+    def test_basket_edits(self, products):
+        basket = Basket(products=products, basket_items=ColumnarBasketItems())
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0), (1, 1.0)])
+        basket.void(4)
+        basket.update_quantity(basket.basket_items[0], 2.0)
+        assert isinstance(basket.basket_items, ColumnarBasketItems)
+        assert [(item.name, item.quantity) for item in basket.basket_items] \
+            == [('Beans', 1.0), ('Beans', 2.0)]
+
+    def test_basket_memory(self):
+        """Test that a columnar basket doesn't keep a copy of each item."""
+        def traced_size(basket_items):
+            tracemalloc.start()
+            basket = Basket(basket_items=basket_items)
+            for i in range(10_000):
+                basket.add_item(f"Item {i % 100}", 1.0, barcode=i)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            return size
+
+        assert traced_size(ColumnarBasketItems()) < traced_size([]) / 4
+
+
+class TestSlots:
+    def test_no_instance_dict(self):
+        assert not hasattr(BasketItem("Beans", 0.65), '__dict__')
+        assert not hasattr(Discount("Beans 3 for 2", 0.65), '__dict__')
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from shoppingbasket import BasketItem, Invoice
+from shoppingbasket.export import InvoiceWriter
+from shoppingbasket.promotions import MForN, MForNPounds
+
+
+class TestExport:
+    basket_items = [
+        BasketItem("Beans", 0.65, barcode=1, quantity=3),
+        BasketItem("Coke", 0.70, barcode=5),
+        BasketItem("Coke", 0.70, barcode=5),
+        BasketItem("Carrots", 1.00, barcode=2, units="kg", quantity=0.5),
+    ]
+    promotions = [
+        MForN("Beans 3 for 2", {1}, m=3, n=2),
+        MForNPounds("Coke 2 for £1", {5}, m=2, n=1.0),
+    ]
+    invoice = Invoice(basket_items, promotions)
+
+    def test_to_dict(self):
+        record = self.invoice.to_dict()
+
+        assert record['items']['name'] == ["Beans", "Coke", "Coke",
+                                           "Carrots"]
+        assert record['items']['units'] == [None, None, None, "kg"]
+        assert record['items']['line_price_pence'] == [195, 70, 70, 50]
+        assert record['discounts'] == {
+            'name': ["Beans 3 for 2", "Coke 2 for £1"],
+            'quantity': [1.0, 1.0],
+            'line_price_pence': [-65, -40],
+        }
+        assert record['subtotal_pence'] == self.invoice.subtotal_pence
+        assert record['discount_total_pence'] == \
+            self.invoice.discount_total_pence
+        assert record['total_pence'] == self.invoice.total_pence
+
+    def test_to_json(self):
+        assert json.loads(self.invoice.to_json()) == self.invoice.to_dict()
+        assert "£" in self.invoice.to_json()
+
+    def test_to_msgpack(self):
+        msgpack = pytest.importorskip('msgpack')
+        assert msgpack.unpackb(self.invoice.to_msgpack()) == \
+            self.invoice.to_dict()
+
+    def test_to_arrow(self):
+        pytest.importorskip('pyarrow')
+        batch = self.invoice.to_arrow(invoice_id=7)
+
+        row = batch.to_pylist()[0]
+        assert row['invoice_id'] == 7
+        assert [item['name'] for item in row['items']] == \
+            self.invoice.to_dict()['items']['name']
+        assert row['discounts'][1] == {'name': "Coke 2 for £1",
+                                       'quantity': 1.0,
+                                       'line_price_pence': -40}
+        assert row['total_pence'] == self.invoice.total_pence
+
+
+class TestInvoiceWriter:
+    invoices = [
+        Invoice(TestExport.basket_items, TestExport.promotions),
+        Invoice([]),
+        Invoice(TestExport.basket_items[1:3], TestExport.promotions),
+    ]
+
+    @pytest.mark.parametrize('format', ['parquet', 'arrow'])
+    def test_write(self, tmp_path, format):
+        pa = pytest.importorskip('pyarrow')
+        path = tmp_path / f'invoices.{format}'
+
+        with InvoiceWriter(str(path), format=format, batch_size=2) as writer:
+            for invoice in self.invoices * 3:
+                writer.write(invoice)
+
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(path)
+        else:
+            table = pa.ipc.open_file(path).read_all()
+        assert table.column('invoice_id').to_pylist() == list(range(9))
+        assert table.column('total_pence').to_pylist() == \
+            [invoice.total_pence for invoice in self.invoices] * 3
+        assert table.column('items').to_pylist()[1] == []
+
+    def test_unsupported_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            InvoiceWriter(str(tmp_path / 'invoices.csv'), format='csv')
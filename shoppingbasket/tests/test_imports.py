@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+import pytest
+
+import shoppingbasket
+
+# Dependencies that are only needed by some features
+OPTIONAL_MODULES = ['yaml', 'numpy', 'texttable', 'asyncio', 'sqlite3']
+
+_PRICE_BASKET = """
+import sys
+
+from shoppingbasket import Basket, Invoice
+basket = Basket()
+basket.add_item("Beans", 0.5, barcode=1)
+basket.generate_invoice().total
+print(' '.join(sys.modules))
+"""
+
+
+def price_basket_cold() -> set[str]:
+    """Import the package and price a basket in a new interpreter.
+
+    Returns:
+        The modules imported.
+    """
+
+    output = subprocess.run([sys.executable, '-c', _PRICE_BASKET],
+                            capture_output=True, text=True,
+                            check=True).stdout
+    return set(output.split())
+
+
+class TestImports:
+    def test_lazy_modules(self):
+        modules = price_basket_cold()
+        assert not modules & set(OPTIONAL_MODULES)
+
+    def test_exports(self):
+        for name in shoppingbasket.__all__:
+            assert getattr(shoppingbasket, name) is not None
+        assert 'Basket' in dir(shoppingbasket)
+        with pytest.raises(AttributeError):
+            shoppingbasket.NotAName
@@ -0,0 +1,154 @@
+import pytest
+
+from shoppingbasket import Basket, Invoice, instrumentation
+from shoppingbasket.instrumentation import Metrics, Recorder
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import MForN, MForNPounds
+
+PROMOTIONS = [
+    MForN("Beans 3 for 2", {1}, m=3, n=2),
+    MForNPounds("Coke 2 for £1", {4}, m=2, n=1.0),
+]
+
+
+@pytest.fixture
+def metrics():
+    with instrumentation.recording() as metrics:
+        yield metrics
+
+
+class ListRecorder(Recorder):
+    def __init__(self):
+        self.calls = []
+
+    def increment(self, name, value=1, labels=()):
+        self.calls.append(('increment', name, value, labels))
+
+    def observe(self, name, seconds, labels=()):
+        self.calls.append(('observe', name, labels))
+
+
+class TestInstrumentation:
+    def test_disabled(self, products):
+        assert instrumentation.recorder is None
+        basket = Basket(products=products)
+        basket.add_item_from_barcode(1)
+        basket.generate_invoice(PROMOTIONS).to_string()
+        assert instrumentation.recorder is None
+
+    def test_recording(self):
+        metrics = Metrics()
+        with instrumentation.recording(metrics) as active:
+            assert active is metrics
+            assert instrumentation.recorder is metrics
+            with instrumentation.recording() as inner:
+                assert instrumentation.recorder is inner
+            assert instrumentation.recorder is metrics
+        assert instrumentation.recorder is None
+
+    def test_scans(self, products, metrics):
+        basket = Basket(products=products)
+        basket.add_item_from_barcode(1)
+        with pytest.warns(UserWarning):
+            basket.add_item_from_barcode(999)
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0), (998, 1.0)])
+
+        assert metrics.get_counter(instrumentation.SCANS) == 5
+        assert metrics.get_counter(instrumentation.LOOKUP_MISSES) == 2
+        count, seconds = metrics.get_timing(instrumentation.STAGE_SECONDS,
+                                            instrumentation.LOOKUP)
+        assert count == 3
+        assert seconds > 0
+
+    def test_promotions(self, products, metrics):
+        basket = Basket(products=products)
+        basket.add_items_from_barcodes([(1, 1.0)] * 3 + [(4, 1.0)] * 2
+                                       + [(2, 0.5)])
+        invoice = basket.generate_invoice(PROMOTIONS)
+        invoice.to_string()
+        invoice.to_string()  # Cached, so only rendered once
+
+        for promotion in PROMOTIONS:
+            labels = (('promotion', promotion.name),)
+            assert metrics.get_counter(instrumentation.DISCOUNTS,
+                                       labels) == 1
+            assert metrics.get_timing(instrumentation.PROMOTION_SECONDS,
+                                      labels)[0] == 1
+        assert metrics.get_counter(
+            instrumentation.ELIGIBLE_ITEMS_SCANNED,
+            (('promotion', "Beans 3 for 2"),)) == 3
+        assert metrics.get_timing(instrumentation.STAGE_SECONDS,
+                                  instrumentation.DISCOUNTS_STAGE)[0] == 1
+        assert metrics.get_timing(instrumentation.STAGE_SECONDS,
+                                  instrumentation.RENDER)[0] == 1
+
+    def test_incremental(self, products, metrics):
+        basket = Basket(products=products, promotions=PROMOTIONS,
+                        incremental=True)
+        for _ in range(3):
+            basket.add_item_from_barcode(1)
+        labels = (('promotion', "Beans 3 for 2"),)
+        assert metrics.get_timing(instrumentation.PROMOTION_SECONDS,
+                                  labels)[0] == 3
+        assert metrics.get_counter(instrumentation.DISCOUNTS, labels) == 1
+
+    def test_promotion_cache(self, products, metrics):
+        engine = PromotionEngine(PROMOTIONS, cache_size=10)
+        basket = Basket(products=products, promotions=engine)
+        basket.add_items_from_barcodes([(1, 1.0), (4, 1.0)])
+        basket.generate_invoice()
+        basket.generate_invoice()
+        assert metrics.get_counter(instrumentation.PROMOTION_CACHE_LOOKUPS,
+                                   instrumentation.CACHE_HIT) == 2
+        assert metrics.get_counter(instrumentation.PROMOTION_CACHE_LOOKUPS,
+                                   instrumentation.CACHE_MISS) == 2
+
+    def test_custom_recorder(self, products):
+        recorder = ListRecorder()
+        with instrumentation.recording(recorder):
+            Basket(products=products).add_item_from_barcode(1)
+        assert recorder.calls == [
+            ('observe', instrumentation.STAGE_SECONDS,
+             instrumentation.LOOKUP),
+            ('increment', instrumentation.SCANS, 1, ()),
+        ]
+
+    def test_to_prometheus(self):
+        metrics = Metrics(buckets=(0.001, 0.01))
+        metrics.increment(instrumentation.SCANS, 3)
+        metrics.increment(instrumentation.DISCOUNTS, 2,
+                          (('promotion', 'Say "3 for 2"'),))
+        metrics.observe(instrumentation.STAGE_SECONDS, 0.0005,
+                        instrumentation.LOOKUP)
+        metrics.observe(instrumentation.STAGE_SECONDS, 0.005,
+                        instrumentation.LOOKUP)
+        metrics.observe(instrumentation.STAGE_SECONDS, 0.5,
+                        instrumentation.LOOKUP)
+
+        text = metrics.to_prometheus()
+        assert text.endswith('\n')
+        lines = text.splitlines()
+        assert '# TYPE shoppingbasket_scans_total counter' in lines
+        assert 'shoppingbasket_scans_total 3' in lines
+        assert ('shoppingbasket_discounts_total'
+                '{promotion="Say \\"3 for 2\\""} 2') in lines
+        assert '# TYPE shoppingbasket_stage_seconds histogram' in lines
+        assert ('shoppingbasket_stage_seconds_bucket'
+                '{stage="lookup",le="0.001"} 1') in lines
+        assert ('shoppingbasket_stage_seconds_bucket'
+                '{stage="lookup",le="0.01"} 2') in lines
+        assert ('shoppingbasket_stage_seconds_bucket'
+                '{stage="lookup",le="+Inf"} 3') in lines
+        assert 'shoppingbasket_stage_seconds_count{stage="lookup"} 3' \
+            in lines
+        assert 'shoppingbasket_stage_seconds_sum{stage="lookup"} 0.5055' \
+            in lines
+
+    def test_reset(self):
+        metrics = Metrics()
+        metrics.increment(instrumentation.SCANS)
+        metrics.observe(instrumentation.STAGE_SECONDS, 0.1)
+        metrics.reset()
+        assert metrics.get_counter(instrumentation.SCANS) == 0
+        assert metrics.get_timing(instrumentation.STAGE_SECONDS) == (0, 0.0)
+        assert metrics.to_prometheus() == ''
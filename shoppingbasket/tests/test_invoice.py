@@ -20,9 +20,12 @@ class TestInvoice:
     ]
     invoice = Invoice(basket_items, promotions)
     invoice_without_promotions = Invoice(basket_items)
+    fixed_point_invoice = Invoice(basket_items, promotions, fixed_point=True)
 
     def test_get_discounts(self):
-        assert len(self.invoice.discounts) == 3
+        # Beans 3 for 2 is applied twice, as a single discount
+        assert len(self.invoice.discounts) == 2
+        assert self.invoice.discounts[0].quantity == 2
         assert len(self.invoice_without_promotions.discounts) == 0
 
     def test_subtotal(self):
@@ -37,11 +40,19 @@ class TestInvoice:
         assert self.invoice.total == 4.10
         assert self.invoice_without_promotions.total == 5.80
 
+    def test_fixed_point(self):
+        assert self.fixed_point_invoice.subtotal_pence == 580
+        assert self.fixed_point_invoice.discount_total_pence == -170
+        assert self.fixed_point_invoice.total_pence == 410
+        assert self.fixed_point_invoice.total == 4.10
+        assert self.fixed_point_invoice.to_string() == self.invoice.to_string()
+
     def test_to_string(self):
         with_promos_str = self.invoice.to_string()
         without_promos_str = self.invoice_without_promotions.to_string()
 
-        assert with_promos_str.count("Beans") == 8
+        assert with_promos_str.count("Beans") == 7
+        assert "Beans 3 for 2 x2" in with_promos_str
         assert without_promos_str.count("Beans") == 6
         assert "Savings" in with_promos_str
         assert "Savings" not in without_promos_str
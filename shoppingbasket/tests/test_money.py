@@ -0,0 +1,25 @@
+import pytest
+
+from shoppingbasket.money import from_pence, line_pence, to_pence
+
+
+class TestMoney:
+    @pytest.mark.parametrize(
+        'amount, expected_pence',
+        [(0.5, 50), (1.15, 115), (2.7, 270), (-1.95, -195), (0.125, 12)]
+    )
+    def test_to_pence(self, amount, expected_pence):
+        assert to_pence(amount) == expected_pence
+
+    @pytest.mark.parametrize(
+        'unit_price, quantity, expected_pence',
+        [(0.5, 1.0, 50), (1.99, 2.569, 511), (0.29, 0.5, 14), (0.7, 3, 210),
+         # Exact halves, which float arithmetic gets wrong
+         (0.35, 0.5, 18), (0.25, 0.5, 12), (2.675, 1.0, 268)]
+    )
+    def test_line_pence(self, unit_price, quantity, expected_pence):
+        assert line_pence(unit_price, quantity) == expected_pence
+
+    def test_from_pence(self):
+        assert from_pence(195) == 1.95
+        assert from_pence(to_pence(0.1) + to_pence(0.2)) == 0.3
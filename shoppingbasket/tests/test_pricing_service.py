@@ -0,0 +1,105 @@
+import asyncio
+import random
+
+import pytest
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.pricing_service import PricingService
+from shoppingbasket.product_snapshot import ProductSnapshot
+from shoppingbasket.promotions import MForN, MForNPounds
+
+
+PROMOTIONS = [
+    MForN("Beans 3 for 2", {1}, m=3, n=2),
+    MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+]
+
+
+@pytest.fixture(scope='module')
+def service(products):
+    with PricingService(products, PROMOTIONS, max_workers=2, chunk_size=4,
+                        fixed_point=True) as service:
+        yield service
+
+
+class TestPricingService:
+    promotions = PROMOTIONS
+
+    @staticmethod
+    def make_baskets(num_baskets: int, seed: int = 0) -> list[list]:
+        rng = random.Random(seed)
+        return [[(rng.choice([1, 2, 4, 6, 7, 8, 9]), 1.0)
+                 for _ in range(rng.randint(0, 10))]
+                for _ in range(num_baskets)]
+
+    def expected_totals(self, products, baskets):
+        totals = []
+        for scans in baskets:
+            basket = Basket(products, promotions=self.promotions)
+            basket.add_items_from_barcodes(scans)
+            totals.append(basket.generate_invoice().total_pence)
+        return totals
+
+    def test_price(self, products, service):
+        scans = [(1, 1.0), (1, 1.0), (1, 1.0), (6, 1.0)]
+        invoice = service.price(scans)
+        assert invoice.total_pence == self.expected_totals(products,
+                                                           [scans])[0]
+        assert invoice.discounts[0].name == "Beans 3 for 2"
+
+    def test_price_many(self, products, service):
+        baskets = self.make_baskets(50)
+        invoices = list(service.price_many(baskets))
+        assert [invoice.total_pence for invoice in invoices] == \
+            self.expected_totals(products, baskets)
+
+    def test_backpressure(self, service):
+        """Test that baskets are only read as invoices are returned."""
+        num_read = 0
+
+        def read_baskets():
+            nonlocal num_read
+            for scans in self.make_baskets(100):
+                num_read += 1
+                yield scans
+
+        invoices = service.price_many(read_baskets())
+        next(invoices)
+        max_read = (service.max_pending + 1) * service.chunk_size
+        assert num_read <= max_read
+        assert len(list(invoices)) == 99
+
+    def test_aprice_many(self, products, service):
+        baskets = self.make_baskets(30, seed=1)
+
+        async def read_baskets():
+            for scans in baskets:
+                yield scans
+
+        async def price():
+            single = await service.aprice(baskets[0])
+            invoices = [invoice async for invoice
+                        in service.aprice_many(read_baskets())]
+            return single, invoices
+
+        single, invoices = asyncio.run(price())
+        expected = self.expected_totals(products, baskets)
+        assert single.total_pence == expected[0]
+        assert [invoice.total_pence for invoice in invoices] == expected
+
+    def test_snapshot(self, products, tmp_path):
+        snapshot_path = str(tmp_path / 'products.snapshot')
+        ProductSnapshot.write(products.iter_products(), snapshot_path)
+        baskets = self.make_baskets(10, seed=2)
+
+        with PricingService(snapshot_path, self.promotions,
+                            max_workers=2) as service:
+            invoices = list(service.price_many(baskets))
+
+        assert [invoice.total_pence for invoice in invoices] == \
+            self.expected_totals(products, baskets)
+
+    def test_missing_barcodes(self, service):
+        with pytest.warns(UserWarning):
+            invoice = service.price([(1, 1.0), (999, 1.0)])
+        assert len(invoice.basket_items) == 1
@@ -0,0 +1,226 @@
+import asyncio
+
+import pytest
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.product_backends import (CachedBackend, CoalescingBackend,
+                                             SQLiteBackend)
+from shoppingbasket.product_db import Product, ProductBackend
+
+
+class CountingBackend(ProductBackend):
+    """A backend that counts the lookups made in it."""
+
+    def __init__(self, products: ProductBackend) -> None:
+        self.products = products
+        self.num_lookups = 0
+        self.num_bulk_lookups = 0
+
+    def get_product(self, barcode: int) -> Product:
+        self.num_lookups += 1
+        return self.products.get_product(barcode)
+
+    def get_many(self, barcodes):
+        self.num_bulk_lookups += 1
+        return self.products.get_many(barcodes)
+
+
+class SlowAsyncBackend(CountingBackend):
+    """A backend with (slow) async bulk lookups, e.g. a remote service."""
+
+    def __init__(self, products: ProductBackend) -> None:
+        super().__init__(products)
+        self.batches = []
+
+    async def aget_many(self, barcodes):
+        barcodes = list(barcodes)
+        self.batches.append(barcodes)
+        await asyncio.sleep(0.01)
+        return self.get_many(barcodes)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.time = 0.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class TestSQLiteBackend:
+    @pytest.fixture
+    def backend(self, products, tmp_path):
+        backend = SQLiteBackend.create(str(tmp_path / 'products.sqlite'),
+                                       products.iter_products())
+        yield backend
+        backend.close()
+
+    def test_get_product(self, products, backend):
+        assert len(backend) == len(products)
+        assert backend.get_product(2) == products.get_product(2)
+        assert backend[1] == products[1]
+        with pytest.raises(KeyError):
+            backend.get_product(999)
+
+    def test_table_name_quoted(self, products, tmp_path):
+        db_path = str(tmp_path / 'products.sqlite')
+        table = 'products"; DROP TABLE other; --'
+        backend = SQLiteBackend.create(db_path, products.iter_products(),
+                                       table=table)
+        assert backend.get_product(2) == products.get_product(2)
+        assert len(backend) == len(products)
+        backend.close()
+        with pytest.raises(ValueError):
+            SQLiteBackend(db_path, table='products\x00')
+
+    def test_get_many(self, products, backend):
+        barcodes = [1, 2, 999, 1]
+        assert backend.get_many(barcodes) == products.get_many(barcodes)
+        assert sorted(backend.get_many(range(2000))) == list(range(1, 10))
+
+    def test_aget(self, products, backend):
+        async def lookup():
+            return (await backend.aget(1),
+                    await backend.aget_many([1, 2, 999]))
+
+        product, found = asyncio.run(lookup())
+        assert product == products.get_product(1)
+        assert sorted(found) == [1, 2]
+
+    def test_basket(self, backend):
+        basket = Basket(products=backend)
+        basket.add_item_from_barcode(1)
+        assert basket.basket_items[0].name == 'Beans'
+
+
+class TestCachedBackend:
+    def test_get_product(self, products):
+        backend = CountingBackend(products)
+        cache = CachedBackend(backend)
+        for _ in range(3):
+            assert cache.get_product(1) == products.get_product(1)
+        assert backend.num_lookups == 1
+        assert cache.stats.hits == 2
+        assert cache.stats.misses == 1
+        assert cache.stats.hit_rate == pytest.approx(2 / 3)
+
+    def test_missing(self, products):
+        cache = CachedBackend(products)
+        with pytest.raises(KeyError):
+            cache.get_product(999)
+        assert 999 not in cache
+
+    def test_lru_eviction(self, products):
+        backend = CountingBackend(products)
+        cache = CachedBackend(backend, maxsize=2)
+        cache.get_product(1)
+        cache.get_product(2)
+        cache.get_product(1)  # 2 is now least recently used
+        cache.get_product(3)
+        assert cache.num_cached == 2
+        assert cache.stats.evictions == 1
+
+        cache.get_product(1)
+        assert backend.num_lookups == 3
+        cache.get_product(2)
+        assert backend.num_lookups == 4
+
+    def test_ttl(self, products):
+        clock = FakeClock()
+        backend = CountingBackend(products)
+        cache = CachedBackend(backend, ttl=10, clock=clock)
+        cache.get_product(1)
+        clock.time = 10
+        cache.get_product(1)
+        assert backend.num_lookups == 1
+        clock.time = 10.5
+        cache.get_product(1)
+        assert backend.num_lookups == 2
+        assert cache.stats.expirations == 1
+
+    def test_get_many(self, products):
+        backend = CountingBackend(products)
+        cache = CachedBackend(backend)
+        cache.get_product(1)
+        found = cache.get_many([1, 2, 3, 2, 999])
+        assert sorted(found) == [1, 2, 3]
+        assert backend.num_bulk_lookups == 1
+        assert cache.stats.hits == 1
+
+        cache.get_many([1, 2, 3])
+        assert backend.num_bulk_lookups == 1
+
+    def test_invalidate(self, products):
+        cache = CachedBackend(products)
+        cache.get_many([1, 2])
+        cache.invalidate(1)
+        assert cache.num_cached == 1
+        cache.invalidate()
+        assert cache.num_cached == 0
+        assert len(cache) == len(products)
+
+    def test_aget_many(self, products):
+        backend = SlowAsyncBackend(products)
+        cache = CachedBackend(backend)
+
+        async def lookup():
+            await cache.aget(1)
+            return await cache.aget_many([1, 2, 999])
+
+        found = asyncio.run(lookup())
+        assert sorted(found) == [1, 2]
+        assert backend.batches == [[2, 999]]
+        assert cache.stats.hits == 1
+
+
+class TestCoalescingBackend:
+    def test_coalesce(self, products):
+        backend = SlowAsyncBackend(products)
+        coalescing = CoalescingBackend(backend)
+
+        async def lookup():
+            return await asyncio.gather(
+                coalescing.aget(1), coalescing.aget(2), coalescing.aget(1),
+                coalescing.aget_many([2, 4, 999]))
+
+        product_1, product_2, product_1_again, found = asyncio.run(lookup())
+
+        # All the lookups were sent together, with each barcode once
+        assert backend.batches == [[1, 2, 4, 999]]
+        assert product_1 is product_1_again
+        assert product_2 == products.get_product(2)
+        assert sorted(found) == [2, 4]
+        assert coalescing.num_lookups == 6
+        assert coalescing.num_batches == 1
+
+    def test_missing(self, products):
+        coalescing = CoalescingBackend(SlowAsyncBackend(products))
+        with pytest.raises(KeyError):
+            asyncio.run(coalescing.aget(999))
+
+    def test_batch_size(self, products):
+        backend = SlowAsyncBackend(products)
+        coalescing = CoalescingBackend(backend, max_batch_size=2,
+                                       max_pending_batches=1)
+
+        async def lookup():
+            return await coalescing.aget_many([1, 2, 3, 4, 5])
+
+        assert len(asyncio.run(lookup())) == 5
+        assert backend.batches == [[1, 2], [3, 4], [5]]
+
+    def test_errors(self, products):
+        class FailingBackend(SlowAsyncBackend):
+            async def aget_many(self, barcodes):
+                raise ConnectionError()
+
+        coalescing = CoalescingBackend(FailingBackend(products))
+        with pytest.raises(ConnectionError):
+            asyncio.run(coalescing.aget(1))
+        # Failed lookups are not kept
+        assert not coalescing._futures
+
+    def test_sync_lookups(self, products):
+        coalescing = CoalescingBackend(products)
+        assert coalescing.get_product(1) == products.get_product(1)
+        assert coalescing[1] == products[1]
@@ -1,13 +1,175 @@
-from shoppingbasket.product_db import ProductDB
+import pytest
+
+from shoppingbasket.product_db import Product, ProductDB
 
 
 class TestProductDB:
+    expected_products = {
+        1: {'barcode': 1, 'name': 'Beans', 'unit_price': 0.50},
+        2: {'barcode': 2, 'name': 'Onions', 'unit_price': 0.29,
+            'units': 'kg'},
+    }
+
     def test_from_yaml(self):
         db_path = 'shoppingbasket/tests/data/products.yaml'
         product_db = ProductDB.from_yaml(db_path)
-        expected_products = {
-            1: {'barcode': 1, 'name': 'Beans', 'unit_price': 0.50},
-            2: {'barcode': 2, 'name': 'Onions', 'unit_price': 0.29, 'units': 'kg'},
-        }
-        assert product_db._products[1] == expected_products[1]
-        assert product_db._products[2] == expected_products[2]
+        assert product_db[1] == self.expected_products[1]
+        assert product_db[2] == self.expected_products[2]
+        assert len(product_db) == 9
+
+    def test_from_yaml_multiple_documents(self, tmp_path):
+        db_path = tmp_path / 'products.yaml'
+        db_path.write_text(
+            "- barcode: 1\n"
+            "  name: Beans\n"
+            "  unit_price: 0.50\n"
+            "---\n"
+            "barcode: 2\n"
+            "name: Onions\n"
+            "unit_price: 0.29\n"
+            "units: kg\n"
+            "---\n"
+        )
+        product_db = ProductDB.from_yaml(str(db_path))
+        assert product_db[1] == self.expected_products[1]
+        assert product_db[2] == self.expected_products[2]
+        assert len(product_db) == 2
+
+    def test_from_csv(self, tmp_path):
+        db_path = tmp_path / 'products.csv'
+        db_path.write_text(
+            "barcode,name,unit_price,units\n"
+            "1,Beans,0.50,\n"
+            "2,Onions,0.29,kg\n"
+        )
+        product_db = ProductDB.from_csv(str(db_path))
+        assert product_db[1] == self.expected_products[1]
+        assert product_db[2] == self.expected_products[2]
+
+    def test_from_jsonl(self, tmp_path):
+        db_path = tmp_path / 'products.jsonl'
+        db_path.write_text(
+            '{"barcode": 1, "name": "Beans", "unit_price": 0.50}\n'
+            '\n'
+            '{"barcode": 2, "name": "Onions", "unit_price": 0.29, '
+            '"units": "kg"}\n'
+        )
+        product_db = ProductDB.from_jsonl(str(db_path))
+        assert product_db[1] == self.expected_products[1]
+        assert product_db[2] == self.expected_products[2]
+
+    def test_get_product(self, products):
+        assert products.get_product(2) == Product(2, 'Onions', 0.29, 'kg')
+        assert 2 in products
+        assert 999 not in products
+        with pytest.raises(KeyError):
+            products.get_product(999)
+
+    def test_product_as_dict(self, products):
+        """Test that indexing gives a dictionary of BasketItem arguments."""
+        assert products[1] == {'barcode': 1, 'name': 'Beans',
+                               'unit_price': 0.50}
+        assert products[2] == products.get_product(2).to_dict()
+        assert 'units' in products[2]
+        assert list(products[2].items()) == [('barcode', 2),
+                                             ('name', 'Onions'),
+                                             ('unit_price', 0.29),
+                                             ('units', 'kg')]
+        products[2]['name'] = 'Red onions'
+        assert products.get_product(2).name == 'Onions'
+        with pytest.raises(KeyError):
+            products[999]
+
+    def test_extra_keys(self):
+        with pytest.warns(UserWarning, match='category'):
+            product_db = ProductDB([{'barcode': 1, 'name': 'Beans',
+                                     'unit_price': 0.50,
+                                     'category': 'Tins'}])
+        assert product_db[1] == self.expected_products[1]
+
+    def test_strings_interned(self):
+        product_db = ProductDB([
+            {'barcode': 1, 'name': 'Bananas', 'unit_price': 0.11,
+             'units': ''.join(['k', 'g'])},
+            {'barcode': 2, 'name': 'Onions', 'unit_price': 0.29,
+             'units': ''.join(['k', 'g'])},
+        ])
+        units = [product_db.get_product(barcode).units for barcode in (1, 2)]
+        assert units[0] is units[1]
+
+
+class TestProductDBUpdates:
+    @staticmethod
+    def make_product_db(num_products: int = 100) -> ProductDB:
+        return ProductDB(Product(barcode, f"Product {barcode}", 1.0)
+                         for barcode in range(num_products))
+
+    def test_upsert(self):
+        product_db = self.make_product_db()
+        assert product_db.upsert(Product(1, 'Product 1', 2.0)) == 1
+        assert product_db.upsert({'barcode': 100, 'name': 'New',
+                                  'unit_price': 3.0}) == 2
+        assert product_db.get_product(1).unit_price == 2.0
+        assert product_db[100]['name'] == 'New'
+        assert len(product_db) == 101
+
+    def test_delete(self):
+        product_db = self.make_product_db()
+        product_db.delete(5)
+        assert 5 not in product_db
+        assert len(product_db) == 99
+        with pytest.raises(KeyError):
+            product_db.get_product(5)
+        with pytest.raises(KeyError):
+            product_db.delete(5)
+
+    def test_view_is_consistent(self):
+        product_db = self.make_product_db()
+        view = product_db.view()
+        product_db.apply_updates(upserts=[Product(1, 'Product 1', 2.0)],
+                                 deletes=[2])
+
+        assert view.version == 0
+        assert view.get_product(1).unit_price == 1.0
+        assert 2 in view
+        assert product_db.version == 1
+        assert product_db.get_product(1).unit_price == 2.0
+        assert 2 not in product_db
+
+        with pytest.raises(ValueError):
+            view.upsert(Product(1, 'Product 1', 3.0))
+
+    def test_many_updates(self):
+        """Test that layers are merged without changing the products."""
+        product_db = self.make_product_db()
+        expected = {product.barcode: product
+                    for product in product_db.iter_products()}
+        views = []
+        for i in range(200):
+            barcode = (i * 7) % 150
+            if i % 5 == 0:
+                product_db.apply_updates(deletes=[barcode])
+                expected.pop(barcode, None)
+            else:
+                product = Product(barcode, f"Product {barcode}", i / 10)
+                product_db.upsert(product)
+                expected[barcode] = product
+            views.append((product_db.view(), dict(expected)))
+
+            assert len(product_db._layers) <= 8
+
+        for view, view_expected in views:
+            assert len(view) == len(view_expected)
+            assert {product.barcode: product
+                    for product in view.iter_products()} == view_expected
+
+    def test_apply_delta_file(self, tmp_path):
+        product_db = self.make_product_db()
+        delta_path = tmp_path / 'delta.jsonl'
+        delta_path.write_text(
+            '{"barcode": 1, "name": "Product 1", "unit_price": 0.5}\n'
+            '{"barcode": 2, "deleted": true}\n'
+        )
+        assert product_db.apply_delta_file(str(delta_path)) == 1
+        assert product_db.get_product(1).unit_price == 0.5
+        assert 2 not in product_db
@@ -0,0 +1,100 @@
+import os
+import sys
+
+import pytest
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.product_db import Product, ProductDB
+from shoppingbasket.product_snapshot import ProductSnapshot
+
+
+class TestProductSnapshot:
+    @pytest.fixture
+    def snapshot(self, products, tmp_path):
+        snapshot_path = str(tmp_path / 'products.snapshot')
+        products.to_snapshot(snapshot_path)
+        with ProductSnapshot.open(snapshot_path) as snapshot:
+            yield snapshot
+
+    def test_lookup(self, products, snapshot):
+        assert len(snapshot) == len(products)
+        for product in products.iter_products():
+            assert snapshot.get_product(product.barcode) == product
+            assert snapshot[product.barcode] == products[product.barcode]
+
+    def test_missing(self, snapshot):
+        assert 999 not in snapshot
+        assert 'beans' not in snapshot
+        with pytest.raises(KeyError):
+            snapshot.get_product(999)
+
+    def test_iter_products(self, products, snapshot):
+        barcodes = [product.barcode for product in snapshot.iter_products()]
+        assert barcodes == sorted(product.barcode
+                                  for product in products.iter_products())
+
+    def test_unicode_and_shared_strings(self, tmp_path):
+        snapshot_path = str(tmp_path / 'products.snapshot')
+        product_db = ProductDB([
+            Product(30, 'Crème fraîche', 1.2),
+            Product(10, 'Bananas', 0.11, 'kg'),
+            Product(20, 'Bananas', 0.21, 'kg'),
+        ])
+        product_db.to_snapshot(snapshot_path)
+        with ProductSnapshot.open(snapshot_path) as snapshot:
+            assert snapshot.get_product(30).name == 'Crème fraîche'
+            assert snapshot.get_product(20) == Product(20, 'Bananas', 0.21,
+                                                       'kg')
+
+    def test_rewrite_while_open(self, products, tmp_path):
+        """Test that rewriting a snapshot doesn't change an open one."""
+        snapshot_path = str(tmp_path / 'products.snapshot')
+        products.to_snapshot(snapshot_path)
+        with ProductSnapshot.open(snapshot_path) as snapshot:
+            ProductDB([Product(1, 'Beans', 0.55)]).to_snapshot(snapshot_path)
+            assert len(snapshot) == len(products)
+            assert snapshot.get_product(1) == products.get_product(1)
+        with ProductSnapshot.open(snapshot_path) as snapshot:
+            assert snapshot.get_product(1).unit_price == 0.55
+        assert os.listdir(tmp_path) == ['products.snapshot']
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            ProductSnapshot(b'not a snapshot' * 4)
+
+    def test_truncated(self, products, tmp_path):
+        data = ProductSnapshot.encode(products.iter_products())
+        strings_offset = int.from_bytes(data[32:40], sys.byteorder)
+        with pytest.raises(ValueError, match='truncated'):
+            ProductSnapshot(data[:100])
+        snapshot_path = tmp_path / 'products.snapshot'
+        snapshot_path.write_bytes(data[:100])
+        with pytest.raises(ValueError, match='truncated'):
+            ProductSnapshot.open(str(snapshot_path))
+
+        # Records that point past the end of the strings
+        snapshot = ProductSnapshot(data[:strings_offset])
+        with pytest.raises(ValueError, match='out of bounds'):
+            list(snapshot.iter_products())
+
+    def test_invalid_header(self, products):
+        data = bytearray(ProductSnapshot.encode(products.iter_products()))
+        data[16:24] = (10 ** 6).to_bytes(8, sys.byteorder)  # Product count
+        with pytest.raises(ValueError, match='invalid header'):
+            ProductSnapshot(bytes(data))
+
+    def test_write_fails(self, products, tmp_path, monkeypatch):
+        def fail(fd):
+            raise OSError("Disk full")
+
+        monkeypatch.setattr(os, 'fsync', fail)
+        snapshot_path = str(tmp_path / 'products.snapshot')
+        with pytest.raises(OSError):
+            products.to_snapshot(snapshot_path)
+        assert os.listdir(tmp_path) == []
+
+    def test_basket(self, snapshot):
+        basket = Basket(products=snapshot)
+        basket.add_item_from_barcode(1)
+        basket.add_item_from_barcode(2, quantity=0.5)
+        assert basket.generate_invoice().subtotal == 0.64
@@ -0,0 +1,115 @@
+import dataclasses
+import pickle
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.basket_item import BasketItem
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotions import MForN, MForNPounds
+
+
+class TestPromotionEngine:
+    promotions = [
+        MForN("Beans 3 for 2", {1}, m=3, n=2),
+        MForNPounds("Coke 2 for £1", {4}, m=2, n=1.0),
+        MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+        MForN("Ale 2 for 1", {6}, m=2, n=1),
+    ]
+    engine = PromotionEngine(promotions)
+
+    def test_get_promotion_indices(self):
+        assert self.engine.get_promotion_indices(6) == (2, 3)
+        assert self.engine.get_promotion_indices(5) == ()
+
+    def test_get_eligible_items(self, products):
+        basket_barcodes = [1, 5, 6, 1, 7]
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in basket_barcodes]
+
+        eligible_items = self.engine.get_eligible_items(basket_items)
+
+        # Coke promotion has no eligible items, so is skipped
+        assert sorted(eligible_items) == [0, 2, 3]
+        assert len(eligible_items[0]) == 2
+        assert len(eligible_items[2]) == 2
+
+    def test_get_discounts(self, products):
+        """Test that the discounts match applying every promotion in turn."""
+        basket_barcodes = [1, 4, 6, 1, 7, 4, 8, 1, 5, 6, 4, 1, 9]
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in basket_barcodes]
+
+        expected_discounts = [
+            discount
+            for promotion in self.promotions
+            for discount in promotion.get_discounts(basket_items)
+        ]
+
+        assert list(self.engine.get_discounts(basket_items)) == \
+            expected_discounts
+
+    def test_cache(self, products):
+        engine = PromotionEngine(self.promotions, cache_size=100)
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in [1, 4, 6, 1, 7, 4, 8, 1]]
+
+        expected = list(self.engine.get_discounts(basket_items))
+        assert list(engine.get_discounts(basket_items)) == expected
+        assert engine.cache_stats.misses == 4
+        # The same items in any order reuse every result
+        reordered = basket_items[::-1]
+        assert sorted(engine.get_discounts(reordered), key=repr) == \
+            sorted(expected, key=repr)
+        assert engine.cache_stats.hits == 4
+        assert engine.cache_stats.hit_rate == 0.5
+
+    def test_cache_signature(self, products):
+        engine = PromotionEngine(self.promotions, cache_size=100)
+        beans = BasketItem(**products[1])
+        expected = list(engine.get_discounts([beans] * 3))
+        # The item name doesn't affect discounts, so isn't in the signature
+        renamed = dataclasses.replace(beans, name='Baked beans')
+        assert list(engine.get_discounts([renamed] * 3)) == expected
+        assert engine.cache_stats.hits == engine.cache_stats.misses
+        assert PromotionEngine.get_signature([beans, renamed]) == \
+            frozenset({((1, beans.unit_price, None, 1.0), 2)})
+
+    def test_cache_price_change(self, products):
+        engine = PromotionEngine(self.promotions, cache_size=100)
+        beans = BasketItem(**products[1])
+        engine_discounts = list(engine.get_discounts([beans] * 3))
+        cheaper_beans = dataclasses.replace(beans, unit_price=0.4)
+        discounts = list(engine.get_discounts([cheaper_beans] * 3))
+        assert discounts != engine_discounts
+        assert discounts == list(self.engine.get_discounts(
+            [cheaper_beans] * 3))
+        assert engine.cache_stats.hits == 0
+
+        engine.clear_cache()
+        list(engine.get_discounts([beans] * 3))
+        assert engine.cache_stats.misses == 3
+
+    def test_cache_eviction(self, products):
+        engine = PromotionEngine(self.promotions, cache_size=2)
+        for quantity in range(1, 5):
+            list(engine.get_discounts([BasketItem(**products[1],
+                                                  quantity=quantity)]))
+        assert engine.cache_stats.evictions == 2
+
+    def test_cache_running_total(self, products):
+        engine = PromotionEngine(self.promotions, cache_size=100)
+        for _ in range(2):
+            basket = Basket(products, promotions=engine, incremental=True)
+            basket.add_items_from_barcodes([(1, 1.0)] * 4 + [(4, 1.0)] * 2)
+            assert basket.running_total.total_pence == \
+                basket.generate_invoice().total_pence
+        # Everything after the first basket's scans is a hit
+        assert engine.cache_stats.misses == 6
+
+    def test_pickle(self, products):
+        engine = PromotionEngine(self.promotions, cache_size=100)
+        basket_items = [BasketItem(**products[1])] * 3
+        list(engine.get_discounts(basket_items))
+        copy = pickle.loads(pickle.dumps(engine))
+        assert copy.cache_stats.misses == 0
+        assert list(copy.get_discounts(basket_items)) == \
+            list(engine.get_discounts(basket_items))
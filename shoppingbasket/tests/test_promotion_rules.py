@@ -0,0 +1,182 @@
+import json
+import os
+import pickle
+import warnings
+
+import pytest
+
+from shoppingbasket import Invoice
+from shoppingbasket.basket import Basket
+from shoppingbasket.product_db import ProductDB
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotion_rules import compile_promotions, load_promotions
+from shoppingbasket.promotions import (CheapestFree, MForN, MForNPounds,
+                                       SpendXGetYOff, TieredQuantity)
+
+RULES_PATH = 'shoppingbasket/tests/data/promotions.yaml'
+
+RULES = [
+    {'type': 'MForN', 'name': "Beans 3 for 2", 'eligible_barcodes': [1],
+     'm': 3, 'n': 2},
+    {'type': 'MForNPounds', 'name': "3 ales for £6",
+     'eligible_barcodes': [6, 7, 8, 9], 'm': 3, 'n': 6.0},
+]
+
+
+class TestPromotionRules:
+    def test_load_yaml(self, products):
+        engine = load_promotions(RULES_PATH, products)
+        assert isinstance(engine, PromotionEngine)
+        assert engine.promotions == [
+            MForN("Beans 3 for 2", {1}, m=3, n=2),
+            MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+        ]
+        assert isinstance(engine.promotions[1].eligible_barcodes, frozenset)
+        assert engine.get_promotion_indices(7) == (1,)
+
+    def test_load_json(self, products, tmp_path):
+        path = str(tmp_path / 'promotions.json')
+        with open(path, 'w') as f:
+            json.dump(RULES, f)
+        assert load_promotions(path, products).promotions == \
+            load_promotions(RULES_PATH, products).promotions
+
+    def test_invoice(self, products):
+        basket = Basket(products=products)
+        basket.add_items_from_barcodes([(1, 1.0)] * 3 + [(6, 1.0)] * 3)
+        engine = load_promotions(RULES_PATH, products)
+        promotions = [
+            MForN("Beans 3 for 2", {1}, m=3, n=2),
+            MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+        ]
+        assert Invoice(basket.basket_items, engine).discounts == \
+            Invoice(basket.basket_items, promotions).discounts
+
+    def test_promotion_types(self, products, tmp_path):
+        path = str(tmp_path / 'promotions.json')
+        with open(path, 'w') as f:
+            json.dump([
+                {'type': 'CheapestFree', 'name': "Ales", 'm': 3,
+                 'eligible_barcodes': [6, 7, 8, 9]},
+                {'type': 'TieredQuantity', 'name': "Tiers",
+                 'eligible_barcodes': [6, 7], 'tiers': {'2': 10, '5': 20}},
+                {'type': 'SpendXGetYOff', 'name': "Spend", 'x': 10.0,
+                 'y': 2.0, 'eligible_barcodes': [6, 7, 8, 9]},
+            ], f)
+        assert load_promotions(path, products).promotions == [
+            CheapestFree("Ales", {6, 7, 8, 9}, m=3),
+            TieredQuantity("Tiers", {6, 7}, tiers={2: 10.0, 5: 20.0}),
+            SpendXGetYOff("Spend", {6, 7, 8, 9}, x=10.0, y=2.0),
+        ]
+
+    @pytest.mark.parametrize('rule, message', [
+        ({'type': 'CheapestFree', 'name': "X", 'eligible_barcodes': [1],
+          'm': 3, 'free': 3}, "free between 1 and m - 1"),
+        ({'type': 'TieredQuantity', 'name': "X", 'eligible_barcodes': [1],
+          'tiers': {}}, "no tiers"),
+        ({'type': 'TieredQuantity', 'name': "X", 'eligible_barcodes': [1],
+          'tiers': {2: 110}}, "percent off"),
+        ({'type': 'TieredQuantity', 'name': "X", 'eligible_barcodes': [1],
+          'tiers': [2, 10]}, "invalid"),
+        ({'type': 'SpendXGetYOff', 'name': "X", 'eligible_barcodes': [1],
+          'x': 5.0, 'y': 6.0}, "y between 0 and x"),
+        ({'type': 'BOGOF', 'name': "X", 'eligible_barcodes': [1]},
+         "unknown type"),
+        ({'type': 'MForN', 'name': "X", 'eligible_barcodes': [1],
+          'colour': 'red'}, "unknown fields"),
+        ({'type': 'MForN', 'name': "X"}, "no eligible_barcodes"),
+        ({'type': 'MForN', 'eligible_barcodes': [1]}, "invalid"),
+        ({'type': 'MForN', 'name': "X", 'eligible_barcodes': ['one']},
+         "invalid"),
+        ({'type': 'MForN', 'name': "X", 'eligible_barcodes': [1], 'm': 0},
+         "m of at least 1"),
+        ({'type': 'MForN', 'name': "X", 'eligible_barcodes': [1], 'm': 2,
+          'n': 2}, "n less than m"),
+        ({'type': 'MForNPounds', 'name': "X", 'eligible_barcodes': [1],
+          'n': -1.0}, "n of at least 0"),
+        (['MForN'], "not a mapping"),
+    ])
+    def test_invalid(self, products, rule, message):
+        with pytest.raises(ValueError, match=message):
+            compile_promotions([rule], products)
+
+    def test_missing_barcodes(self, products):
+        rule = {'type': 'MForN', 'name': "X", 'eligible_barcodes': [1, 999]}
+        with pytest.raises(ValueError, match=r"\[999\]"):
+            compile_promotions([rule], products)
+
+        with pytest.warns(UserWarning, match=r"\[999\]"):
+            engine = compile_promotions([rule], products, strict=False)
+        assert engine.promotions[0].eligible_barcodes == {1, 999}
+
+    def test_never_saves_money(self, products):
+        rule = {'type': 'MForNPounds', 'name': "2 beans for £2",
+                'eligible_barcodes': [1], 'm': 2, 'n': 2.0}
+        with pytest.warns(UserWarning, match="never gives a discount"):
+            compile_promotions([rule], products)
+
+        # Weighed items could cost more
+        rule['eligible_barcodes'] = [1, 2]
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            compile_promotions([rule], products)
+
+    def test_cache(self, products, tmp_path, monkeypatch):
+        rules_path = str(tmp_path / 'promotions.yaml')
+        cache_path = str(tmp_path / 'promotions.cache')
+        with open(rules_path, 'w') as f:
+            json.dump(RULES, f)  # JSON is also YAML
+
+        engine = load_promotions(rules_path, products, cache_path)
+        assert os.path.exists(cache_path)
+
+        # Loaded from the cache, without compiling
+        def fail(*args, **kwargs):
+            raise AssertionError("Compiled")
+
+        import shoppingbasket.promotion_rules as promotion_rules
+        with monkeypatch.context() as m:
+            m.setattr(promotion_rules, 'compile_promotions', fail)
+            cached = load_promotions(rules_path, products, cache_path)
+        assert cached.promotions == engine.promotions
+
+        # Recompiled when the prices change
+        updated = ProductDB(products.iter_products())
+        updated.upsert({'barcode': 6, 'name': "CSE Finest Ale",
+                        'unit_price': 2.80})
+        with monkeypatch.context() as m:
+            m.setattr(promotion_rules, 'compile_promotions', fail)
+            with pytest.raises(AssertionError):
+                load_promotions(rules_path, updated, cache_path)
+            # Other products don't matter
+            other = ProductDB(products.iter_products())
+            other.upsert({'barcode': 4, 'name': "Coke", 'unit_price': 0.80})
+            load_promotions(rules_path, other, cache_path)
+
+        # Recompiled when the rules change
+        with open(rules_path, 'w') as f:
+            json.dump(RULES[:1], f)
+        assert len(load_promotions(rules_path, products, cache_path)) == 1
+
+    def test_cache_write_fails(self, products, tmp_path, monkeypatch):
+        cache_path = str(tmp_path / 'promotions.cache')
+
+        def fail(*args, **kwargs):
+            raise pickle.PicklingError("Can't pickle")
+
+        monkeypatch.setattr(pickle, 'dump', fail)
+        with pytest.raises(pickle.PicklingError):
+            load_promotions(RULES_PATH, products, cache_path)
+        assert os.listdir(tmp_path) == []
+
+    def test_corrupt_cache(self, products, tmp_path):
+        cache_path = str(tmp_path / 'promotions.cache')
+        with open(cache_path, 'wb') as f:
+            f.write(b'not a pickle')
+        engine = load_promotions(RULES_PATH, products, cache_path)
+        assert len(engine) == 2
+
+    def test_empty(self, tmp_path):
+        path = str(tmp_path / 'promotions.yaml')
+        open(path, 'w').close()
+        assert len(load_promotions(path, ProductDB([]))) == 0
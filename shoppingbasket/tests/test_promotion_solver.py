@@ -0,0 +1,188 @@
+import itertools
+import random
+from collections import Counter
+from typing import Iterator
+
+import pytest
+
+from shoppingbasket.basket_item import BasketItem, Discount
+from shoppingbasket.money import to_pence
+from shoppingbasket.promotion_engine import PromotionEngine
+from shoppingbasket.promotion_solver import (OptimalPromotionEngine,
+                                             SolverStats)
+from shoppingbasket.promotions import MForN, MForNPounds, Promotion
+
+
+class HalfPriceBananas(Promotion):
+    """A promotion the solver doesn't assign units to."""
+
+    def get_discounts(self, basket_items: list[BasketItem]
+                      ) -> Iterator[Discount]:
+        for item in self.list_eligible_items(basket_items):
+            yield Discount(self.name, item.line_price / 2)
+
+
+def get_best_saving(basket_items, promotions):
+    """Find the largest saving (in pence) by trying every assignment."""
+    units = [item for item in basket_items
+             if any(item.barcode in promotion.eligible_barcodes
+                    for promotion in promotions)]
+    options = [[None] + [promotion for promotion in promotions
+                         if item.barcode in promotion.eligible_barcodes]
+               for item in units]
+
+    best = 0
+    for assignment in itertools.product(*options):
+        saving = 0
+        for promotion in promotions:
+            assigned = [item for item, assigned_promotion
+                        in zip(units, assignment)
+                        if assigned_promotion is promotion]
+            saving -= sum(discount.line_price_pence for discount
+                          in promotion.get_discounts(assigned))
+        best = max(best, saving)
+    return best
+
+
+class TestOptimalPromotionEngine:
+    promotions = [
+        MForN("Beans 3 for 2", {1}, m=3, n=2),
+        MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+        MForN("Ale 2 for 1", {6}, m=2, n=1),
+        MForNPounds("Coke 2 for £1", {4}, m=2, n=1.0),
+    ]
+
+    def test_each_unit_used_once(self, products):
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in [6, 6, 7]]
+        engine = OptimalPromotionEngine(self.promotions)
+
+        discounts = list(engine.get_discounts(basket_items))
+
+        # Two ales for the price of one saves more than three ales for £6
+        assert [discount.name for discount in discounts] == ["Ale 2 for 1"]
+        assert sum(discount.line_price_pence for discount in discounts) == \
+            -to_pence(products[6]['unit_price'])
+
+    def test_not_worse_than_applying_in_turn(self, products):
+        """Test that the saving is at least that of a single promotion."""
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in [6, 6, 6, 7, 8, 1, 1, 1, 4, 4]]
+        engine = OptimalPromotionEngine(self.promotions)
+
+        saving = -sum(discount.line_price_pence
+                      for discount in engine.get_discounts(basket_items))
+
+        for promotion in self.promotions:
+            single_saving = -sum(
+                discount.line_price_pence
+                for discount in PromotionEngine([promotion])
+                .get_discounts(basket_items))
+            assert saving >= single_saving
+
+    @pytest.mark.parametrize('seed', range(20))
+    def test_matches_brute_force(self, products, seed):
+        rng = random.Random(seed)
+        barcodes = rng.choices([1, 4, 6, 7, 8, 9], k=rng.randint(1, 8))
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in barcodes]
+        engine = OptimalPromotionEngine(self.promotions)
+
+        saving = -sum(discount.line_price_pence
+                      for discount in engine.get_discounts(basket_items))
+
+        assert saving == get_best_saving(basket_items, self.promotions)
+        assert engine.stats.fallbacks == 0
+
+    @pytest.mark.parametrize('seed', range(10))
+    def test_weighed_items_match_brute_force(self, products, seed):
+        """Test products with more than one unit price (weighed items)."""
+        rng = random.Random(seed)
+        promotions = [MForN("Onions 2 for 1", {2}, m=2, n=1),
+                      MForNPounds("Veg 3 for £1", {2, 5}, m=3, n=1.0)]
+        basket_items = [
+            BasketItem(**products[rng.choice([2, 5])],
+                       quantity=rng.choice([0.25, 0.5, 1.0, 1.5]))
+            for _ in range(rng.randint(1, 7))
+        ]
+        engine = OptimalPromotionEngine(promotions)
+
+        saving = -sum(discount.line_price_pence
+                      for discount in engine.get_discounts(basket_items))
+
+        assert saving == get_best_saving(basket_items, promotions)
+
+    def test_large_basket(self, products):
+        promotions = self.promotions + [
+            MForNPounds("Any 4 for £3", {1, 4, 6, 7}, m=4, n=3.0)]
+        basket_items = [BasketItem(**products[barcode], quantity=quantity)
+                        for barcode, quantity
+                        in [(1, 600), (4, 301), (6, 250), (7, 99)]]
+        engine = OptimalPromotionEngine(promotions, time_budget=60)
+
+        list(engine.get_discounts(basket_items))
+
+        assert engine.stats == SolverStats(optimal=1, fallbacks=0)
+
+    def test_many_distinct_products(self):
+        """Test that thousands of linked products are solved."""
+        basket_items = [BasketItem(f"Product {barcode}", 2.0, barcode=barcode)
+                        for barcode in range(3000)]
+        promotions = [MForNPounds("Any 3 for £3", set(range(3000)), m=3,
+                                  n=3.0)]
+        engine = OptimalPromotionEngine(promotions, time_budget=60)
+
+        discounts = list(engine.get_discounts(basket_items))
+
+        assert engine.stats == SolverStats(optimal=1, fallbacks=0)
+        assert sum(discount.line_price_pence for discount in discounts) == \
+            -300000
+
+    def test_large_quantity_within_budget(self, products):
+        """Test that building the knapsack of a huge line is budgeted."""
+        promotions = self.promotions + [
+            MForNPounds("Beans 2 for 50p", {1}, m=2, n=0.5)]
+        basket_items = [BasketItem(**products[1], quantity=3_000_000)]
+        engine = OptimalPromotionEngine(promotions, time_budget=0.05)
+
+        discounts = list(engine.get_discounts(basket_items))
+
+        assert engine.stats == SolverStats(optimal=0, fallbacks=1)
+        assert discounts[0].quantity == 1_000_000
+
+    def test_aggregated_lines(self, products):
+        basket_items = [BasketItem(**products[1], quantity=600),
+                        BasketItem(**products[6], quantity=5),
+                        BasketItem(**products[7], quantity=1)]
+        engine = OptimalPromotionEngine(self.promotions)
+
+        discounts = list(engine.get_discounts(basket_items))
+
+        assert [(discount.name, discount.quantity)
+                for discount in discounts] == \
+            [("Beans 3 for 2", 200), ("Ale 2 for 1", 2)]
+
+    def test_greedy_fallback(self, products):
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in [6, 6, 6, 7, 8, 8, 1, 1, 1]]
+        engine = OptimalPromotionEngine(self.promotions, time_budget=-1)
+
+        discounts = list(engine.get_discounts(basket_items))
+
+        assert engine.stats.fallbacks > 0
+        # Promotions are applied in turn, to the units not yet used
+        assert Counter(discount.name for discount in discounts) == \
+            Counter({"Beans 3 for 2": 1, "3 ales for £6": 2})
+
+    def test_other_promotions(self, products):
+        """Test that other promotions are applied as in PromotionEngine."""
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in [3, 6, 6, 3]]
+        promotions = self.promotions + [
+            HalfPriceBananas("Half price bananas", {3, 6})]
+        engine = OptimalPromotionEngine(promotions)
+
+        discounts = list(engine.get_discounts(basket_items))
+
+        assert [discount.name for discount in discounts] == \
+            ["Ale 2 for 1"] + ["Half price bananas"] * 4
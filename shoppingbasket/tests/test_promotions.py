@@ -1,5 +1,33 @@
+import random
+
+import pytest
+
 from shoppingbasket.basket_item import BasketItem
-from shoppingbasket.promotions import MForNPounds
+from shoppingbasket.promotions import (CheapestFree, MForN, MForNPounds,
+                                       SpendXGetYOff, TieredQuantity)
+
+
+class TestMForN:
+    promotion = MForN("Beans 3 for 2", {1}, m=3, n=2)
+
+    def test_one_discount_per_barcode(self, products):
+        basket_items = [BasketItem(**products[1])] * 600
+
+        discounts = list(self.promotion.get_discounts(basket_items))
+
+        assert len(discounts) == 1
+        assert discounts[0].quantity == 200
+        assert discounts[0].line_price == -100.0
+
+    def test_aggregated_lines(self, products):
+        """Test that lines with quantities are counted by unit."""
+        basket_items = [BasketItem(**products[1], quantity=4),
+                        BasketItem(**products[1]),
+                        BasketItem(**products[1], quantity=2)]
+
+        discounts = list(self.promotion.get_discounts(basket_items))
+
+        assert [(d.line_price, d.quantity) for d in discounts] == [(-1.0, 2)]
 
 
 class TestMForNPoundsSingle:
@@ -14,9 +42,11 @@ class TestMForNPoundsSingle:
                         for barcode in basket_barcodes]
 
         discounts = self.promotion.get_discounts(basket_items)
-        discount_amounts = [discount.line_price for discount in discounts]
+        discount_amounts = [(discount.line_price, discount.quantity)
+                            for discount in discounts]
 
-        assert discount_amounts == [-0.40, -0.40]
+        # Identical discounts are combined into one, with a quantity
+        assert discount_amounts == [(-0.80, 2)]
 
     def test_exact_multiple(self, products):
         """Test that the discount is calculated correctly when the number of
@@ -26,9 +56,21 @@ class TestMForNPoundsSingle:
                         for barcode in basket_barcodes]
 
         discounts = self.promotion.get_discounts(basket_items)
-        discount_amounts = [discount.line_price for discount in discounts]
+        discount_amounts = [(discount.line_price, discount.quantity)
+                            for discount in discounts]
 
-        assert discount_amounts == [-0.40, -0.40, -0.40]
+        assert discount_amounts == [(-1.20, 3)]
+
+    def test_aggregated_lines(self, products):
+        """Test that a line with a quantity counts as that many items."""
+        basket_items = [BasketItem(**products[4], quantity=5),
+                        BasketItem(**products[1], quantity=2)]
+
+        discounts = self.promotion.get_discounts(basket_items)
+        discount_amounts = [(discount.line_price, discount.quantity)
+                            for discount in discounts]
+
+        assert discount_amounts == [(-0.80, 2)]
 
 
 class TestMForNPoundsGroup:
@@ -92,3 +134,120 @@ class TestMForNPoundsGroup:
         discount_amounts = [discount.line_price for discount in discounts]
 
         assert discount_amounts == []
+
+
+class TestCheapestFree:
+    barcodes = {6, 7, 8, 9}  # Ales
+    promotion = CheapestFree("3 ales, cheapest free", barcodes, m=3)
+
+    def test_cheapest_in_each_group(self, products):
+        """Test that the cheapest item in each group of m is free."""
+        basket_barcodes = [3, 7, 1, 6, 1, 8, 8, 9, 6, 7]
+        basket_items = [BasketItem(**products[barcode])
+                        for barcode in basket_barcodes]
+
+        # sorted eligible prices (desc):
+        # [2.70, 2.70, 2.55, 2.55, 2.10, 2.10, 1.10, 1.10]
+        # groups: [2.70, 2.70, 2.55], [2.55, 2.10, 2.10], [1.10, 1.10]
+        discounts = self.promotion.get_discounts(basket_items)
+        discount_amounts = [(discount.line_price, discount.quantity)
+                            for discount in discounts]
+
+        assert discount_amounts == [(-2.55, 1), (-2.10, 1)]
+
+    def test_aggregated_lines(self, products):
+        """Test that the free units are counted without expanding lines."""
+        basket_items = [BasketItem(**products[6], quantity=5),
+                        BasketItem(**products[9], quantity=1000)]
+
+        discounts = list(self.promotion.get_discounts(basket_items))
+
+        # 1005 units in 335 groups: one with 2 ales and a 1.10, then 334
+        # groups of 1.10
+        assert [(d.unit_price, d.quantity) for d in discounts] == \
+            [(2.70, 1), (1.10, 334)]
+
+    @pytest.mark.parametrize('m, free', [(2, 1), (3, 1), (4, 2), (5, 3)])
+    def test_matches_expanded_units(self, products, m, free):
+        """Test that the discounts match splitting every unit into groups."""
+        promotion = CheapestFree("Free", self.barcodes, m=m, free=free)
+        rng = random.Random(m)
+        for _ in range(50):
+            basket_items = [BasketItem(**products[rng.choice([6, 7, 8, 9])],
+                                       quantity=rng.randint(1, 4))
+                            for _ in range(rng.randint(0, 8))]
+
+            prices = sorted((item.unit_line_price_pence
+                             for item in basket_items
+                             for _ in range(item.unit_count)), reverse=True)
+            expected = sum(sum(prices[i + m - free:i + m])
+                           for i in range(0, len(prices) - m + 1, m))
+
+            discounts = promotion.get_discounts(basket_items)
+            assert -sum(d.line_price_pence for d in discounts) == expected
+
+
+class TestTieredQuantity:
+    barcodes = {6, 7, 8, 9}  # Ales
+    promotion = TieredQuantity("Ale tiers", barcodes, tiers={2: 10, 5: 20})
+
+    def test_tiers(self, products):
+        def get_discount(basket_barcodes):
+            basket_items = [BasketItem(**products[barcode])
+                            for barcode in basket_barcodes]
+            return [(d.line_price, d.quantity)
+                    for d in self.promotion.get_discounts(basket_items)]
+
+        assert get_discount([6, 1]) == []
+        # 10% of 2.70 + 2.55
+        assert get_discount([6, 1, 7]) == [(-0.52, 1)]
+        # 20% of 2.70 + 2.55 + 3 * 2.10
+        assert get_discount([6, 7, 8, 8, 8]) == [(-2.31, 1)]
+
+    def test_aggregated_lines(self, products):
+        basket_items = [BasketItem(**products[9], quantity=4),
+                        BasketItem(**products[1], quantity=10)]
+        discounts = list(self.promotion.get_discounts(basket_items))
+        # 10% of 4 * 1.10
+        assert [d.line_price for d in discounts] == [-0.44]
+
+
+class TestSpendXGetYOff:
+    barcodes = {6, 7, 8, 9}  # Ales
+    promotion = SpendXGetYOff("Spend £5 on ale, get £1 off", barcodes,
+                              x=5.0, y=1.0)
+
+    def test_threshold(self, products):
+        basket_items = [BasketItem(**products[6]),
+                        BasketItem(**products[7])]
+        discounts = list(self.promotion.get_discounts(basket_items))
+        assert [(d.line_price, d.quantity) for d in discounts] == \
+            [(-1.0, 1)]
+
+        discounts = list(self.promotion.get_discounts(basket_items[:1]))
+        assert discounts == []
+
+    def test_repeat(self, products):
+        promotion = SpendXGetYOff("Repeat", self.barcodes, x=5.0, y=1.0,
+                                  repeat=True)
+        basket_items = [BasketItem(**products[6], quantity=8)]  # £21.60
+
+        discounts = list(promotion.get_discounts(basket_items))
+        assert [(d.line_price, d.quantity) for d in discounts] == \
+            [(-4.0, 4)]
+
+        discounts = list(self.promotion.get_discounts(basket_items))
+        assert [d.quantity for d in discounts] == [1]
+
+    def test_discount_rounded(self, products):
+        promotion = SpendXGetYOff("Rounded", self.barcodes, x=5.0,
+                                  y=1.004999)
+        basket_items = [BasketItem(**products[6], quantity=2)]
+        discounts = list(promotion.get_discounts(basket_items))
+        assert [d.unit_price for d in discounts] == [1.0]
+
+    @pytest.mark.parametrize('x, y', [(5.0, 0.0), (5.0, -1.0), (5.0, 6.0),
+                                      (0.0, 0.0), (5.0, 0.001)])
+    def test_invalid(self, x, y):
+        with pytest.raises(ValueError, match='y between 0 and x'):
+            SpendXGetYOff("Invalid", self.barcodes, x=x, y=y)
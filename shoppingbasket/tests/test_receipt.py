@@ -0,0 +1,78 @@
+import io
+
+import pytest
+
+from shoppingbasket import BasketItem, Invoice
+from shoppingbasket.promotions import MForN, MForNPounds
+from shoppingbasket.receipt import (EscPosFormatter, ReceiptFormatter,
+                                    _draw_table)
+
+
+def draw_with_texttable(invoice: Invoice, max_width: int = 80) -> str:
+    return _draw_table(ReceiptFormatter.header, invoice.get_rows(),
+                       max_width)
+
+
+class TestReceiptFormatter:
+    basket_items = [
+        BasketItem("Beans", 0.65, barcode=1, quantity=4),
+        BasketItem("Coke", 0.70, barcode=5),
+        BasketItem("Coke", 0.70, barcode=5),
+        BasketItem("Carrots", 1.00, barcode=2, units="kg", quantity=0.5),
+        BasketItem("A very long product name that needs wrapping on narrow "
+                   "receipts", 12.5),
+    ]
+    promotions = [
+        MForN("Beans 3 for 2", {1}, m=3, n=2),
+        MForNPounds("Coke 2 for £1", {5}, m=2, n=1.0),
+    ]
+    invoice = Invoice(basket_items, promotions)
+
+    @pytest.mark.parametrize('max_width', [80, 48, 42, 32, 20])
+    def test_matches_texttable(self, max_width):
+        formatter = ReceiptFormatter(max_width)
+        assert formatter.format(self.invoice) == \
+            draw_with_texttable(self.invoice, max_width)
+
+    def test_matches_texttable_without_promotions(self):
+        invoice = Invoice(self.basket_items[:3])
+        assert ReceiptFormatter().format(invoice) == \
+            draw_with_texttable(invoice)
+
+    @pytest.mark.parametrize('name', ["Crème fraîche", "寿司", "Tab\tbed",
+                                      "1.5", "Trailing space "])
+    def test_unusual_text(self, name):
+        """Test text that is left to Texttable (or wrapped like it)."""
+        invoice = Invoice([BasketItem(name, 1.0), BasketItem("Beans", 0.65)])
+        assert ReceiptFormatter(30).format(invoice) == \
+            draw_with_texttable(invoice, 30)
+
+    def test_write(self):
+        stream = io.StringIO()
+        ReceiptFormatter().write(self.invoice, stream)
+        assert stream.getvalue() == self.invoice.to_string() + '\n'
+
+    def test_to_string_cached(self):
+        invoice = Invoice(self.basket_items, self.promotions)
+        assert invoice.to_string() is invoice.to_string()
+
+
+class TestEscPosFormatter:
+    invoice = TestReceiptFormatter.invoice
+
+    def test_to_bytes(self):
+        formatter = EscPosFormatter(max_width=42)
+        receipt = formatter.to_bytes(self.invoice)
+
+        text = ReceiptFormatter(42).format(self.invoice) + '\n'
+        assert receipt.startswith(b'\x1b@\x1bt\x13')
+        assert receipt.endswith(b'\x1bd\x03\x1dV\x00')
+        assert text.encode('cp858') in receipt
+        assert '£'.encode('cp858') == b'\x9c'
+
+    def test_write(self):
+        formatter = EscPosFormatter(feed_lines=0, cut=False)
+        stream = io.BytesIO()
+        formatter.write(self.invoice, stream)
+        assert stream.getvalue() == formatter.to_bytes(self.invoice)
+        assert stream.getvalue().endswith(b'\n')
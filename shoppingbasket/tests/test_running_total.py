@@ -0,0 +1,93 @@
+import pytest
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.promotion_solver import OptimalPromotionEngine
+from shoppingbasket.promotions import MForN, MForNPounds
+
+
+class TestRunningTotal:
+    promotions = [
+        MForN("Beans 3 for 2", {1}, m=3, n=2),
+        MForNPounds("Coke 2 for £1", {4}, m=2, n=1.0),
+        MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+    ]
+    basket_barcodes = [1, 4, 6, 1, 7, 4, 8, 1, 5, 6, 4, 1, 9]
+
+    def test_matches_invoice_after_each_scan(self, products):
+        basket = Basket(products=products,
+                        promotions=self.promotions,
+                        incremental=True)
+        for barcode in self.basket_barcodes:
+            basket.add_item_from_barcode(barcode)
+            invoice = basket.generate_invoice()
+            running_total = basket.running_total
+            assert running_total.subtotal == pytest.approx(invoice.subtotal)
+            assert running_total.discount_total == invoice.discount_total
+            assert running_total.total == pytest.approx(invoice.total)
+
+    def test_remove_item(self, products):
+        basket = Basket(products=products,
+                        promotions=self.promotions,
+                        incremental=True)
+        for barcode in self.basket_barcodes:
+            basket.add_item_from_barcode(barcode)
+
+        while basket.basket_items:
+            basket.remove_item(basket.basket_items[0])
+            invoice = basket.generate_invoice()
+            running_total = basket.running_total
+            assert running_total.subtotal == pytest.approx(invoice.subtotal)
+            assert running_total.discount_total == invoice.discount_total
+
+        assert basket.running_total.total == 0.0
+        assert len(basket.running_total.barcode_counts) == 0
+        assert list(basket.running_total.discounts) == []
+
+    def test_barcode_counts(self, products):
+        basket = Basket(products=products, incremental=True)
+        for barcode in self.basket_barcodes:
+            basket.add_item_from_barcode(barcode)
+        assert basket.running_total.barcode_counts[1] == 4
+        assert basket.running_total.barcode_counts[4] == 3
+
+    def test_barcode_counts_aggregate(self, products):
+        """Test that units are counted, rather than lines."""
+        basket = Basket(products=products, incremental=True, aggregate=True)
+        basket.add_items_from_barcodes([(1, 1.0)] * 4 + [(2, 1.5)])
+        basket.void(1)
+        assert basket.running_total.barcode_counts == {1: 3, 2: 1}
+
+    def test_existing_items(self, products):
+        basket = Basket(products=products)
+        for barcode in self.basket_barcodes:
+            basket.add_item_from_barcode(barcode)
+
+        incremental_basket = Basket(basket_items=basket.basket_items,
+                                    promotions=self.promotions,
+                                    incremental=True)
+        invoice = basket.generate_invoice(promotions=self.promotions)
+        assert incremental_basket.running_total.total == pytest.approx(
+            invoice.total)
+
+    def test_overlapping_promotions(self, products):
+        """Test a running total with promotions solved jointly."""
+        engine = OptimalPromotionEngine([
+            MForN("Ale 3 for 2", {6}, 3, 2),
+            MForNPounds("3 ales for £6", {6, 7, 8, 9}, 3, 6.0),
+            MForN("Beans 3 for 2", {1}, 3, 2),
+        ])
+        basket = Basket(products=products, promotions=engine,
+                        incremental=True)
+        for barcode in [6, 6, 6, 7, 8, 1, 1, 1, 9]:
+            basket.add_item_from_barcode(barcode)
+            assert basket.running_total.total_pence == \
+                basket.generate_invoice().total_pence
+        while basket.basket_items:
+            basket.remove_item(basket.basket_items[0])
+            assert basket.running_total.total_pence == \
+                basket.generate_invoice().total_pence
+
+    def test_not_incremental(self):
+        basket = Basket()
+        basket.add_item("Beans", 0.65)
+        assert basket.running_total is None
@@ -0,0 +1,99 @@
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from shoppingbasket.basket import Basket
+from shoppingbasket.product_db import Product, ProductDB
+from shoppingbasket.promotions import MForN, MForNPounds
+from shoppingbasket.shared_catalogue import CataloguePublisher, SharedCatalogue
+
+PROMOTIONS = [
+    MForN("Beans 3 for 2", {1}, m=3, n=2),
+    MForNPounds("3 ales for £6", {6, 7, 8, 9}, m=3, n=6.0),
+]
+
+SCANS = [(1, 1.0), (1, 1.0), (1, 1.0), (6, 1.0), (7, 1.0), (8, 1.0),
+         (2, 0.5)]
+
+
+def price_in_worker(name):
+    with SharedCatalogue(name) as catalogue:
+        basket = Basket(catalogue.products, promotions=catalogue.promotions)
+        basket.add_items_from_barcodes(SCANS)
+        return basket.generate_invoice().total_pence
+
+
+@pytest.fixture
+def publisher():
+    with CataloguePublisher(f'sb_{uuid.uuid4().hex[:12]}') as publisher:
+        yield publisher
+
+
+class TestSharedCatalogue:
+    def expected_total(self, products):
+        basket = Basket(products, promotions=PROMOTIONS)
+        basket.add_items_from_barcodes(SCANS)
+        return basket.generate_invoice().total_pence
+
+    def test_lookup(self, products, publisher):
+        publisher.publish(products.iter_products(), PROMOTIONS)
+        with SharedCatalogue(publisher.name) as catalogue:
+            assert catalogue.generation == 1
+            assert len(catalogue.products) == len(products)
+            for product in products.iter_products():
+                assert catalogue.products.get_product(product.barcode) == \
+                    product
+
+    def test_promotions(self, products, publisher):
+        publisher.publish(products.iter_products(), PROMOTIONS)
+        with SharedCatalogue(publisher.name) as catalogue:
+            ales = catalogue.promotions.promotions[1]
+            assert ales.name == "3 ales for £6"
+            assert 7 in ales.eligible_barcodes
+            assert 1 not in ales.eligible_barcodes
+            assert ales.eligible_barcodes == {6, 7, 8, 9}
+            assert catalogue.promotions.get_promotion_indices(1) == (0,)
+            assert catalogue.promotions.get_promotion_indices(None) == ()
+
+            basket = Basket(catalogue.products,
+                            promotions=catalogue.promotions,
+                            incremental=True)
+            basket.add_items_from_barcodes(SCANS)
+            assert basket.generate_invoice().total_pence == \
+                self.expected_total(products)
+            assert basket.running_total.total_pence == \
+                self.expected_total(products)
+
+    def test_other_process(self, products, publisher):
+        publisher.publish(products.iter_products(), PROMOTIONS)
+        with ProcessPoolExecutor(2) as executor:
+            totals = list(executor.map(price_in_worker, [publisher.name] * 2))
+        assert totals == [self.expected_total(products)] * 2
+
+    def test_new_generation(self, products, publisher):
+        publisher.publish(products.iter_products())
+        with SharedCatalogue(publisher.name) as catalogue:
+            assert catalogue.promotions is None
+            assert not catalogue.refresh()
+
+            new_products = ProductDB(products.iter_products())
+            new_products.upsert(Product(1, 'Beans', 0.55))
+            assert publisher.publish(new_products.iter_products(),
+                                     PROMOTIONS) == 2
+            # The old generation is still usable until refreshing
+            assert catalogue.products.get_product(1).unit_price == 0.5
+            assert catalogue.get_latest_generation() == 2
+
+            assert catalogue.refresh()
+            assert catalogue.generation == 2
+            assert catalogue.products.get_product(1).unit_price == 0.55
+            assert len(catalogue.promotions) == 2
+
+    def test_nothing_published(self, publisher):
+        with pytest.raises(ValueError):
+            SharedCatalogue(publisher.name)
+
+    def test_missing(self):
+        with pytest.raises(FileNotFoundError):
+            SharedCatalogue(f'sb_{uuid.uuid4().hex[:12]}')
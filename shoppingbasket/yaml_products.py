@@ -0,0 +1,80 @@
+from typing import Any, Iterator, TextIO
+
+import yaml
+
+# Use the (much faster) LibYAML parser, if PyYAML was built with it
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def iter_yaml_products(stream: TextIO) -> Iterator[dict]:
+    """Read products from a YAML stream one at a time.
+
+    The parser's events are composed into a node for one product at a time
+    (instead of composing the whole document), and then constructed.
+    """
+
+    loader = _YamlLoader(stream)
+    try:
+        loader.get_event()  # Stream start
+        while not loader.check_event(yaml.StreamEndEvent):
+            loader.get_event()  # Document start
+            anchors = {}
+            if loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield _construct_next(loader, anchors)
+                loader.get_event()
+            else:
+                product = _construct_next(loader, anchors)
+                if product is not None:  # Empty document
+                    yield product
+            loader.get_event()  # Document end
+    finally:
+        loader.dispose()
+
+
+def _construct_next(loader: yaml.SafeLoader, anchors: dict) -> Any:
+    """Construct the next YAML node from the loader's events."""
+    return loader.construct_document(_compose_next(loader, anchors))
+
+
+def _compose_next(loader: yaml.SafeLoader, anchors: dict) -> yaml.Node:
+    """Compose the next YAML node from the loader's events.
+
+    This does the same as PyYAML's Composer, which isn't available on the
+    LibYAML loaders.
+    """
+
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        return anchors[event.anchor]
+
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], flow_style=event.flow_style)
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose_next(loader, anchors))
+        loader.get_event()
+    elif isinstance(event, yaml.MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], flow_style=event.flow_style)
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _compose_next(loader, anchors)
+            value = _compose_next(loader, anchors)
+            node.value.append((key, value))
+        loader.get_event()
+    else:
+        raise ValueError(f"Unexpected YAML event: {event}")
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node